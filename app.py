@@ -1,7 +1,36 @@
+import importlib
+import inspect
+import os
+import time
+
 import streamlit as st
-from components.chatbot import render_chatbot
-from components.code_assistant import render_code_assistant
-from components.text_generator import render_text_generator
+import utils.env  # Loads .env before any module below reads its settings
+from utils.async_client import get_resilience_stats
+from utils.hedging import get_hedger
+from utils.history import get_history_memory
+from utils.metrics import get_metrics, start_metrics_dump
+from utils.model_router import get_router
+from utils.openai_client import get_cache_stats, get_health, start_health_monitor
+from utils.startup import get_startup_timings, record_startup_timing
+
+_run_started = time.perf_counter()
+
+# Show the admin metrics panel; it exposes process-wide usage, so it is off unless the deployment enables it
+ADMIN_PANEL = os.getenv("ADMIN_PANEL", "0") == "1"
+
+# Number of largest session histories listed in the admin panel
+ADMIN_TOP_SESSIONS = 20
+
+# Streamlit releases with stateful tabs (key/on_change and tab.open) render only the open tab;
+# older ones (the pinned 1.45.1) render and import every tab on each run
+LAZY_TABS = "on_change" in inspect.signature(st.tabs).parameters
+
+# Tab label, component module and render function; a module is imported when its tab is first opened
+TABS = [
+    ("💬 Chatbot", "components.chatbot", "render_chatbot"),
+    ("👨‍💻 Code Assistant", "components.code_assistant", "render_code_assistant"),
+    ("✍️ Text Generator", "components.text_generator", "render_text_generator"),
+]
 
 # Configure page
 st.set_page_config(
@@ -10,16 +39,142 @@ st.set_page_config(
     layout="wide"
 )
 
+# Warm the shared client and model cache in the background (once per process)
+start_health_monitor()
+# Write Prometheus metrics to METRICS_FILE periodically, if set
+start_metrics_dump()
+
 # Initialize session state
 if "api_key_valid" not in st.session_state:
     st.session_state.api_key_valid = False
 
+def _format_seconds(value):
+    return f"{value:.2f}s" if value is not None else "–"
+
+def _render_tab(module_name, function_name):
+    """
+    Import a tab's component module on first use and render the tab.
+    """
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    record_startup_timing(f"import {module_name}", time.perf_counter() - started)
+    getattr(module, function_name)()
+
+def render_admin_panel():
+    """
+    Process-wide latency, token, error and cache metrics for SLOs and capacity planning.
+    """
+    with st.sidebar.expander("📊 Metrics"):
+        rows = get_metrics().summary()
+        if rows:
+            st.dataframe(
+                [
+                    {
+                        "Tab": row["tab"],
+                        "Type": row["type"] or "–",
+                        "Model": row["model"],
+                        "Requests": row["requests"],
+                        "Errors": row["errors"],
+                        "Cache hits": row["cache_hits"],
+                        "Retries": row["retries"],
+                        "p50": _format_seconds(row.get("latency_p50")),
+                        "p95": _format_seconds(row.get("latency_p95")),
+                        "TTFT p50": _format_seconds(row.get("ttft_p50")),
+                        "TTFT p95": _format_seconds(row.get("ttft_p95")),
+                        "Prompt tokens": row["prompt_tokens"],
+                        "Output tokens": row["output_tokens"],
+                    }
+                    for row in rows
+                ],
+                hide_index=True,
+            )
+        else:
+            st.caption("No calls recorded yet.")
+
+        resilience = get_resilience_stats()
+        st.caption(
+            f"Upstream: {resilience['calls']} calls · {resilience['retries']} retries · "
+            f"{resilience['rejected']} rejected · {resilience['queued']} queued · circuit {resilience['circuit']}"
+        )
+        hedging = get_hedger().stats()
+        if hedging["enabled"]:
+            st.caption(
+                f"Hedging: {hedging['hedged']} hedges for {hedging['eligible']} calls · {hedging['won']} won · "
+                f"{hedging['denied']} over budget · ~{hedging['saved_seconds']:.1f}s saved"
+            )
+        routing = get_router().stats()
+        if routing["models"]:
+            st.markdown("**Model routing**")
+            st.dataframe(
+                [
+                    {
+                        "Model": name,
+                        "Calls": model["calls"],
+                        "Failures": model["failures"],
+                        "Avg TTFT": _format_seconds(model["ttft"]),
+                        "Avg total": _format_seconds(model["total"]),
+                        "Cooldown": _format_seconds(model["cooldown"]) if model["cooldown"] else "–",
+                        "Circuit": resilience["circuits"].get(name, "closed"),
+                    }
+                    for name, model in sorted(routing["models"].items())
+                ],
+                hide_index=True,
+            )
+            if routing["decisions"]:
+                st.dataframe(routing["decisions"], hide_index=True)
+            if routing["fallbacks"]:
+                st.dataframe(routing["fallbacks"], hide_index=True)
+        memory = get_history_memory()
+        if memory["sessions"]:
+            st.markdown("**History memory**")
+            st.caption(
+                f"{len(memory['sessions'])} session histories · {memory['entries']} entries · "
+                f"{memory['total_bytes'] / 1024:.0f} KiB"
+            )
+            st.dataframe(
+                [
+                    {
+                        "Session": row["session"],
+                        "Tab": row["kind"],
+                        "Entries": row["entries"],
+                        "Compressed": row["compressed"],
+                        "KiB": round(row["bytes"] / 1024, 1),
+                    }
+                    for row in memory["sessions"][:ADMIN_TOP_SESSIONS]
+                ],
+                hide_index=True,
+            )
+        startup = get_startup_timings()
+        if startup:
+            st.markdown("**Startup**")
+            st.dataframe(
+                [
+                    {"Step": t["step"], "Took": _format_seconds(t["seconds"]), "After start": _format_seconds(t["at"])}
+                    for t in startup
+                ],
+                hide_index=True,
+            )
+        st.download_button(
+            "Download Prometheus metrics",
+            get_metrics().render_prometheus(),
+            file_name="metrics.prom",
+            mime="text/plain",
+        )
+
 def main():
     st.title("🤖 AI Assistant Hub")
     st.markdown("Your comprehensive AI-powered assistant for conversations, coding, and content creation.")
     
-    # API Key validation
+    # API Key validation (uses the process-wide health state, no probe call per session)
     if not st.session_state.api_key_valid:
+        health = get_health()
+        if health["ok"]:
+            st.session_state.api_key_valid = True
+            st.rerun()
+        elif health["ok"] is None:
+            st.info("⏳ Connecting to the AI service...")
+        elif health["error"]:
+            st.error(f"❌ {health['error']}")
         st.warning("⚠️ Please ensure your OpenAI API key is configured in the environment variables.")
         if st.button("Test API Connection"):
             from utils.openai_client import test_api_connection
@@ -28,20 +183,32 @@ def main():
                 st.success("✅ API connection successful!")
                 st.rerun()
             else:
-                st.error("❌ API connection failed. Please check your API key.")
+                st.error(f"❌ API connection failed: {get_health()['error']}")
+                st.error("Please check if your API key is valid and has not expired.")
         return
     
-    # Create tabs for different functionalities
-    tab1, tab2, tab3 = st.tabs(["💬 Chatbot", "👨‍💻 Code Assistant", "✍️ Text Generator"])
+    # Create tabs for different functionalities; with lazy tabs only the open tab runs (and is imported)
+    labels = [label for label, _, _ in TABS]
+    tabs = st.tabs(labels, key="main_tab", on_change="rerun") if LAZY_TABS else st.tabs(labels)
+    for tab, (_, module_name, function_name) in zip(tabs, TABS):
+        if not LAZY_TABS or tab.open:
+            with tab:
+                _render_tab(module_name, function_name)
     
-    with tab1:
-        render_chatbot()
-    
-    with tab2:
-        render_code_assistant()
-    
-    with tab3:
-        render_text_generator()
+    # Shared response cache counters (process-wide)
+    cache_stats = get_cache_stats()
+    st.sidebar.markdown("---")
+    st.sidebar.caption(
+        f"Response cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits · "
+        f"{cache_stats['misses']} misses · {cache_stats['bypassed']} bypassed "
+        f"({cache_stats['hit_rate']:.0%} hit rate) · "
+        f"{cache_stats['semantic']['hits']} near-duplicate hits · "
+        f"{cache_stats['coalesced']['followers']} coalesced"
+    )
+
+    if ADMIN_PANEL:
+        render_admin_panel()
 
 if __name__ == "__main__":
     main()
+    record_startup_timing("first page run", time.perf_counter() - _run_started)
@@ -0,0 +1,130 @@
+"""
+Command-line entry point for scripting the chat, code and text helpers.
+
+Examples:
+    python cli.py chat "What is a closure?"
+    python cli.py code "Why does this crash?" --context-file app.py --type debug --language Python
+    echo "Write a haiku about tea" | python cli.py text - --type creative
+    python cli.py text "Write a comprehensive guide to Git" --type technical --long-form
+    python cli.py serve --port 8000
+"""
+import argparse
+import sys
+
+import utils.env  # Loads .env before any module below reads its settings
+from utils.openai_client import (
+    CHAT_SYSTEM_PROMPT,
+    GeminiError,
+    stream_chat_response,
+    stream_code_assistance,
+    stream_long_text,
+    stream_text,
+)
+from utils.prompts import enhance_text_prompt
+
+def _read_arg(value):
+    return sys.stdin.read() if value == "-" else value
+
+def _print_stream(chunks):
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        sys.stdout.write(chunk)
+        sys.stdout.flush()
+    sys.stdout.write("\n")
+    return "".join(parts)
+
+def _run_chat(args):
+    messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}]
+    if args.message:
+        messages.append({"role": "user", "content": _read_arg(args.message)})
+        _print_stream(stream_chat_response(messages, args.max_tokens, args.temperature))
+        return
+
+    # Interactive session; the conversation is kept for the lifetime of the process
+    while True:
+        try:
+            user_input = input("> ")
+        except EOFError:
+            return
+        if not user_input.strip():
+            continue
+        messages.append({"role": "user", "content": user_input})
+        response = _print_stream(stream_chat_response(messages, args.max_tokens, args.temperature))
+        messages.append({"role": "assistant", "content": response})
+
+def _run_code(args):
+    context = ""
+    if args.context_file:
+        with open(args.context_file, encoding="utf-8") as f:
+            context = f.read()
+    _print_stream(stream_code_assistance(
+        code_query=_read_arg(args.query),
+        code_context=context,
+        assistance_type=args.type,
+        language=args.language,
+    ))
+
+def _run_text(args):
+    user_request = {"prompt": _read_arg(args.prompt), "context": args.context, "audience": args.audience, "tone": args.tone}
+    prompt = enhance_text_prompt(user_request["prompt"], args.type, args.context, args.audience, args.tone)
+    if args.long_form:
+        _print_stream(stream_long_text(prompt, args.type, args.max_tokens, args.temperature, stop_sequences=args.stop))
+        return
+    _print_stream(stream_text(prompt, args.type, args.max_tokens, args.temperature, stop_sequences=args.stop,
+                              user_request=user_request))
+
+def _run_serve(args):
+    from server import serve
+    serve(args.host, args.port)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="AI Assistant Hub command-line interface")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    chat = subparsers.add_parser("chat", help="Chat with the assistant (interactive without a message)")
+    chat.add_argument("message", nargs="?", help="Message to send, or - to read from stdin")
+    chat.add_argument("--max-tokens", type=int, default=1000)
+    chat.add_argument("--temperature", type=float, default=0.7)
+    chat.set_defaults(func=_run_chat)
+
+    code = subparsers.add_parser("code", help="Get code assistance")
+    code.add_argument("query", help="Code question, or - to read from stdin")
+    code.add_argument("--context-file", help="File containing the code context")
+    code.add_argument("--type", choices=["general", "debug", "review", "explain"], default="general")
+    code.add_argument("--language", default="")
+    code.set_defaults(func=_run_code)
+
+    text = subparsers.add_parser("text", help="Generate text")
+    text.add_argument("prompt", help="Generation prompt, or - to read from stdin")
+    text.add_argument("--type", choices=["general", "creative", "formal", "technical"], default="general")
+    text.add_argument("--context", default="")
+    text.add_argument("--audience", default="")
+    text.add_argument("--tone", default="")
+    text.add_argument("--max-tokens", type=int, default=1000)
+    text.add_argument("--temperature", type=float, default=0.7)
+    text.add_argument("--stop", action="append", help="Stop sequence (repeatable; defaults depend on --type)")
+    text.add_argument("--long-form", action="store_true",
+                      help="Generate an outline, then write its sections in parallel (--max-tokens per section)")
+    text.set_defaults(func=_run_text)
+
+    serve = subparsers.add_parser("serve", help="Run the headless HTTP API")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.set_defaults(func=_run_serve)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except (GeminiError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,97 @@
+import os
 import streamlit as st
-from utils.openai_client import get_chat_response
+from components.session import get_conversation_id, take_stopped, write_stream_stoppable
+from utils.chat_context import (
+    CHAT_CONTEXT_TOKEN_BUDGET,
+    build_chat_context,
+    index_message,
+    message_tokens,
+    new_chat_index,
+    new_summary_state,
+)
+from utils.openai_client import CHAT_SYSTEM_PROMPT, GeminiError, stream_chat_response
+from utils.storage import get_conversation_store
+
+# Number of most recent chat messages kept in session memory; older ones stay in the store
+CHAT_SESSION_WINDOW = int(os.getenv("CHAT_SESSION_WINDOW", "50"))
+# Number of messages rendered initially and added by each "Load earlier messages" click
+CHAT_RENDER_WINDOW = int(os.getenv("CHAT_RENDER_WINDOW", "20"))
+# Number of most recent stored messages indexed for recall when a conversation is reopened
+CHAT_INDEX_LOAD = int(os.getenv("CHAT_INDEX_LOAD", "200"))
+
+def _load_chat_session(store, conversation_id):
+    """
+    Load the recent messages and rolling summary of a stored conversation.
+
+    The recall index is built on the first message sent (see _chat_index()).
+    """
+    st.session_state.chatbot_messages = [
+        dict(payload, seq=seq) for seq, payload in store.page(conversation_id, "chat", limit=CHAT_SESSION_WINDOW)
+    ]
+    start = store.history_start(conversation_id, "chat")
+    st.session_state.chatbot_summary = store.get_state(conversation_id, "chat_summary") or new_summary_state(start)
+    stats = store.get_state(conversation_id, "chat_stats")
+    if stats is None:
+        # Conversations stored before stats were tracked: count them once
+        stats = {"messages": 0, "tokens": 0}
+        for _, payload in store.range(conversation_id, "chat", start, start + store.count(conversation_id, "chat")):
+            stats["messages"] += 1
+            stats["tokens"] += payload.get("tokens") or 0
+    st.session_state.chatbot_stats = stats
+    st.session_state.chatbot_render_limit = CHAT_RENDER_WINDOW
+    st.session_state.chatbot_index = None
+
+def _chat_index(store, conversation_id):
+    """
+    Get the recall index of the conversation, building it from the newest
+    CHAT_INDEX_LOAD stored messages on first use. Messages appended after
+    that are indexed as they arrive.
+    """
+    if st.session_state.chatbot_index is None:
+        index = new_chat_index()
+        for seq, payload in store.page(conversation_id, "chat", limit=CHAT_INDEX_LOAD):
+            index_message(index, dict(payload, seq=seq))
+        st.session_state.chatbot_index = index
+    return st.session_state.chatbot_index
+
+def _append_message(store, conversation_id, message):
+    """
+    Persist a message, add it to the session window, index it for later recall
+    and update the conversation stats incrementally.
+    """
+    if message.get("tokens") is None:
+        try:
+            message_tokens(message)
+        except GeminiError:
+            # Counted later when the context is built
+            pass
+    message["seq"] = store.append(conversation_id, "chat", {k: v for k, v in message.items() if k != "seq"})
+    st.session_state.chatbot_messages.append(message)
+    del st.session_state.chatbot_messages[:-CHAT_SESSION_WINDOW]
+    if st.session_state.chatbot_index is not None:
+        index_message(st.session_state.chatbot_index, message)
+    
+    stats = st.session_state.chatbot_stats
+    stats["messages"] += 1
+    stats["tokens"] += message.get("tokens") or 0
+    store.set_state(conversation_id, "chat_stats", stats)
+
+def _visible_messages(store, conversation_id):
+    """
+    Get the messages to render: the newest chatbot_render_limit messages, loading
+    any that are older than the session window from the store on demand.
+    """
+    messages = st.session_state.chatbot_messages
+    limit = st.session_state.chatbot_render_limit
+    if limit <= len(messages):
+        return messages[-limit:] if limit else []
+    if not messages:
+        return messages
+    earlier = [
+        dict(payload, seq=seq)
+        for seq, payload in store.page(conversation_id, "chat", before=messages[0]["seq"], limit=limit - len(messages))
+    ]
+    return earlier + messages
 
 def render_chatbot():
     """
@@ -8,9 +100,16 @@ def render_chatbot():
     st.header("💬 AI Chatbot")
     st.markdown("Have a natural conversation with the AI assistant. Ask questions, get advice, or just chat!")
     
-    # Initialize chat history
+    # Initialize chat history from the persistent store (resumes across reloads)
+    store = get_conversation_store()
+    conversation_id = get_conversation_id()
     if "chatbot_messages" not in st.session_state:
-        st.session_state.chatbot_messages = []
+        _load_chat_session(store, conversation_id)
+    
+    # Keep the partial reply of a generation stopped in the previous run
+    stopped = take_stopped("chatbot_stopped")
+    if stopped and stopped["text"]:
+        _append_message(store, conversation_id, {"role": "assistant", "content": stopped["text"], "stopped": True})
     
     # Chat configuration sidebar
     with st.sidebar:
@@ -29,24 +128,42 @@ def render_chatbot():
             max_value=2000,
             value=1000,
             step=100,
-            help="Maximum number of tokens in the response"
+            help="Hard cap on the number of tokens in the response"
+        )
+        context_budget = st.number_input(
+            "Context Budget (tokens)",
+            min_value=1000,
+            max_value=32000,
+            value=CHAT_CONTEXT_TOKEN_BUDGET,
+            step=500,
+            help="Maximum input tokens per turn. Older messages are folded into a running summary."
         )
         
         if st.button("Clear Chat History", type="secondary"):
-            st.session_state.chatbot_messages = []
+            store.clear(conversation_id, "chat")
+            store.set_state(conversation_id, "chat_summary", None)
+            store.set_state(conversation_id, "chat_stats", None)
+            _load_chat_session(store, conversation_id)
             st.rerun()
     
-    # Display chat history
+    # Display chat history (only the most recent messages; older ones load on demand)
     chat_container = st.container()
     with chat_container:
-        for message in st.session_state.chatbot_messages:
+        visible = _visible_messages(store, conversation_id)
+        if len(visible) < st.session_state.chatbot_stats["messages"]:
+            if st.button("⬆️ Load earlier messages", key="load_earlier_messages_btn"):
+                st.session_state.chatbot_render_limit += CHAT_RENDER_WINDOW
+                st.rerun()
+        for message in visible:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
+                if message.get("stopped"):
+                    st.caption("⏹️ Stopped")
     
     # Chat input
     if user_input := st.chat_input("Type your message here..."):
         # Add user message to chat history
-        st.session_state.chatbot_messages.append({"role": "user", "content": user_input})
+        _append_message(store, conversation_id, {"role": "user", "content": user_input})
         
         # Display user message
         with st.chat_message("user"):
@@ -54,42 +171,54 @@ def render_chatbot():
         
         # Get AI response
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                # Prepare messages for API call
-                api_messages = []
-                
-                # Add system message for context
-                api_messages.append({
-                    "role": "system", 
-                    "content": "You are a helpful, friendly, and knowledgeable AI assistant. Provide clear, accurate, and engaging responses to user questions and requests."
-                })
-                
-                # Add conversation history (last 10 messages to manage context length)
-                recent_messages = st.session_state.chatbot_messages[-10:] if len(st.session_state.chatbot_messages) > 10 else st.session_state.chatbot_messages
-                for msg in recent_messages:
-                    api_messages.append(msg)
-                
-                # Get response from OpenAI
-                response = get_chat_response(
+            # Stream the response as it is generated
+            stats = {}
+            try:
+                # Recent messages that fit the token budget, with older turns summarized
+                api_messages = build_chat_context(
+                    st.session_state.chatbot_messages,
+                    st.session_state.chatbot_summary,
+                    CHAT_SYSTEM_PROMPT,
+                    budget=context_budget,
+                    index=_chat_index(store, conversation_id),
+                    load_messages=lambda start, end: [
+                        dict(payload, seq=seq) for seq, payload in store.range(conversation_id, "chat", start, end)
+                    ]
+                )
+                store.set_state(conversation_id, "chat_summary", st.session_state.chatbot_summary)
+                response = write_stream_stoppable(stream_chat_response(
                     messages=api_messages,
                     max_tokens=max_tokens,
-                    temperature=temperature
-                )
-                
-                if response:
-                    st.markdown(response)
-                    # Add assistant response to chat history
-                    st.session_state.chatbot_messages.append({"role": "assistant", "content": response})
-                else:
-                    st.error("Sorry, I couldn't generate a response. Please try again.")
+                    temperature=temperature,
+                    stats=stats
+                ), "chatbot_stopped")
+            except GeminiError as e:
+                st.error(str(e))
+                response = None
+            
+            if response:
+                # Add assistant response to chat history once the stream is complete
+                usage = stats.get("usage") or {}
+                _append_message(store, conversation_id, {
+                    "role": "assistant",
+                    "content": response,
+                    "tokens": usage.get("output_tokens")
+                })
+                if stats.get("ttft") is not None:
+                    caption = f"⚡ First token in {stats['ttft']:.2f}s · total {stats['total']:.2f}s"
+                    if usage.get("prompt_tokens"):
+                        caption += f" · {usage['prompt_tokens']} input tokens"
+                    st.caption(caption)
+            else:
+                st.error("Sorry, I couldn't generate a response. Please try again.")
     
-    # Show conversation stats
-    if st.session_state.chatbot_messages:
+    # Show conversation stats (kept incrementally as messages are appended)
+    chat_stats = st.session_state.chatbot_stats
+    if chat_stats["messages"]:
         st.sidebar.markdown("---")
         st.sidebar.markdown(f"**Conversation Stats:**")
-        st.sidebar.markdown(f"Messages: {len(st.session_state.chatbot_messages)}")
-        
-        # Calculate token estimate (rough approximation)
-        total_chars = sum(len(msg["content"]) for msg in st.session_state.chatbot_messages)
-        estimated_tokens = total_chars // 4  # Rough estimate: 1 token ≈ 4 characters
-        st.sidebar.markdown(f"Estimated tokens: {estimated_tokens}")
+        st.sidebar.markdown(f"Messages: {chat_stats['messages']}")
+        st.sidebar.markdown(f"Tokens: {chat_stats['tokens']}")
+        summarized = st.session_state.chatbot_summary["covered"] - store.history_start(conversation_id, "chat")
+        if summarized > 0:
+            st.sidebar.markdown(f"Summarized messages: {summarized}")
@@ -1,5 +1,13 @@
+import os
 import streamlit as st
-from utils.openai_client import get_code_assistance
+from components.session import get_conversation_id, take_stopped, write_stream_stoppable
+from utils.code_session import new_code_session, plan_code_turn, record_code_turn, session_summary
+from utils.history import CodeInteraction, SessionHistory
+from utils.openai_client import CODE_MAP_REDUCE_MIN_CHARS, GeminiError, stream_code_assistance
+from utils.storage import get_conversation_store
+
+# Number of recent interactions kept in session memory and shown; older ones stay in the store
+CODE_HISTORY_WINDOW = int(os.getenv("CODE_HISTORY_WINDOW", "5"))
 
 def render_code_assistant():
     """
@@ -8,9 +16,23 @@ def render_code_assistant():
     st.header("👨‍💻 Code Assistant")
     st.markdown("Get help with programming questions, code review, debugging, and explanations.")
     
-    # Initialize code assistant history
+    # Initialize code assistant history from the persistent store (resumes across reloads)
+    store = get_conversation_store()
+    conversation_id = get_conversation_id()
     if "code_assistant_history" not in st.session_state:
-        st.session_state.code_assistant_history = []
+        st.session_state.code_assistant_history = SessionHistory(conversation_id, "code", CODE_HISTORY_WINDOW, [
+            CodeInteraction.from_dict(payload)
+            for _, payload in store.page(conversation_id, "code", limit=CODE_HISTORY_WINDOW)
+        ])
+    if "code_session" not in st.session_state:
+        st.session_state.code_session = new_code_session()
+    
+    # Keep the partial answer of a generation stopped in the previous run
+    stopped = take_stopped("code_assistant_stopped")
+    if stopped and stopped["text"]:
+        interaction = dict(stopped, response=stopped.pop("text"), stopped=True)
+        store.append(conversation_id, "code", interaction)
+        st.session_state.code_assistant_history.append(CodeInteraction.from_dict(interaction))
     
     # Assistant configuration
     col1, col2 = st.columns([2, 1])
@@ -30,7 +52,9 @@ def render_code_assistant():
     
     with col2:
         if st.button("Clear History", type="secondary"):
-            st.session_state.code_assistant_history = []
+            store.clear(conversation_id, "code")
+            st.session_state.code_assistant_history.clear()
+            st.session_state.code_session = new_code_session()
             st.rerun()
     
     # Input sections
@@ -57,71 +81,114 @@ def render_code_assistant():
             ["", "Python", "JavaScript", "Java", "C++", "C#", "Go", "Rust", "PHP", "Ruby", "Swift", "Kotlin", "Other"],
             help="Specify the programming language for more targeted assistance"
         )
+    with col2:
+        follow_up = st.toggle(
+            "🔁 Follow-up mode",
+            help="Continue a session on the same code: later questions send only what changed "
+                 "in the code plus a summary of the earlier answers"
+        )
+        code_session = st.session_state.code_session
+        if follow_up and code_session["turns"]:
+            st.caption(f"Session: {code_session['turns']} earlier questions")
+            if st.button("New Session", type="secondary", key="new_code_session_btn"):
+                st.session_state.code_session = new_code_session()
+                st.rerun()
     
     # Submit button
     if st.button("Get Code Assistance", type="primary", disabled=not code_query.strip()):
-        with st.spinner("Analyzing your code question..."):
-            # Prepare the enhanced query
-            enhanced_query = code_query
-            if language:
-                enhanced_query = f"[{language}] {enhanced_query}"
-            
-            response = get_code_assistance(
-                code_query=enhanced_query,
+        # Stream the current response as it is generated
+        st.subheader("🤖 Assistant Response")
+        code_diff = plan_code_turn(code_session, code_context) if follow_up else None
+        if code_diff is not None:
+            if code_diff:
+                st.caption(f"🔁 Follow-up: sending the changes ({len(code_diff):,} of {len(code_context):,} characters)")
+            else:
+                st.caption("🔁 Follow-up: code unchanged, sending only the question")
+        elif len(code_context) >= CODE_MAP_REDUCE_MIN_CHARS:
+            st.caption("🧩 Large code context: analyzing each function and class in parallel before writing the report...")
+        stats = {}
+        interaction = {
+            "query": code_query,
+            "context": code_context,
+            "language": language,
+            "type": assistance_type
+        }
+        try:
+            response = write_stream_stoppable(stream_code_assistance(
+                code_query=code_query,
                 code_context=code_context,
-                assistance_type=assistance_type
-            )
+                assistance_type=assistance_type,
+                language=language,
+                stats=stats,
+                session_summary=session_summary(code_session) if follow_up else "",
+                code_diff=code_diff
+            ), "code_assistant_stopped", interaction)
+        except GeminiError as e:
+            st.error(str(e))
+            response = None
+        
+        if response:
+            # Add to history once the stream is complete
+            interaction["response"] = response
+            interaction["timing"] = {"ttft": stats.get("ttft"), "total": stats.get("total")}
+            store.append(conversation_id, "code", interaction)
+            st.session_state.code_assistant_history.append(CodeInteraction.from_dict(interaction))
+            if follow_up:
+                record_code_turn(code_session, code_context, code_query, response)
             
-            if response:
-                # Add to history
-                st.session_state.code_assistant_history.append({
-                    "query": code_query,
-                    "context": code_context,
-                    "language": language,
-                    "type": assistance_type,
-                    "response": response
-                })
-                
-                # Display response
-                st.success("Code assistance generated successfully!")
-                
-                # Display the current response
-                st.subheader("🤖 Assistant Response")
-                st.markdown(response)
-            else:
-                st.error("Failed to get code assistance. Please try again.")
+            st.success("Code assistance generated successfully!")
+            if stats.get("cache") == "hit":
+                st.caption("⚡ Served from the response cache")
+            elif stats.get("cache") == "semantic_hit":
+                st.caption(f"⚡ Served from the cache (similar earlier request, {stats['similarity']:.0%} match)")
+            elif stats.get("coalesced"):
+                st.caption(f"⚡ Shared with an identical request already in progress · total {stats['total']:.2f}s")
+            elif stats.get("ttft") is not None:
+                st.caption(f"⚡ First token in {stats['ttft']:.2f}s · total {stats['total']:.2f}s")
+            if stats.get("map_reduce"):
+                parts = stats["map_reduce"]
+                caption = f"🧩 Analyzed {parts['units']} parts ({parts['cached']} unchanged, from cache)"
+                if parts["failed"]:
+                    caption += f" · {parts['failed']} could not be analyzed"
+                st.caption(caption)
+        else:
+            st.error("Failed to get code assistance. Please try again.")
     
     # Display history
+    total_interactions = store.count(conversation_id, "code")
     if st.session_state.code_assistant_history:
         st.markdown("---")
         st.subheader("📚 Recent Assistance")
         
         # Show recent interactions (last 5)
-        for i, interaction in enumerate(reversed(st.session_state.code_assistant_history[-5:])):
-            with st.expander(f"Question {len(st.session_state.code_assistant_history) - i}: {interaction['query'][:50]}..."):
+        for i, interaction in enumerate(reversed(st.session_state.code_assistant_history)):
+            with st.expander(f"Question {total_interactions - i}: {interaction.query[:50]}..."):
                 
                 # Show interaction details
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    st.markdown(f"**Type:** {interaction['type'].title()}")
+                    st.markdown(f"**Type:** {interaction.type.title()}")
                 with col2:
-                    if interaction['language']:
-                        st.markdown(f"**Language:** {interaction['language']}")
+                    if interaction.language:
+                        st.markdown(f"**Language:** {interaction.language}")
                 with col3:
-                    st.markdown(f"**Assistance #{len(st.session_state.code_assistant_history) - i}**")
+                    st.markdown(f"**Assistance #{total_interactions - i}**")
                 
                 # Show original query
                 st.markdown("**Your Question:**")
-                st.markdown(interaction['query'])
+                st.markdown(interaction.query)
                 
                 # Show code context if provided
-                if interaction['context'].strip():
+                context = interaction.context
+                if context.strip():
                     st.markdown("**Code Context:**")
-                    st.code(interaction['context'], language=interaction['language'].lower() if interaction['language'] else None)
+                    st.code(context, language=interaction.language.lower() if interaction.language else None)
                 
                 # Show response
                 st.markdown("**Assistant Response:**")
-                st.markdown(interaction['response'])
+                st.markdown(interaction.response)
+                if interaction.stopped:
+                    st.caption("⏹️ Stopped before the end")
     
     # Tips and examples
     with st.sidebar:
@@ -147,4 +214,4 @@ def render_code_assistant():
         """)
         
         st.markdown("### 📊 Session Stats")
-        st.markdown(f"Questions asked: {len(st.session_state.code_assistant_history)}")
+        st.markdown(f"Questions asked: {total_interactions}")
@@ -0,0 +1,69 @@
+import streamlit as st
+from utils.storage import get_conversation_store
+
+def get_conversation_id():
+    """
+    Get the persistent conversation id for this browser session.
+
+    The id is kept in the page URL, so reloading the page resumes the same
+    conversation. A new conversation is created if the URL has none or an
+    unknown one.
+    """
+    if "conversation_id" not in st.session_state:
+        store = get_conversation_store()
+        conversation_id = st.query_params.get("conversation")
+        if not conversation_id or not store.conversation_exists(conversation_id):
+            conversation_id = store.create_conversation()
+            st.query_params["conversation"] = conversation_id
+        st.session_state.conversation_id = conversation_id
+    return st.session_state.conversation_id
+
+def write_stream_stoppable(chunks, key, record=None):
+    """
+    Write a response stream with st.write_stream and a Stop button.
+
+    The text streamed so far is kept in st.session_state[key] together with
+    record. Clicking Stop reruns the script mid-stream: the stream is closed,
+    which cancels the upstream call, and the next run picks up the partial
+    text with take_stopped(key).
+
+    Args:
+        chunks: Generator of response text chunks
+        key: Session state key for the partial response
+        record: Optional dictionary stored with the partial text (e.g. the request)
+
+    Returns:
+        The full response text once the stream completes
+
+    Raises:
+        Whatever the stream raises
+    """
+    stop_slot = st.empty()
+    stop_slot.button("⏹️ Stop", key=f"{key}_stop_btn", help="Stop generating and keep the text so far")
+    st.session_state[key] = dict(record or {}, text="")
+
+    def capture():
+        for chunk in chunks:
+            st.session_state[key]["text"] += chunk
+            yield chunk
+
+    try:
+        response = st.write_stream(capture())
+    except Exception:
+        # Failed rather than stopped: there is nothing to keep
+        del st.session_state[key]
+        raise
+    finally:
+        chunks.close()
+    stop_slot.empty()
+    del st.session_state[key]
+    return response
+
+def take_stopped(key):
+    """
+    Get and forget the partial response of a stream stopped in the previous run.
+
+    Returns:
+        The record passed to write_stream_stoppable with the partial 'text', or None
+    """
+    return st.session_state.pop(key, None)
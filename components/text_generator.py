@@ -1,5 +1,21 @@
+import os
 import streamlit as st
-from utils.openai_client import generate_text
+from components.session import get_conversation_id, take_stopped, write_stream_stoppable
+from utils.openai_client import (
+    TEXT_STOP_SEQUENCES,
+    TEXT_VARIANTS_MAX,
+    GeminiError,
+    generate_variants,
+    stream_long_text,
+    stream_text,
+)
+from utils.history import SessionHistory, TextGeneration
+from utils.storage import get_conversation_store
+from utils.batch import BATCH_MAX_WORKERS, batch_output_path, parse_batch_file, read_batch_results, run_batch
+from utils.prompts import enhance_text_prompt
+
+# Number of recent generations kept in session memory and shown; older ones stay in the store
+TEXT_HISTORY_WINDOW = int(os.getenv("TEXT_HISTORY_WINDOW", "3"))
 
 def render_text_generator():
     """
@@ -8,9 +24,21 @@ def render_text_generator():
     st.header("✍️ Text Generator")
     st.markdown("Generate high-quality content for various purposes including creative writing, business documents, and technical content.")
     
-    # Initialize text generator history
+    # Initialize text generator history from the persistent store (resumes across reloads)
+    store = get_conversation_store()
+    conversation_id = get_conversation_id()
     if "text_generator_history" not in st.session_state:
-        st.session_state.text_generator_history = []
+        st.session_state.text_generator_history = SessionHistory(conversation_id, "text", TEXT_HISTORY_WINDOW, [
+            TextGeneration.from_dict(payload)
+            for _, payload in store.page(conversation_id, "text", limit=TEXT_HISTORY_WINDOW)
+        ])
+    
+    # Keep the partial content of a generation stopped in the previous run
+    stopped = take_stopped("text_generator_stopped")
+    if stopped and stopped["text"]:
+        generation = dict(stopped, response=stopped.pop("text"), stopped=True)
+        store.append(conversation_id, "text", generation)
+        st.session_state.text_generator_history.append(TextGeneration.from_dict(generation))
     
     # Configuration section
     col1, col2 = st.columns([3, 1])
@@ -30,7 +58,8 @@ def render_text_generator():
     
     with col2:
         if st.button("Clear History", type="secondary", key="clear_history_btn"):
-            st.session_state.text_generator_history = []
+            store.clear(conversation_id, "text")
+            st.session_state.text_generator_history.clear()
             st.rerun()
     
     # Advanced settings in expander
@@ -54,8 +83,16 @@ def render_text_generator():
                 max_value=2000,
                 value=800,
                 step=100,
-                help="Maximum length of generated content"
+                help="Hard cap on the number of tokens generated"
             )
+        
+        stop_text = st.text_input(
+            "Stop Sequences",
+            value=", ".join(TEXT_STOP_SEQUENCES.get(text_type, [])),
+            key=f"stop_sequences_{text_type}",
+            help="Optional comma-separated phrases; generation ends before any of them (up to 5)"
+        )
+        stop_sequences = [sequence.strip() for sequence in stop_text.split(",") if sequence.strip()]
     
     # Main input section
     st.subheader("Content Generation Prompt")
@@ -96,77 +133,136 @@ def render_text_generator():
                 help="Specify the desired tone for the content"
             )
     
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        long_form = st.toggle(
+            "📚 Long-form mode",
+            key="long_form_mode",
+            help="Plan an outline first, then write its sections in parallel; for guides, tutorials and other "
+                 "long documents. The content length applies to each section."
+        )
+    with col2:
+        variants = st.number_input(
+            "Variants",
+            min_value=1,
+            max_value=TEXT_VARIANTS_MAX,
+            value=1,
+            disabled=long_form,
+            key="text_variants_count",
+            help="Generate several alternatives at once and pick one"
+        )
+    if long_form:
+        variants = 1
+    
     # Generate button
     if st.button("Generate Content", type="primary", disabled=not prompt.strip(), key="generate_content_btn"):
-        with st.spinner("Generating your content..."):
-            # Enhance the prompt with additional context
-            enhanced_prompt = prompt
-            
-            if context:
-                enhanced_prompt += f"\n\nAdditional context: {context}"
-            
-            if target_audience:
-                enhanced_prompt += f"\n\nTarget audience: {target_audience}"
-            
-            if tone:
-                enhanced_prompt += f"\n\nTone: {tone}"
-            
-            # Add content type specific instructions
-            type_instructions = {
-                "creative": "Focus on vivid imagery, engaging narrative, and creative expression.",
-                "formal": "Use professional language, clear structure, and appropriate business tone.",
-                "technical": "Include technical accuracy, clear explanations, and proper terminology."
+        # Enhance the prompt with additional context
+        enhanced_prompt = enhance_text_prompt(prompt, text_type, context, target_audience, tone)
+        
+        stats = {}
+        generation = {
+            "prompt": prompt,
+            "context": context,
+            "type": text_type,
+            "audience": target_audience,
+            "tone": tone,
+            "settings": {
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "stop_sequences": stop_sequences,
+                "long_form": long_form,
+                "variants": variants
             }
-            
-            if text_type in type_instructions:
-                enhanced_prompt += f"\n\nStyle note: {type_instructions[text_type]}"
-            
-            response = generate_text(
-                prompt=enhanced_prompt,
-                text_type=text_type,
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
-            
+        }
+        if variants > 1:
+            # All variants in one round trip; shown side by side below until one is picked
+            with st.spinner(f"Generating {variants} variants..."):
+                try:
+                    candidates = generate_variants(
+                        prompt=enhanced_prompt,
+                        text_type=text_type,
+                        count=variants,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        stats=stats,
+                        stop_sequences=stop_sequences
+                    )
+                except GeminiError as e:
+                    st.error(str(e))
+                    candidates = []
+            if candidates:
+                generation["timing"] = {"ttft": stats.get("ttft"), "total": stats.get("total")}
+                st.session_state.text_variants = {"generation": generation, "variants": candidates, "stats": stats}
+            else:
+                st.error("Failed to generate content. Please try again.")
+        else:
+            st.session_state.pop("text_variants", None)
+            # Show the generated content as it streams in
+            st.subheader("📄 Generated Content")
+            content_container = st.container()
+            with content_container:
+                try:
+                    if long_form:
+                        chunks = stream_long_text(
+                            prompt=enhanced_prompt,
+                            text_type=text_type,
+                            max_tokens=max_tokens,
+                            temperature=temperature,
+                            stats=stats,
+                            stop_sequences=stop_sequences
+                        )
+                    else:
+                        chunks = stream_text(
+                            prompt=enhanced_prompt,
+                            text_type=text_type,
+                            max_tokens=max_tokens,
+                            temperature=temperature,
+                            stats=stats,
+                            stop_sequences=stop_sequences,
+                            user_request={"prompt": prompt, "context": context, "audience": target_audience, "tone": tone}
+                        )
+                    response = write_stream_stoppable(chunks, "text_generator_stopped", generation)
+                except GeminiError as e:
+                    st.error(str(e))
+                    response = None
+        
             if response:
-                # Add to history
-                st.session_state.text_generator_history.append({
-                    "prompt": prompt,
-                    "context": context,
-                    "type": text_type,
-                    "audience": target_audience,
-                    "tone": tone,
-                    "response": response,
-                    "settings": {
-                        "temperature": temperature,
-                        "max_tokens": max_tokens
-                    }
-                })
-                
-                # Display response
+                # Add to history once the stream is complete
+                generation["response"] = response
+                generation["timing"] = {"ttft": stats.get("ttft"), "total": stats.get("total")}
+                store.append(conversation_id, "text", generation)
+                st.session_state.text_generator_history.append(TextGeneration.from_dict(generation))
+            
                 st.success("Content generated successfully!")
-                
-                # Show the generated content
-                st.subheader("📄 Generated Content")
-                
+                if stats.get("cache") == "hit":
+                    st.caption("⚡ Served from the response cache")
+                elif stats.get("cache") == "semantic_hit":
+                    st.caption(f"⚡ Served from the cache (similar earlier request, {stats['similarity']:.0%} match)")
+                elif stats.get("coalesced"):
+                    st.caption(f"⚡ Shared with an identical request already in progress · total {stats['total']:.2f}s")
+                elif stats.get("ttft") is not None:
+                    st.caption(f"⚡ First token in {stats['ttft']:.2f}s · total {stats['total']:.2f}s")
+                long_form_stats = stats.get("long_form")
+                if long_form_stats and long_form_stats["sections"]:
+                    st.caption(
+                        f"📚 {long_form_stats['sections']} sections written {long_form_stats['concurrency']} at a time "
+                        f"after a {long_form_stats['outline_time']:.2f}s outline · "
+                        f"{long_form_stats['generation_time']:.2f}s of generation in {stats['total']:.2f}s"
+                    )
+                    if long_form_stats["failed"]:
+                        st.warning(f"{long_form_stats['failed']} sections could not be generated.")
+            
                 # Add copy button functionality
                 col1, col2 = st.columns([4, 1])
-                with col1:
-                    st.markdown("**Your generated content:**")
                 with col2:
                     if st.button("📋 Copy", help="Copy content to clipboard", key="copy_content_btn"):
                         st.code(response, language=None)
-                
-                # Display content in a nice format
-                content_container = st.container()
-                with content_container:
-                    st.markdown(response)
-                
+            
                 # Show content statistics
                 word_count = len(response.split())
                 char_count = len(response)
                 estimated_reading_time = max(1, word_count // 200)  # Assuming 200 words per minute
-                
+            
                 col1, col2, col3 = st.columns(3)
                 with col1:
                     st.metric("Words", word_count)
@@ -174,37 +270,130 @@ def render_text_generator():
                     st.metric("Characters", char_count)
                 with col3:
                     st.metric("Est. Reading Time", f"{estimated_reading_time} min")
-                
+            
             else:
                 st.error("Failed to generate content. Please try again.")
     
+    # Variants waiting for the user to pick one; kept across reruns until then
+    pending = st.session_state.get("text_variants")
+    if pending:
+        st.subheader("🔀 Variants")
+        variant_stats = pending["stats"]["variants"]
+        calls = "one call" if variant_stats["calls"] == 1 else f"{variant_stats['calls']} parallel calls"
+        st.caption(f"⚡ {len(pending['variants'])} variants in {pending['stats']['total']:.2f}s from {calls}")
+        chosen = None
+        for i, (column, variant) in enumerate(zip(st.columns(len(pending["variants"])), pending["variants"])):
+            with column:
+                st.markdown(f"**Variant {i + 1}**")
+                st.markdown(variant)
+                if st.button("✅ Use this one", key=f"use_variant_{i}"):
+                    chosen = i
+        if st.button("Discard Variants", type="secondary", key="discard_variants_btn"):
+            del st.session_state.text_variants
+            st.rerun()
+        if chosen is not None:
+            # Only the picked variant goes to the history
+            generation = dict(pending["generation"], response=pending["variants"][chosen], variant=chosen + 1)
+            store.append(conversation_id, "text", generation)
+            st.session_state.text_generator_history.append(TextGeneration.from_dict(generation))
+            del st.session_state.text_variants
+            st.rerun()
+    
+    # Bulk generation from an uploaded file
+    with st.expander("📦 Bulk Generation"):
+        st.markdown(
+            "Upload a CSV or JSONL file with a `prompt` column and optional `text_type`, `tone`, "
+            "`audience` and `context` columns. Empty values use the settings above."
+        )
+        uploaded_file = st.file_uploader("Prompts file", type=["csv", "jsonl"], key="batch_upload")
+        max_workers = st.slider(
+            "Parallel requests",
+            min_value=1,
+            max_value=16,
+            value=BATCH_MAX_WORKERS,
+            help="How many rows are generated at the same time"
+        )
+        
+        if uploaded_file is not None:
+            try:
+                rows = parse_batch_file(uploaded_file.name, uploaded_file.getvalue())
+            except ValueError as e:
+                st.error(f"Could not read the file: {str(e)}")
+                rows = []
+            
+            if rows:
+                defaults = {
+                    "text_type": text_type,
+                    "tone": tone,
+                    "audience": target_audience,
+                    "context": context,
+                    "max_tokens": max_tokens,
+                    "temperature": temperature
+                }
+                output_path = batch_output_path(rows, defaults)
+                st.markdown(f"**{len(rows)}** prompts loaded.")
+                
+                if st.button("Run Batch", type="primary", key="run_batch_btn"):
+                    progress = st.progress(0.0, text="Starting...")
+                    
+                    def on_progress(done, total, record):
+                        label = f"{done}/{total} rows done"
+                        if record["status"] != "ok":
+                            label += f" (row {record['row'] + 1} failed: {record['error']})"
+                        progress.progress(done / total, text=label)
+                    
+                    summary = run_batch(rows, defaults, output_path, max_workers=max_workers, on_progress=on_progress)
+                    progress.progress(1.0, text="Batch finished")
+                    
+                    if summary["skipped"]:
+                        st.info(f"Resumed: {summary['skipped']} rows were already done.")
+                    if summary["failed"]:
+                        st.warning(f"{summary['failed']} rows failed. Run the batch again to retry them.")
+                    else:
+                        st.success(f"Generated {summary['succeeded']} new pieces of content.")
+                
+                results = read_batch_results(output_path)
+                if results:
+                    st.download_button(
+                        "⬇️ Download results (JSONL)",
+                        data=results,
+                        file_name="generated_content.jsonl",
+                        mime="application/jsonl",
+                        key="batch_download_btn"
+                    )
+    
     # Display generation history
+    total_generations = store.count(conversation_id, "text")
     if st.session_state.text_generator_history:
         st.markdown("---")
         st.subheader("📚 Recent Generations")
         
         # Show recent generations (last 3)
-        for i, generation in enumerate(reversed(st.session_state.text_generator_history[-3:])):
-            with st.expander(f"Generation {len(st.session_state.text_generator_history) - i}: {generation['prompt'][:50]}..."):
+        for i, generation in enumerate(reversed(st.session_state.text_generator_history)):
+            with st.expander(f"Generation {total_generations - i}: {generation.prompt[:50]}..."):
                 
                 # Show generation details
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    st.markdown(f"**Type:** {generation['type'].title()}")
+                    st.markdown(f"**Type:** {generation.type.title()}")
                 with col2:
-                    if generation['tone']:
-                        st.markdown(f"**Tone:** {generation['tone']}")
+                    if generation.tone:
+                        st.markdown(f"**Tone:** {generation.tone}")
                 with col3:
-                    if generation['audience']:
-                        st.markdown(f"**Audience:** {generation['audience']}")
+                    if generation.audience:
+                        st.markdown(f"**Audience:** {generation.audience}")
                 
                 # Show the generated content
                 st.markdown("**Generated Content:**")
-                st.markdown(generation['response'])
+                st.markdown(generation.response)
+                if generation.stopped:
+                    st.caption("⏹️ Stopped before the end")
+                if generation.variant:
+                    st.caption(f"🔀 Variant {generation.variant} of {generation.settings['variants']}")
                 
                 # Show settings used
                 st.markdown("**Settings Used:**")
-                st.json(generation['settings'])
+                st.json(generation.settings)
     
     # Usage tips and examples
     with st.sidebar:
@@ -244,4 +433,4 @@ def render_text_generator():
                     st.markdown(f"• {example}")
         
         st.markdown("### 📊 Session Stats")
-        st.markdown(f"Content pieces generated: {len(st.session_state.text_generator_history)}")
+        st.markdown(f"Content pieces generated: {total_generations}")
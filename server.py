@@ -0,0 +1,230 @@
+"""
+Headless HTTP API for the chat, code and text helpers, without Streamlit.
+
+Endpoints (JSON request bodies):
+    GET  /health    Shared API health state, with rate limiter, retry, circuit breaker, routing and
+                    hedging counters
+    GET  /metrics   Latency, token, error and cache metrics in the Prometheus text format
+    POST /v1/chat   {"messages": [...], "max_tokens", "temperature", "stream"}
+    POST /v1/code   {"query", "context", "assistance_type", "language", "stream"}
+    POST /v1/text   {"prompt", "text_type", "context", "audience", "tone", "max_tokens", "temperature",
+                     "stop_sequences", "long_form", "stream"}
+
+With "stream": true the response is newline-delimited JSON: one
+{"delta": "..."} line per chunk, then {"done": true, "stats": {...}} or
+{"error": "..."}. Otherwise a single {"text": "...", "stats": {...}} object
+is returned. Errors before any output are returned as {"error": "..."} with
+status 400 (invalid request), 502 (Gemini API error) or 500.
+"""
+import json
+import os
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import utils.env  # Loads .env before any module below reads its settings
+from utils.async_client import get_resilience_stats
+from utils.hedging import get_hedger
+from utils.metrics import get_metrics, start_metrics_dump
+from utils.model_router import get_router
+from utils.openai_client import (
+    GeminiError,
+    get_health,
+    start_health_monitor,
+    stream_chat_response,
+    stream_code_assistance,
+    stream_long_text,
+    stream_text,
+)
+from utils.prompts import enhance_text_prompt
+
+MAX_BODY_BYTES = 1024 * 1024
+CHAT_ROLES = ("system", "user", "assistant", "model")
+
+def _string(body, field, default="", required=False):
+    value = body.get(field, default)
+    if not isinstance(value, str):
+        raise ValueError(f"'{field}' must be a string")
+    if required and not value:
+        raise ValueError(f"'{field}' is required")
+    return value
+
+def _temperature(body, default):
+    value = body.get("temperature", default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 2:
+        raise ValueError("'temperature' must be a number from 0 to 2")
+    return float(value)
+
+def _stop_sequences(body):
+    value = body.get("stop_sequences")
+    if value is not None and (not isinstance(value, list) or not all(isinstance(s, str) and s for s in value)):
+        raise ValueError("'stop_sequences' must be a list of non-empty strings")
+    return value
+
+def _chat_stream(body, stats):
+    messages = body.get("messages")
+    if not isinstance(messages, list) or not messages:
+        raise ValueError("'messages' must be a non-empty list")
+    for i, message in enumerate(messages):
+        if not isinstance(message, dict) or message.get("role") not in CHAT_ROLES:
+            raise ValueError(f"messages[{i}] must be an object with a 'role' of {', '.join(CHAT_ROLES)}")
+        if not isinstance(message.get("content"), str):
+            raise ValueError(f"messages[{i}].content must be a string")
+    return stream_chat_response(
+        messages=messages,
+        max_tokens=int(body.get("max_tokens", 1000)),
+        temperature=_temperature(body, 0.7),
+        stats=stats,
+    )
+
+def _code_stream(body, stats):
+    query = _string(body, "query", required=True)
+    options = {}
+    if "temperature" in body:
+        options["temperature"] = _temperature(body, None)
+    return stream_code_assistance(
+        code_query=query,
+        code_context=_string(body, "context"),
+        assistance_type=_string(body, "assistance_type", "general"),
+        language=_string(body, "language"),
+        stats=stats,
+        **options,
+    )
+
+def _text_stream(body, stats):
+    user_request = {field: _string(body, field, required=field == "prompt")
+                    for field in ("prompt", "context", "audience", "tone")}
+    text_type = _string(body, "text_type", "general")
+    prompt = enhance_text_prompt(
+        user_request["prompt"], text_type, user_request["context"], user_request["audience"], user_request["tone"]
+    )
+    options = {
+        "prompt": prompt,
+        "text_type": text_type,
+        "max_tokens": int(body.get("max_tokens", 1000)),
+        "temperature": _temperature(body, 0.7),
+        "stats": stats,
+        "stop_sequences": _stop_sequences(body),
+    }
+    if body.get("long_form"):
+        return stream_long_text(**options)
+    return stream_text(**options, user_request=user_request)
+
+ROUTES = {
+    "/v1/chat": _chat_stream,
+    "/v1/code": _code_stream,
+    "/v1/text": _text_stream,
+}
+
+class APIRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/health":
+            health = get_health()
+            self._send_json(200 if health["ok"] else 503, dict(
+                health, resilience=get_resilience_stats(), routing=get_router().stats(),
+                hedging=get_hedger().stats()
+            ))
+        elif self.path == "/metrics":
+            data = get_metrics().render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        handler = ROUTES.get(self.path)
+        if handler is None:
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        chunks = None
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_BODY_BYTES:
+                self._send_json(413, {"error": "Request body too large"})
+                return
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("Request body must be a JSON object")
+            stats = {}
+            chunks = handler(body, stats)
+            if body.get("stream"):
+                # Wait for the first chunk so errors before any output get a proper status code
+                first = next(chunks, None)
+            else:
+                text = "".join(chunks)
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except GeminiError as e:
+            self._send_json(502, {"error": str(e)})
+            return
+        except Exception:
+            self.log_error("Unhandled error in %s:\n%s", self.path, traceback.format_exc())
+            if chunks is not None:
+                chunks.close()
+            self._send_json(500, {"error": "Internal server error"})
+            return
+
+        if body.get("stream"):
+            self._stream(first, chunks, stats)
+            return
+        self._send_json(200, {"text": text, "stats": stats})
+
+    def _stream(self, first, chunks, stats):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            if first is not None:
+                self._write_chunk({"delta": first})
+                for chunk in chunks:
+                    self._write_chunk({"delta": chunk})
+            self._write_chunk({"done": True, "stats": stats})
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away; closing the generator cancels the upstream call
+            chunks.close()
+            return
+        except (ValueError, GeminiError) as e:
+            self._write_chunk({"error": str(e)})
+        except Exception:
+            self.log_error("Unhandled error in %s:\n%s", self.path, traceback.format_exc())
+            chunks.close()
+            self._write_chunk({"error": "Internal server error"})
+        self.wfile.write(b"0\r\n\r\n")
+
+def serve(host="127.0.0.1", port=8000):
+    """
+    Run the HTTP API until interrupted.
+    """
+    start_health_monitor()
+    start_metrics_dump()
+    httpd = ThreadingHTTPServer((host, port), APIRequestHandler)
+    print(f"Serving AI Assistant Hub API on http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+if __name__ == "__main__":
+    serve(os.getenv("API_HOST", "127.0.0.1"), int(os.getenv("API_PORT", "8000")))
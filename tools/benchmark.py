@@ -0,0 +1,275 @@
+"""
+Benchmark the chat, code and text helpers against the local fake Gemini server.
+
+Runs every combination of target, chat history length, prompt size and
+concurrency level, and reports p50/p95/p99 latency, throughput and the
+number of upstream calls. Results are written to JSON so runs of different
+revisions can be compared:
+
+    python tools/benchmark.py --latency 0.2 --tokens-per-second 200 --output-tokens 100
+    python tools/benchmark.py --compare .cache/benchmarks/<older revision>.json
+
+By default a fake server is started in-process; pass --endpoint to use one
+that is already running (tools/fake_gemini_server.py).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tools.fake_gemini_server import make_server
+
+TARGETS = ("chat", "code", "text")
+HISTORY_MESSAGE_CHARS = 200
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+def _revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _upstream_stats(endpoint):
+    with urllib.request.urlopen(f"{endpoint}/_stats", timeout=10) as response:
+        return json.load(response)
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of a list of numbers.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def _filler(chars, seed):
+    text = f"[{seed}] "
+    words = "the quick brown fox jumps over the lazy dog while the code compiles".split()
+    i = 0
+    while len(text) < chars:
+        text += words[i % len(words)] + " "
+        i += 1
+    return text[:chars]
+
+def _make_call(target, history, prompt_chars, request_id):
+    # Imported here so the environment is configured before the client module reads it
+    from utils.openai_client import get_chat_response, get_code_assistance, generate_text
+
+    prompt = _filler(prompt_chars, request_id)
+    if target == "chat":
+        messages = [{"role": "system", "content": "You are a helpful assistant."}]
+        for i in range(history):
+            role = "user" if i % 2 == 0 else "assistant"
+            messages.append({"role": role, "content": _filler(HISTORY_MESSAGE_CHARS, f"{request_id}-{i}")})
+        if messages[-1]["role"] == "user":
+            messages.append({"role": "assistant", "content": "OK."})
+        messages.append({"role": "user", "content": prompt})
+        return lambda: get_chat_response(messages)
+    if target == "code":
+        return lambda: get_code_assistance(prompt, assistance_type="general")
+    return lambda: generate_text(prompt, "general")
+
+def run_scenario(endpoint, target, history, prompt_chars, concurrency, requests, repeat_prompts=False):
+    """
+    Run one scenario and measure it.
+
+    Args:
+        endpoint: Fake server URL (for upstream call counts)
+        target: 'chat', 'code' or 'text'
+        history: Number of earlier chat messages (chat only)
+        prompt_chars: Size of the prompt in characters
+        concurrency: Number of concurrent callers
+        requests: Total number of calls
+        repeat_prompts: Send the same prompt every time instead of unique prompts
+
+    Returns:
+        Dictionary of latency percentiles, throughput, error, upstream call and hedge counts
+    """
+    # Imported here so the environment set up in main() is seen by the client modules
+    from utils.hedging import get_hedger
+
+    tag = f"{target}-{history}-{prompt_chars}-{concurrency}-{time.time_ns()}"
+    calls = [_make_call(target, history, prompt_chars, tag if repeat_prompts else f"{tag}-{i}")
+             for i in range(requests)]
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def timed(call):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            call()
+        except Exception:
+            with lock:
+                errors += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    before = _upstream_stats(endpoint)
+    hedges_before = get_hedger().stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, calls))
+    wall_time = time.perf_counter() - started
+    after = _upstream_stats(endpoint)
+    hedges_after = get_hedger().stats()
+
+    return {
+        "target": target,
+        "history": history,
+        "prompt_chars": prompt_chars,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "mean": sum(latencies) / len(latencies) if latencies else None,
+        "throughput_rps": len(latencies) / wall_time if wall_time else None,
+        "wall_time": wall_time,
+        "upstream_calls": after["generate"] - before["generate"],
+        "upstream_count_tokens": after["count_tokens"] - before["count_tokens"],
+        "hedged": hedges_after["hedged"] - hedges_before["hedged"],
+        "hedges_won": hedges_after["won"] - hedges_before["won"],
+    }
+
+def _scenario_key(result):
+    return (result["target"], result["history"], result["prompt_chars"], result["concurrency"])
+
+def _change(new, old):
+    if new is None or not old:
+        return "    n/a"
+    return f"{(new - old) / old:+7.1%}"
+
+def compare(results, baseline_path):
+    """
+    Print p95 latency and throughput changes against an earlier results file.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {_scenario_key(r): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline.get('revision', 'unknown')} ({baseline_path}):")
+    print(f"{'scenario':<32} {'p95':>9} {'change':>8} {'rps':>8} {'change':>8}")
+    for result in results:
+        old = previous.get(_scenario_key(result))
+        if old is None:
+            continue
+        name = "{}/h{}/p{}/c{}".format(*_scenario_key(result))
+        print(f"{name:<32} {result['p95'] or 0:>8.3f}s {_change(result['p95'], old['p95']):>8} "
+              f"{result['throughput_rps'] or 0:>8.1f} {_change(result['throughput_rps'], old['throughput_rps']):>8}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the assistant helpers against a fake Gemini API")
+    parser.add_argument("--endpoint", help="URL of a running fake server (default: start one in-process)")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="Comma-separated targets")
+    parser.add_argument("--history", type=_int_list, default=[0, 10, 50], help="Chat history lengths")
+    parser.add_argument("--prompt-sizes", type=_int_list, default=[100, 2000], help="Prompt sizes in characters")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8, 32], help="Concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="Calls per scenario")
+    parser.add_argument("--repeat-prompts", action="store_true",
+                        help="Send identical prompts (measures caching and request coalescing)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake server seconds before the first token")
+    parser.add_argument("--latency-jitter", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--output-tokens", type=int, default=50)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of slow outlier responses")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="Fake server seconds before the first "
+                        "token of outliers")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 429 responses")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Fraction of 5xx responses")
+    parser.add_argument("--output", help="Results file (default: .cache/benchmarks/<revision>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare with")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    server_options = {
+        "latency": args.latency,
+        "latency_jitter": args.latency_jitter,
+        "slow_rate": args.slow_rate,
+        "slow_latency": args.slow_latency,
+        "tokens_per_second": args.tokens_per_second,
+        "output_tokens": args.output_tokens,
+        "error_rate": args.error_rate,
+        "server_error_rate": args.server_error_rate,
+        "retry_after": 0.1,
+        # Every model of the default routing table, so routed calls do not fall back on 404s
+        "models": [
+            os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
+            os.getenv("GEMINI_FAST_MODEL", "gemini-1.5-flash-8b"),
+            os.getenv("GEMINI_DEEP_MODEL", "gemini-1.5-pro"),
+        ],
+    }
+
+    httpd = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        httpd = make_server("127.0.0.1", 0, **server_options)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        endpoint = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    # Fresh caches per run, and no client-side rate limit unless one is configured explicitly
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    os.environ["GEMINI_API_ENDPOINT"] = endpoint
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ["RESPONSE_CACHE_PATH"] = os.path.join(workdir, "responses.sqlite3")
+    os.environ.setdefault("GEMINI_RPM", "1000000")
+    os.environ.setdefault("GEMINI_TPM", "1000000000")
+    # Unique prompts share their filler text; keep near-duplicate cache hits from skewing the results
+    os.environ.setdefault("SEMANTIC_CACHE_THRESHOLD", "1.01")
+
+    scenarios = []
+    for target in args.targets.split(","):
+        histories = args.history if target == "chat" else [0]
+        scenarios += [(target, h, p, c) for h, p, c in product(histories, args.prompt_sizes, args.concurrency)]
+
+    results = []
+    try:
+        for target, history, prompt_chars, concurrency in scenarios:
+            result = run_scenario(endpoint, target, history, prompt_chars, concurrency, args.requests,
+                                  args.repeat_prompts)
+            results.append(result)
+            print(f"{target:<5} history={history:<3} prompt={prompt_chars:<6} concurrency={concurrency:<3} "
+                  f"p50={result['p50'] or 0:.3f}s p95={result['p95'] or 0:.3f}s p99={result['p99'] or 0:.3f}s "
+                  f"rps={result['throughput_rps'] or 0:.1f} upstream={result['upstream_calls']} "
+                  f"errors={result['errors']} hedged={result['hedged']}")
+    finally:
+        if httpd is not None:
+            httpd.shutdown()
+
+    revision = _revision()
+    output = args.output or os.path.join(ROOT, ".cache", "benchmarks", f"{revision}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "revision": revision,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "server": server_options if args.endpoint is None else {"endpoint": endpoint},
+            "requests_per_scenario": args.requests,
+            "repeat_prompts": args.repeat_prompts,
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
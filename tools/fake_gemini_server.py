@@ -0,0 +1,343 @@
+"""
+Local stand-in for the Gemini REST API, for exercising the client's rate
+limiting, retries and circuit breaker, and for benchmarking
+(tools/benchmark.py), without spending quota.
+
+Run it and point the app at it:
+
+    python tools/fake_gemini_server.py --port 8089 --error-rate 0.3 --retry-after 1
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8089 GOOGLE_API_KEY=fake streamlit run app.py
+
+Implements model lookup/listing, generateContent, streamGenerateContent and
+countTokens; generation with a model that is not served fails with 404.
+Responses are delayed by a configurable latency (optionally per model)
+before the first token, with an optional fraction of slow outliers for
+tail latency, and streamed at a configurable token rate. Generation requests
+can fail with injected 429s (with a retry-after hint) and 5xx errors,
+either the first N requests or at random. GET /_stats returns request and
+error counters. Requests for an outline (prompts asking for "the outline
+only", as the long-form text mode sends) are answered with a numbered list
+of sections. Requests for several candidates get that many, each marked
+with its number, up to a configurable maximum (above it they fail with
+400, as with models that do not support candidateCount).
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MODEL_PATH = re.compile(r"^/v1(?:beta)?/models(?:/(?P<model>[^:/]+))?(?::(?P<method>\w+))?$")
+
+ERROR_STATUSES = {
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+}
+
+def _model_info(name):
+    return {
+        "name": f"models/{name}",
+        "displayName": name,
+        "inputTokenLimit": 1048576,
+        "outputTokenLimit": 8192,
+        "supportedGenerationMethods": ["generateContent", "countTokens"],
+    }
+
+def _prompt_text(body):
+    # countTokens wraps the contents in a generateContentRequest
+    body = body.get("generateContentRequest", body)
+    texts = []
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                texts.append(part["text"])
+    return texts
+
+def _count(text):
+    return max(1, len(text) // 4)
+
+class FakeGemini:
+    """
+    Fake upstream behaviour and counters, shared by all request handlers.
+    """
+
+    def __init__(self, models=("gemini-1.5-flash",), fail_first=0, fail_status=429, error_rate=0.0,
+                 server_error_rate=0.0, retry_after=1.0, latency=0.0, latency_jitter=0.0,
+                 tokens_per_second=0.0, output_tokens=None, seed=None, model_latency=None,
+                 slow_rate=0.0, slow_latency=0.0, outline_sections=6, max_candidates=8):
+        self.models = list(models)
+        self.max_candidates = max_candidates
+        self.outline_sections = outline_sections
+        self.latency = latency
+        self.model_latency = dict(model_latency or {})
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.latency_jitter = latency_jitter
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.error_rate = error_rate
+        self.server_error_rate = server_error_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "generate": 0, "count_tokens": 0, "errors": {}}
+
+    def injected_error(self):
+        """
+        Decide whether the next generation request fails, and with which status.
+        """
+        with self._lock:
+            self.stats["generate"] += 1
+            status = None
+            if self.stats["generate"] <= self.fail_first:
+                status = self.fail_status
+            else:
+                roll = self._random.random()
+                if roll < self.error_rate:
+                    status = 429
+                elif roll < self.error_rate + self.server_error_rate:
+                    status = self._random.choice([500, 503])
+            if status is not None:
+                self.stats["errors"][str(status)] = self.stats["errors"].get(str(status), 0) + 1
+            return status
+
+    def first_token_delay(self, model=None):
+        with self._lock:
+            jitter = self._random.uniform(-self.latency_jitter, self.latency_jitter) if self.latency_jitter else 0.0
+            if self.slow_rate and self._random.random() < self.slow_rate:
+                self.stats["slow"] = self.stats.get("slow", 0) + 1
+                return self.slow_latency
+        return max(0.0, self.model_latency.get(model, self.latency) + jitter)
+
+    def token_delay(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def respond(self, body):
+        """
+        Build the response text for a request: an outline for outline
+        requests, otherwise an echo of the last prompt part, or output_tokens
+        filler words if set.
+        """
+        texts = _prompt_text(body)
+        prompt = texts[-1] if texts else ""
+        if "outline only" in prompt:
+            words = []
+            for i in range(1, self.outline_sections + 1):
+                # Words are streamed space-separated; the line break ends each section's line
+                words += f"{i}. Section {i}: part {i} of the document\n".split(" ")
+            return words, sum(_count(t) for t in texts)
+        if self.output_tokens:
+            words = [f"token{i}" for i in range(self.output_tokens)]
+        else:
+            words = f"Fake response to: {prompt[:200]}".split()
+        config = body.get("generationConfig", {})
+        text = " ".join(words)
+        for stop in config.get("stopSequences", []):
+            text = text.split(stop, 1)[0]
+        words = text.split()
+        limit = config.get("maxOutputTokens")
+        if limit:
+            words = words[:limit]
+        return words, sum(_count(t) for t in texts)
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status):
+        error = {"code": status, "message": f"Injected {status} error", "status": ERROR_STATUSES.get(status, "UNKNOWN")}
+        headers = {}
+        if status == 429:
+            delay = self.fake.retry_after
+            error["message"] = f"Resource has been exhausted. Please retry in {delay}s."
+            error["details"] = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{delay}s"}]
+            headers["Retry-After"] = str(delay)
+        self._send_json(status, {"error": error}, headers)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        with self.fake._lock:
+            self.fake.stats["requests"] += 1
+        if url.path == "/_stats":
+            self._send_json(200, self.fake.stats)
+            return
+        match = MODEL_PATH.match(url.path)
+        if not match or match.group("method"):
+            self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+        elif match.group("model"):
+            if match.group("model") in self.fake.models:
+                self._send_json(200, _model_info(match.group("model")))
+            else:
+                self._send_json(404, {"error": {"code": 404, "message": "Model not found", "status": "NOT_FOUND"}})
+        else:
+            self._send_json(200, {"models": [_model_info(name) for name in self.fake.models]})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        with self.fake._lock:
+            self.fake.stats["requests"] += 1
+        match = MODEL_PATH.match(url.path)
+        if not match or not match.group("method"):
+            self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        method = match.group("method")
+
+        if method == "countTokens":
+            with self.fake._lock:
+                self.fake.stats["count_tokens"] += 1
+            self._send_json(200, {"totalTokens": sum(_count(t) for t in _prompt_text(body))})
+            return
+        if method not in ("generateContent", "streamGenerateContent"):
+            self._send_json(404, {"error": {"code": 404, "message": "Unknown method", "status": "NOT_FOUND"}})
+            return
+        if match.group("model") not in self.fake.models:
+            self._send_json(404, {"error": {"code": 404, "message": "Model not found", "status": "NOT_FOUND"}})
+            return
+
+        candidates = body.get("generationConfig", {}).get("candidateCount") or 1
+        if candidates > self.fake.max_candidates:
+            self._send_json(400, {"error": {"code": 400, "message": "candidateCount is not supported",
+                                            "status": "INVALID_ARGUMENT"}})
+            return
+
+        status = self.fake.injected_error()
+        if status is not None:
+            self._send_error(status)
+            return
+
+        words, prompt_tokens = self.fake.respond(body)
+        usage = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": len(words) * candidates,
+                 "totalTokenCount": prompt_tokens + len(words) * candidates}
+        time.sleep(self.fake.first_token_delay(match.group("model")))
+        if method == "generateContent":
+            time.sleep(self.fake.token_delay() * len(words))
+            self._send_json(200, {
+                "candidates": [_candidate(" ".join(_marked(words, i, candidates)), "STOP", i) for i in range(candidates)],
+                "usageMetadata": usage,
+            })
+            return
+        self._stream(words, usage, sse=parse_qs(url.query).get("alt") == ["sse"], candidates=candidates)
+
+    def _stream(self, words, usage, sse, candidates=1):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if sse else "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        marked = [_marked(words, i, candidates) for i in range(candidates)]
+        chunks = [{"candidates": [_candidate(candidate_words[j] + " ", index=i)
+                                  for i, candidate_words in enumerate(marked)]}
+                  for j in range(len(words))]
+        chunks.append({"candidates": [_candidate("", "STOP", i) for i in range(candidates)], "usageMetadata": usage})
+        delay = self.fake.token_delay()
+        for i, chunk in enumerate(chunks):
+            if i and delay:
+                time.sleep(delay)
+            if sse:
+                data = f"data: {json.dumps(chunk)}\r\n\r\n"
+            else:
+                # A JSON array written element by element, as the REST transport expects
+                data = ("[" if i == 0 else ",\r\n") + json.dumps(chunk) + ("]" if i == len(chunks) - 1 else "")
+            self._write_chunk(data.encode("utf-8"))
+        self.wfile.write(b"0\r\n\r\n")
+
+def _marked(words, index, candidates):
+    # Tell candidates apart by a number on their first word
+    if candidates == 1 or not words:
+        return words
+    return [f"[{index + 1}]{words[0]}"] + words[1:]
+
+def _candidate(text, finish_reason=None, index=0):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": index}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    return candidate
+
+def make_server(host="127.0.0.1", port=8089, **options):
+    """
+    Create a fake Gemini server; call serve_forever() on it to run.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+        **options: FakeGemini settings (fail_first, error_rate, retry_after, ...)
+    """
+    handler = type("Handler", (FakeGeminiHandler,), {"fake": FakeGemini(**options)})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Gemini REST API with latency and error injection")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--model", action="append", dest="models", help="Model name to serve (repeatable)")
+    parser.add_argument("--fail-first", type=int, default=0, help="Fail the first N generation requests")
+    parser.add_argument("--fail-status", type=int, default=429, choices=sorted(ERROR_STATUSES))
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Fraction answered with 500/503")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-after hint of 429s in seconds")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first token")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Uniform +/- jitter of the latency")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests that are slow outliers")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="Seconds before the first token of outliers")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="Latency of one model instead of --latency (repeatable)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Streaming rate (0 for no delay)")
+    parser.add_argument("--output-tokens", type=int, help="Fixed response length instead of echoing the prompt")
+    parser.add_argument("--outline-sections", type=int, default=6, help="Sections in answers to outline requests")
+    parser.add_argument("--max-candidates", type=int, default=8,
+                        help="Most candidates per request; more fail with 400 (1 for a model without candidateCount)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    httpd = make_server(
+        args.host, args.port,
+        models=args.models or ["gemini-1.5-flash"],
+        fail_first=args.fail_first,
+        fail_status=args.fail_status,
+        error_rate=args.error_rate,
+        server_error_rate=args.server_error_rate,
+        retry_after=args.retry_after,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        model_latency={name: float(value) for name, value in (item.split("=", 1) for item in args.model_latency)},
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        outline_sections=args.outline_sections,
+        max_candidates=args.max_candidates,
+        seed=args.seed,
+    )
+    print(f"Fake Gemini API on http://{args.host}:{httpd.server_address[1]}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Calibrate the near-duplicate cache threshold on labelled prompt pairs.
+
+Each pair is a prompt that was answered and cached, and a later prompt,
+labelled as a paraphrase (the cached answer is right for it) or not (same
+topic and wording, different request: another length, audience, key,
+language...). All cached prompts share one semantic cache, as in the app,
+and every later prompt is scored against its pair's cached prompt. For each
+threshold the report shows the paraphrases served from the cache and the
+wrong answers served:
+
+    python tools/semantic_calibration.py
+    python tools/semantic_calibration.py --pairs my_pairs.jsonl
+
+A pairs file has one {"cached": "...", "query": "...", "paraphrase": true}
+object per line. SEMANTIC_CACHE_THRESHOLD should be at or above the
+recommended threshold, which serves no wrong answer on the pairs.
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.semantic_cache import SemanticCache, exact_features
+
+# (cached prompt, later prompt, whether the cached answer is right for the later prompt)
+PAIRS = [
+    ("how to sort list of dicts by key python", "How do I sort a list of dictionaries by key in Python?", True),
+    ("How do I reverse a string in Python?", "how to reverse a string in python", True),
+    ("What is the difference between a list and a tuple in Python?",
+     "difference between list and tuple in python?", True),
+    ("How do I read a file line by line in Python?", "Read a file line by line in python", True),
+    ("How can I merge two dictionaries in Python?", "how do i merge two dictionaries in python", True),
+    ("How do I remove duplicates from a list in Python?", "remove duplicates from a python list", True),
+    ("Explain what a closure is in JavaScript", "What is a closure in JavaScript?", True),
+    ("How do I center a div with CSS?", "how to center a div in css", True),
+    ("How to convert a string to an integer in Java?", "Convert string to integer in Java", True),
+    ("How do I check if a key exists in a dictionary in Python?",
+     "check if key exists in python dictionary", True),
+    ("What does the yield keyword do in Python?", "What does yield do in python?", True),
+    ("How do I undo the last git commit?", "how to undo last commit in git", True),
+    ("Explain the difference between processes and threads",
+     "Explain the difference between threads and processes", True),
+    ("Write a haiku about autumn leaves", "Write a haiku about autumn leaves.", True),
+    ("Write a short story about a time traveler who meets his younger self",
+     "write a short story about a time traveller who meets his younger self", True),
+    ("Draft a professional email asking for a project deadline extension",
+     "Draft a professional email requesting an extension of a project deadline", True),
+    ("Explain the technical architecture of a message queue",
+     "explain the technical architecture of message queues", True),
+    ("Write a product description for noise cancelling headphones",
+     "Write a product description for noise-cancelling headphones", True),
+
+    ("How do I sort a list of dictionaries by key in Python?",
+     "How do I sort a list of dictionaries by value in Python?", False),
+    ("How do I reverse a string in Python?", "How do I reverse a string in JavaScript?", False),
+    ("How do I read a file line by line in Python?", "How do I write a file line by line in Python?", False),
+    ("How do I remove duplicates from a list in Python?", "How do I find duplicates in a list in Python?", False),
+    ("How to convert a string to an integer in Java?", "How to convert an integer to a string in Java?", False),
+    ("How do I check if a key exists in a dictionary in Python?",
+     "How do I delete a key from a dictionary in Python?", False),
+    ("How do I undo the last git commit?", "How do I amend the last git commit?", False),
+    ("Sort a list in ascending order in Python", "Sort a list in descending order in Python", False),
+    ("How do I parse JSON in Python?", "How do I parse XML in Python?", False),
+    ("Explain how a hash map works", "Explain how a hash set works", False),
+    ("Write a 100 word summary of the history of the Roman Empire",
+     "Write a 500 word summary of the history of the Roman Empire", False),
+    ("Write a poem about the sea that rhymes", "Write a poem about the sea that does not rhyme", False),
+    ("Write a haiku about autumn leaves", "Write a haiku about spring leaves", False),
+    ("Write a short story about a dragon for children", "Write a short story about a dragon for adults", False),
+    ("Draft a professional email accepting the job offer",
+     "Draft a professional email declining the job offer", False),
+    ("Write a product description for wireless headphones",
+     "Write a product description for wireless earbuds", False),
+    ("Explain the technical architecture of Kafka", "Explain the technical architecture of RabbitMQ", False),
+    ("Write a blog post introduction about remote work benefits",
+     "Write a blog post introduction about remote work drawbacks", False),
+]
+
+THRESHOLDS = [round(0.5 + 0.025 * i, 3) for i in range(19)]
+
+def load_pairs(path):
+    with open(path, encoding="utf-8") as f:
+        return [(p["cached"], p["query"], bool(p["paraphrase"])) for p in map(json.loads, f) if p]
+
+def score_pairs(pairs):
+    """
+    Score every later prompt against its own pair's cached prompt.
+
+    All cached prompts are in one cache, so IDF is as in the app. A pair
+    whose numbers or negations differ can never match and scores 0.
+
+    Returns:
+        List of (similarity to the pair's cached prompt, whether serving it is right) per pair
+    """
+    cache = SemanticCache(threshold=0.0)
+    for i, (cached, _, _) in enumerate(pairs):
+        cache.set(cached, "calibration", i)
+    results = []
+    for i, (_, query, paraphrase) in enumerate(pairs):
+        matches = cache.index.search(query, k=len(pairs), scope=("calibration", exact_features(query)), touch=False)
+        score = next((score for score, (pair, _), _ in matches if pair == i), 0.0)
+        results.append((score, paraphrase))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the near-duplicate cache threshold")
+    parser.add_argument("--pairs", help="JSONL file of labelled pairs (default: the built-in pairs)")
+    args = parser.parse_args(argv)
+
+    pairs = load_pairs(args.pairs) if args.pairs else PAIRS
+    results = score_pairs(pairs)
+    paraphrases = sum(1 for _, _, paraphrase in pairs if paraphrase)
+    print(f"{len(pairs)} pairs, {paraphrases} paraphrases\n")
+    print(f"{'threshold':>9} {'served right':>13} {'served wrong':>13}")
+    recommended = None
+    for threshold in THRESHOLDS:
+        right = sum(1 for score, ok in results if ok and score >= threshold)
+        wrong = sum(1 for score, ok in results if not ok and score >= threshold)
+        print(f"{threshold:>9.3f} {right:>6}/{paraphrases:<6} {wrong:>13}")
+        if wrong == 0 and recommended is None:
+            recommended = threshold
+
+    print("\nScores of the pairs that must not match:")
+    for (cached, query, _), (score, ok) in sorted(zip(pairs, results), key=lambda item: -item[1][0]):
+        if not ok and score >= THRESHOLDS[0]:
+            print(f"  {score:.3f}  {cached!r} -> {query!r}")
+    if recommended is None:
+        print("\nEvery threshold serves a wrong answer; keep the near-duplicate cache off (SEMANTIC_CACHE_THRESHOLD=1.01)")
+    else:
+        print(f"\nLowest threshold serving no wrong answer: {recommended:.3f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Report the import time of the app's entry modules, to track cold start.
+
+Each target module is imported in a fresh interpreter with
+`python -X importtime`, several times, and the fastest run is kept. The
+report shows the total import time of each target, the slowest modules by
+their own import time, and the time per top-level package. Results are
+written to JSON so revisions can be compared:
+
+    python tools/startup_timing.py
+    python tools/startup_timing.py --compare .cache/startup/<older revision>.json
+
+Time spent after import (the Gemini client, the first page render, the
+first import of each tab's module) is shown in the app's admin panel
+(run the app with ADMIN_PANEL=1).
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What a new Streamlit replica imports before the first page renders, plus the other entry points
+TARGETS = ("streamlit", "utils.openai_client", "components.chatbot", "components.code_assistant",
+           "components.text_generator", "server", "cli")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def _revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def parse_importtime(output):
+    """
+    Parse the stderr of `python -X importtime`.
+
+    Returns:
+        List of (module, self seconds, cumulative seconds, depth) in import order
+    """
+    modules = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, int(self_us) / 1e6, int(cumulative_us) / 1e6, len(indent) // 2))
+    return modules
+
+def measure(target, runs=3):
+    """
+    Import a module in fresh interpreters and keep the fastest run.
+
+    Returns:
+        Dictionary with the target's 'total' seconds, wall-clock 'wall' seconds of the
+        interpreter and the parsed 'modules' of the fastest run
+    """
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+            cwd=ROOT, capture_output=True, text=True,
+            # No .env, so results do not depend on local settings
+            env=dict(os.environ, ENV_FILE=os.devnull),
+        )
+        wall = time.perf_counter() - started
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {target} failed:\n{result.stderr[-2000:]}")
+        modules = parse_importtime(result.stderr)
+        total = sum(cumulative for _, _, cumulative, depth in modules if depth == 0)
+        if best is None or total < best["total"]:
+            best = {"total": total, "wall": wall, "modules": modules}
+    return best
+
+def summarize(target, measurement, top=10):
+    """
+    Summarize a measurement: the slowest modules by their own time and the time per top-level package.
+    """
+    packages = {}
+    for name, self_time, _, _ in measurement["modules"]:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + self_time
+    slowest = sorted(measurement["modules"], key=lambda m: m[1], reverse=True)[:top]
+    return {
+        "target": target,
+        "total": measurement["total"],
+        "wall": measurement["wall"],
+        "modules": len(measurement["modules"]),
+        "packages": dict(sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]),
+        "slowest": [{"module": name, "self": self_time, "cumulative": cumulative}
+                    for name, self_time, cumulative, _ in slowest],
+    }
+
+def _change(new, old):
+    if new is None or not old:
+        return "    n/a"
+    return f"{(new - old) / old:+7.1%}"
+
+def compare(results, baseline_path):
+    """
+    Print import time changes against an earlier results file.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {r["target"]: r for r in baseline["results"]}
+    print(f"\nCompared with {baseline.get('revision', 'unknown')} ({baseline_path}):")
+    print(f"{'target':<28} {'import':>9} {'change':>8}")
+    for result in results:
+        old = previous.get(result["target"])
+        if old is None:
+            continue
+        print(f"{result['target']:<28} {result['total']:>8.3f}s {_change(result['total'], old['total']):>8}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Report the import time of the app's entry modules")
+    parser.add_argument("--target", action="append", dest="targets",
+                        help="Module to import (repeatable; default: the app's entry modules)")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per target; the fastest is kept")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest modules and packages shown")
+    parser.add_argument("--output", help="Results file (default: .cache/startup/<revision>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare with")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    results = []
+    for target in args.targets or TARGETS:
+        result = summarize(target, measure(target, args.runs), args.top)
+        results.append(result)
+        print(f"\n{target}: {result['total']:.3f}s import ({result['modules']} modules, "
+              f"{result['wall']:.3f}s interpreter wall time)")
+        print("  by package: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in result["packages"].items()))
+        for module in result["slowest"]:
+            print(f"  {module['self']:>8.3f}s self {module['cumulative']:>8.3f}s cumulative  {module['module']}")
+
+    revision = _revision()
+    output = args.output or os.path.join(ROOT, ".cache", "startup", f"{revision}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "revision": revision,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,378 @@
+import asyncio
+import os
+import queue
+import threading
+
+from utils.resilience import (
+    RETRY_MAX_ATTEMPTS,
+    AsyncRateLimiter,
+    CircuitBreaker,
+    FirstChunkTimeoutError,
+    backoff_delay,
+    is_retryable,
+    retry_after,
+)
+
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "60"))
+# Point the client at another endpoint (e.g. tools/fake_gemini_server.py) over the REST transport
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
+
+# One event loop per process runs every upstream call. The SDK's async client
+# multiplexes all requests over a shared gRPC channel created on this loop, so
+# in-flight requests share connections instead of each holding a thread.
+_loop_lock = threading.Lock()
+_loop = None
+_semaphore = None
+
+# Shared by every upstream call in the process
+_limiter = AsyncRateLimiter()
+# One circuit per model, so an overloaded model does not block fallbacks to another
+_breakers = {}
+_resilience_stats = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0}
+
+_ITEM, _ERROR, _DONE = range(3)
+
+def get_event_loop():
+    """
+    Get the process-wide event loop, starting its background thread on first use.
+    """
+    global _loop, _semaphore
+    if _loop is not None:
+        return _loop
+
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="gemini-event-loop", daemon=True)
+            thread.start()
+            _semaphore = asyncio.run_coroutine_threadsafe(_create_semaphore(), loop).result()
+            _loop = loop
+    return _loop
+
+async def _create_semaphore():
+    return asyncio.Semaphore(MAX_CONCURRENCY)
+
+def _breaker_for(model_name):
+    model_name = model_name.removeprefix("models/")
+    breaker = _breakers.get(model_name)
+    if breaker is None:
+        breaker = _breakers.setdefault(model_name, CircuitBreaker())
+    return breaker
+
+async def _with_first_chunk_deadline(chunks, timeout):
+    # Fail with a timeout if the first chunk does not arrive in time; later chunks are not limited
+    try:
+        first = await asyncio.wait_for(chunks.__anext__(), timeout)
+    except StopAsyncIteration:
+        return
+    except asyncio.TimeoutError as e:
+        raise FirstChunkTimeoutError(timeout) from e
+    yield first
+    async for chunk in chunks:
+        yield chunk
+
+def _estimate_tokens(contents, generation_config=None):
+    # Rough cost for the rate limiter (about 4 characters per token); corrected from usage afterwards
+    if isinstance(contents, str):
+        chars = len(contents)
+    else:
+        chars = sum(len(part) for content in contents for part in content.get("parts", []) if isinstance(part, str))
+    output = (generation_config or {}).get("max_output_tokens") or 0
+    return chars // 4 + output
+
+async def _iterate_in_thread(make_iterator):
+    # The SDK has no async REST transport; read the blocking stream from worker threads instead
+    iterator = iter(await asyncio.to_thread(make_iterator))
+    done = object()
+    while True:
+        chunk = await asyncio.to_thread(next, iterator, done)
+        if chunk is done:
+            return
+        yield chunk
+
+async def _open_stream(model, contents, generation_config, timeout):
+    # The SDK's own retry of 503s is disabled; generate_stream_async owns the retry policy
+    options = {"generation_config": generation_config, "stream": True,
+               "request_options": {"timeout": timeout, "retry": None}}
+    if GEMINI_API_ENDPOINT:
+        async for chunk in _iterate_in_thread(lambda: model.generate_content(contents, **options)):
+            yield chunk
+        return
+    response = await model.generate_content_async(contents, **options)
+    async for chunk in response:
+        yield chunk
+
+async def generate_stream_async(model, contents, generation_config=None, timeout=REQUEST_TIMEOUT, stats=None,
+                                first_chunk_timeout=None, max_attempts=RETRY_MAX_ATTEMPTS):
+    """
+    Stream a generation with the SDK's async API under the global concurrency
+    limit, the shared rate limiter and the model's circuit breaker.
+
+    Transient failures (429, 5xx, timeouts) before the first chunk are retried
+    with jittered exponential backoff that honours the server's retry-after
+    hint. Once chunks have been yielded the call is not retried, so output is
+    never duplicated.
+
+    Args:
+        model: GenerativeModel handle
+        contents: Prompt or list of Gemini contents
+        generation_config: Optional generation settings
+        timeout: Per-call deadline in seconds
+        stats: Optional dictionary to record the number of retries in
+        first_chunk_timeout: Optional seconds to wait for the first chunk; missing it raises
+            FirstChunkTimeoutError without a retry, so the caller can try another model
+        max_attempts: Number of attempts before a transient failure is raised
+
+    Yields:
+        Response chunks as they arrive
+
+    Raises:
+        CircuitOpenError: If the model's circuit breaker is open
+        RateLimitedError: If the rate limiter cannot admit the call in time
+    """
+    estimated = _estimate_tokens(contents, generation_config)
+    breaker = _breaker_for(model.model_name)
+    attempt = 0
+    while True:
+        try:
+            breaker.before_call()
+        except Exception:
+            _resilience_stats["rejected"] += 1
+            raise
+        _resilience_stats["calls"] += 1
+        streamed = False
+        usage = None
+        try:
+            await _limiter.acquire(estimated)
+            async with _semaphore:
+                chunks = _open_stream(model, contents, generation_config, timeout)
+                if first_chunk_timeout:
+                    chunks = _with_first_chunk_deadline(chunks, first_chunk_timeout)
+                async for chunk in chunks:
+                    streamed = True
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    yield chunk
+        except Exception as e:
+            if isinstance(e, FirstChunkTimeoutError) or not is_retryable(e):
+                breaker.release()
+                raise
+            breaker.record_failure()
+            _resilience_stats["failures"] += 1
+            if streamed or attempt + 1 >= max_attempts:
+                raise
+            delay = backoff_delay(attempt, retry_after(e))
+            attempt += 1
+            _resilience_stats["retries"] += 1
+            if stats is not None:
+                stats["retries"] = attempt
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # Cancelled or closed by the consumer; neither a success nor an upstream failure
+            breaker.release()
+            raise
+        breaker.record_success()
+        if usage is not None and getattr(usage, "total_token_count", 0):
+            _limiter.record_usage(estimated, usage.total_token_count)
+        return
+
+async def _cancel(task):
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+
+async def hedged_stream_async(make_stream, delay, may_hedge, outcome=None):
+    """
+    Stream from a request, and from a duplicate if the first chunk is late.
+
+    If the first request has not produced a chunk after delay seconds and
+    may_hedge() allows it, a second request is started. Whichever produces
+    the first chunk wins and is streamed to the end; the other is cancelled.
+    If one fails before producing a chunk, the other is used.
+
+    Args:
+        make_stream: Callable returning a new async generator of chunks for the request
+        delay: Seconds to wait for the first chunk before hedging
+        may_hedge: Callable returning whether a hedge may be sent (e.g. within budget)
+        outcome: Optional dictionary that receives 'hedged', 'winner' ('primary' or 'hedge')
+            and, when hedged, 'decided_at' (seconds from the start until the first chunk)
+
+    Yields:
+        Chunks of the winning request
+    """
+    if outcome is None:
+        outcome = {}
+    outcome.update(hedged=False, winner="primary")
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    streams = {"primary": make_stream()}
+    tasks = {"primary": asyncio.ensure_future(streams["primary"].__anext__())}
+    try:
+        done, _ = await asyncio.wait(tasks.values(), timeout=delay)
+        if not done and may_hedge():
+            outcome["hedged"] = True
+            streams["hedge"] = make_stream()
+            tasks["hedge"] = asyncio.ensure_future(streams["hedge"].__anext__())
+
+        winner, first, error = None, None, None
+        pending = dict(tasks)
+        while pending and winner is None:
+            done, _ = await asyncio.wait(pending.values(), return_when=asyncio.FIRST_COMPLETED)
+            for name, task in list(pending.items()):
+                if task not in done:
+                    continue
+                del pending[name]
+                if winner is not None:
+                    continue
+                try:
+                    first = task.result()
+                    winner = name
+                except StopAsyncIteration:
+                    winner = name
+                except Exception as e:
+                    error = error or e
+        for task in pending.values():
+            await _cancel(task)
+        for name, stream in streams.items():
+            if name != winner:
+                await stream.aclose()
+        if winner is None:
+            raise error
+    except BaseException:
+        for name, task in tasks.items():
+            await _cancel(task)
+            await streams[name].aclose()
+        raise
+
+    outcome["winner"] = winner
+    if outcome["hedged"]:
+        outcome["decided_at"] = loop.time() - started
+    stream = streams[winner]
+    if first is None:
+        return
+    yield first
+    async for chunk in stream:
+        yield chunk
+
+async def count_tokens_async(model, contents, timeout=REQUEST_TIMEOUT, max_attempts=RETRY_MAX_ATTEMPTS):
+    """
+    Count tokens with the model's tokenizer on the shared event loop, under
+    the same concurrency limit, rate limiter, retries and circuit breaker as
+    generate_stream_async().
+
+    Raises:
+        CircuitOpenError: If the model's circuit breaker is open
+        RateLimitedError: If the rate limiter cannot admit the call in time
+    """
+    options = {"request_options": {"timeout": timeout, "retry": None}}
+    breaker = _breaker_for(model.model_name)
+    attempt = 0
+    while True:
+        try:
+            breaker.before_call()
+        except Exception:
+            _resilience_stats["rejected"] += 1
+            raise
+        _resilience_stats["calls"] += 1
+        try:
+            await _limiter.acquire()
+            async with _semaphore:
+                if GEMINI_API_ENDPOINT:
+                    result = await asyncio.to_thread(model.count_tokens, contents, **options)
+                else:
+                    result = await model.count_tokens_async(contents, **options)
+        except Exception as e:
+            if not is_retryable(e):
+                breaker.release()
+                raise
+            breaker.record_failure()
+            _resilience_stats["failures"] += 1
+            if attempt + 1 >= max_attempts:
+                raise
+            delay = backoff_delay(attempt, retry_after(e))
+            attempt += 1
+            _resilience_stats["retries"] += 1
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+        return result
+
+def get_resilience_stats():
+    """
+    Get the shared rate limiter, retry and circuit breaker counters.
+
+    Returns:
+        Dictionary with call, retry, failure and rejection counts, the number
+        of calls queued by the rate limiter, the worst circuit breaker state
+        and the state per model under 'circuits'
+    """
+    circuits = {name: breaker.state for name, breaker in list(_breakers.items())}
+    states = set(circuits.values())
+    circuit = "open" if "open" in states else "half_open" if "half_open" in states else "closed"
+    return dict(_resilience_stats, queued=_limiter.waiting, circuit=circuit, circuits=circuits)
+
+def run_sync(coro, timeout=None):
+    """
+    Run a coroutine on the shared event loop and wait for its result.
+
+    Args:
+        coro: Coroutine to run
+        timeout: Optional seconds to wait before cancelling
+
+    Returns:
+        The coroutine's result
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
+
+def iter_sync(agen):
+    """
+    Consume an async generator on the shared event loop from synchronous code.
+
+    Items are handed over through a queue as they are produced. Closing the
+    returned iterator early (e.g. when the caller stops reading) cancels the
+    upstream task.
+
+    Args:
+        agen: Async generator to consume
+
+    Yields:
+        Items produced by the async generator
+    """
+    loop = get_event_loop()
+    items = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put((_ITEM, item))
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            items.put((_ERROR, e))
+        finally:
+            items.put((_DONE, None))
+
+    future = asyncio.run_coroutine_threadsafe(pump(), loop)
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == _ITEM:
+                yield value
+            elif kind == _ERROR:
+                raise value
+            else:
+                return
+    finally:
+        if not future.done():
+            future.cancel()
@@ -0,0 +1,182 @@
+import csv
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.openai_client import generate_text
+from utils.prompts import enhance_text_prompt
+
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", os.path.join(".cache", "batches"))
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+
+# Optional per-row columns; missing or empty values fall back to the batch defaults
+ROW_FIELDS = ("text_type", "tone", "audience", "context")
+
+def parse_batch_file(filename, data):
+    """
+    Parse an uploaded CSV or JSONL file of prompts.
+
+    Each row needs a 'prompt' and may set 'text_type', 'tone', 'audience'
+    and 'context'. Column names are matched case-insensitively.
+
+    Args:
+        filename: Name of the uploaded file (used to detect the format)
+        data: Raw file contents
+
+    Returns:
+        List of row dictionaries
+
+    Raises:
+        ValueError: If the file cannot be parsed or a row has no prompt
+    """
+    text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+
+    if filename.lower().endswith((".jsonl", ".ndjson")):
+        raw_rows = []
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                raw_rows.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {line_number} is not valid JSON: {e}") from e
+    elif filename.lower().endswith(".csv"):
+        raw_rows = list(csv.DictReader(io.StringIO(text)))
+    else:
+        raise ValueError("Unsupported file type. Upload a .csv or .jsonl file.")
+
+    rows = []
+    for number, raw in enumerate(raw_rows, start=1):
+        if not isinstance(raw, dict):
+            raise ValueError(f"Row {number} must be an object with a 'prompt' field")
+        raw = {str(k).strip().lower(): ("" if v is None else str(v).strip()) for k, v in raw.items()}
+        if not raw.get("prompt"):
+            raise ValueError(f"Row {number} has no prompt")
+        rows.append({"prompt": raw["prompt"], **{field: raw.get(field, "") for field in ROW_FIELDS}})
+    return rows
+
+def batch_output_path(rows, defaults):
+    """
+    Get the JSONL output path for a batch.
+
+    The path is derived from the rows and defaults, so re-running the same
+    upload with the same settings resumes into the same file.
+    """
+    digest = hashlib.sha256(json.dumps([rows, defaults], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(BATCH_OUTPUT_DIR, f"batch-{digest}.jsonl")
+
+def load_completed_rows(output_path):
+    """
+    Get the row numbers already generated successfully in an output file.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from an interrupted run
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["row"])
+    return completed
+
+def _generate_row(row, defaults):
+    text_type = row["text_type"] or defaults.get("text_type", "general")
+    user_request = {
+        "prompt": row["prompt"],
+        "context": row["context"] or defaults.get("context", ""),
+        "audience": row["audience"] or defaults.get("audience", ""),
+        "tone": row["tone"] or defaults.get("tone", ""),
+    }
+    enhanced_prompt = enhance_text_prompt(
+        user_request["prompt"],
+        text_type,
+        user_request["context"],
+        user_request["audience"],
+        user_request["tone"],
+    )
+    response = generate_text(
+        prompt=enhanced_prompt,
+        text_type=text_type,
+        max_tokens=defaults.get("max_tokens", 1000),
+        temperature=defaults.get("temperature", 0.7),
+        user_request=user_request,
+    )
+    if not response:
+        raise RuntimeError("No content was generated")
+    return text_type, response
+
+def run_batch(rows, defaults, output_path, max_workers=BATCH_MAX_WORKERS, on_progress=None):
+    """
+    Generate text for every row with bounded parallelism, appending results to a JSONL file.
+
+    Rows already completed in output_path are skipped, so an interrupted or
+    partially failed batch resumes where it stopped. Failed rows are
+    recorded with their error and retried on the next run.
+
+    Args:
+        rows: Rows from parse_batch_file()
+        defaults: Batch-wide settings (text_type, tone, audience, context, max_tokens, temperature)
+        output_path: JSONL file to append results to
+        max_workers: Maximum number of rows generated concurrently
+        on_progress: Optional callback(done, total, record) called as each row finishes
+
+    Returns:
+        Dictionary with 'total', 'skipped', 'succeeded' and 'failed' counts
+    """
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    completed = load_completed_rows(output_path)
+    pending = [i for i in range(len(rows)) if i not in completed]
+    summary = {"total": len(rows), "skipped": len(completed), "succeeded": 0, "failed": 0}
+    done = len(completed)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        with open(output_path, "a", encoding="utf-8") as out:
+            futures = {executor.submit(_generate_row, rows[i], defaults): i for i in pending}
+            for future in as_completed(futures):
+                i = futures[future]
+                record = {"row": i, "prompt": rows[i]["prompt"]}
+                try:
+                    text_type, response = future.result()
+                    record.update({"text_type": text_type, "status": "ok", "response": response})
+                    summary["succeeded"] += 1
+                except Exception as e:
+                    record.update({"status": "error", "error": str(e)})
+                    summary["failed"] += 1
+
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                done += 1
+                if on_progress:
+                    on_progress(done, len(rows), record)
+    finally:
+        # Do not start queued rows if the run is interrupted; they resume next time
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return summary
+
+def read_batch_results(output_path):
+    """
+    Get the latest successful result for each row, ordered by row number, as JSONL text.
+    """
+    latest = {}
+    if os.path.exists(output_path):
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("status") == "ok":
+                    latest[record["row"]] = record
+    return "".join(json.dumps(latest[row], ensure_ascii=False) + "\n" for row in sorted(latest))
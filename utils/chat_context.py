@@ -0,0 +1,144 @@
+import os
+
+from utils.openai_client import SUMMARY_MAX_TOKENS, count_tokens, summarize_conversation
+from utils.vector_index import HashedTfidfVectorizer, VectorIndex
+
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "4000"))
+CHAT_RETRIEVAL_K = int(os.getenv("CHAT_RETRIEVAL_K", "3"))
+CHAT_RETRIEVAL_TOKENS = int(os.getenv("CHAT_RETRIEVAL_TOKENS", "800"))
+CHAT_RETRIEVAL_MIN_SCORE = float(os.getenv("CHAT_RETRIEVAL_MIN_SCORE", "0.2"))
+CHAT_INDEX_CAPACITY = int(os.getenv("CHAT_INDEX_CAPACITY", "500"))
+
+def new_summary_state(start=0):
+    """
+    Create the rolling summary state for a conversation.
+
+    'covered' is the sequence number of the first message not yet folded into 'text'.
+    """
+    return {"text": "", "covered": start, "tokens": 0}
+
+def new_chat_index():
+    """
+    Create the per-conversation vector index used to recall older messages.
+
+    Uses a smaller feature space and capacity than the prompt cache to keep
+    per-session memory low; older messages are still covered by the summary.
+    """
+    return VectorIndex(capacity=CHAT_INDEX_CAPACITY, vectorizer=HashedTfidfVectorizer(n_features=1024))
+
+def index_message(index, message):
+    """
+    Add a message to the conversation index as it is appended.
+
+    Args:
+        index: Index from new_chat_index()
+        message: Message dictionary with 'content' and 'seq'
+    """
+    index.add(message["content"], message["seq"])
+
+def message_tokens(message):
+    """
+    Get the exact token count of a message, counting it once and caching it on the message.
+    """
+    if message.get("tokens") is None:
+        message["tokens"] = count_tokens(message["content"])
+    return message["tokens"]
+
+def _load(messages, load_messages, start_seq, end_seq):
+    # Messages with start_seq <= seq < end_seq, from memory when held there, else from the loader
+    first_seq = messages[0]["seq"]
+    loaded = load_messages(start_seq, min(end_seq, first_seq)) if load_messages and start_seq < first_seq else []
+    return loaded + [m for m in messages if start_seq <= m["seq"] < end_seq]
+
+def _retrieve(index, messages, load_messages, query, before_seq, k, token_allowance):
+    """
+    Get up to k messages older than before_seq that are most relevant to the
+    query and fit in the token allowance, in conversation order.
+    """
+    results = index.search(query, k=k * 2)
+    selected = []
+    used = 0
+    for score, seq, _ in results:
+        if seq >= before_seq or score < CHAT_RETRIEVAL_MIN_SCORE:
+            continue
+        found = _load(messages, load_messages, seq, seq + 1)
+        if not found:
+            continue
+        tokens = message_tokens(found[0])
+        if used + tokens > token_allowance:
+            continue
+        selected.append(found[0])
+        used += tokens
+        if len(selected) == k:
+            break
+    return sorted(selected, key=lambda m: m["seq"])
+
+def _system_content(system_prompt, summary_text, recalled):
+    content = system_prompt
+    if summary_text:
+        content += f"\n\nSummary of the earlier conversation:\n{summary_text}"
+    if recalled:
+        excerpts = "\n\n".join(f"{m['role'].upper()}: {m['content']}" for m in recalled)
+        content += f"\n\nEarlier messages relevant to the current question:\n{excerpts}"
+    return content
+
+def build_chat_context(messages, summary_state, system_prompt, budget=CHAT_CONTEXT_TOKEN_BUDGET,
+                       index=None, retrieval_k=CHAT_RETRIEVAL_K, load_messages=None):
+    """
+    Assemble the messages to send for the next chat turn within a token budget.
+
+    The most recent messages that fit in the budget are sent verbatim. Older
+    messages are folded into the rolling summary in summary_state, which is
+    updated incrementally: only messages that have newly fallen out of the
+    window are summarized, together with the previous summary. If an index
+    is given, the older messages most relevant to the newest one are also
+    recalled verbatim within a separate token allowance.
+
+    Args:
+        messages: Most recent messages, oldest first, each with a 'seq'; ends with the new user message
+        summary_state: State from new_summary_state(), updated in place
+        system_prompt: System prompt for the assistant
+        budget: Maximum input tokens for the system prompt, summary, recalled and recent messages
+        index: Optional index from new_chat_index() holding the conversation's messages
+        retrieval_k: Maximum number of older messages to recall
+        load_messages: Optional callable(start_seq, end_seq) returning older messages that are
+            not in `messages`; without it, `messages` must hold every unsummarized message
+
+    Returns:
+        List of message dictionaries to send, starting with the system message
+
+    Raises:
+        GeminiError: If counting tokens or updating the summary fails
+    """
+    system_tokens = count_tokens(system_prompt)
+    retrieval_tokens = CHAT_RETRIEVAL_TOKENS if index is not None and retrieval_k else 0
+    available = budget - system_tokens - SUMMARY_MAX_TOKENS - retrieval_tokens
+
+    # Walk back from the newest message while the window fits; the newest message is always sent
+    window_start = len(messages) - 1
+    used = message_tokens(messages[window_start])
+    while window_start > 0 and messages[window_start - 1]["seq"] >= summary_state["covered"]:
+        tokens = message_tokens(messages[window_start - 1])
+        if used + tokens > available:
+            break
+        used += tokens
+        window_start -= 1
+
+    # Start the window on a user turn
+    while window_start < len(messages) - 1 and messages[window_start]["role"] != "user":
+        window_start += 1
+    window_start_seq = messages[window_start]["seq"]
+
+    dropped = _load(messages, load_messages, summary_state["covered"], window_start_seq)
+    if dropped:
+        summary_state["text"] = summarize_conversation(summary_state["text"], dropped)
+        summary_state["tokens"] = count_tokens(summary_state["text"])
+    summary_state["covered"] = max(summary_state["covered"], window_start_seq)
+
+    recalled = []
+    if retrieval_tokens:
+        recalled = _retrieve(index, messages, load_messages, messages[-1]["content"], window_start_seq,
+                             retrieval_k, retrieval_tokens)
+
+    system_message = {"role": "system", "content": _system_content(system_prompt, summary_state["text"], recalled)}
+    return [system_message] + [{"role": m["role"], "content": m["content"]} for m in messages[window_start:]]
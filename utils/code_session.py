@@ -0,0 +1,88 @@
+import difflib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.openai_client import GeminiError, summarize_conversation
+
+# Send the full code instead of a diff when the diff is larger than this fraction of the code
+CODE_DIFF_MAX_RATIO = float(os.getenv("CODE_DIFF_MAX_RATIO", "0.4"))
+# Longest answer folded into the session summary
+CODE_SUMMARY_ANSWER_CHARS = 4000
+
+# Summaries are updated in the background after each answer, off the next question's critical path
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="code-session-summary")
+
+def new_code_session():
+    """
+    Create the state of a multi-turn code session.
+
+    'code' is the code context sent with the previous question, 'summary' the
+    rolling summary of earlier questions and answers, 'unsummarized' the
+    messages of the turns not yet folded into it, and 'pending' the summary
+    update still running in the background, over the first 'submitted' of them.
+    """
+    return {"code": None, "summary": "", "turns": 0, "unsummarized": [], "pending": None, "submitted": 0}
+
+def code_diff(previous, current):
+    """
+    Get a unified diff from the previous to the current code.
+    """
+    return "".join(difflib.unified_diff(
+        previous.splitlines(keepends=True),
+        current.splitlines(keepends=True),
+        fromfile="previous",
+        tofile="current",
+    ))
+
+def plan_code_turn(session, code_context):
+    """
+    Decide how to send the code context of the next question in a session.
+
+    The first question sends the full code. Later questions send a unified
+    diff against the code of the previous question, or the full code again
+    when the diff is larger than CODE_DIFF_MAX_RATIO of it.
+
+    Returns:
+        None to send the full code, '' if the code is unchanged, or the diff text
+    """
+    previous = session["code"]
+    if previous is None or not code_context.strip():
+        return None
+    if previous == code_context:
+        return ""
+    diff = code_diff(previous, code_context)
+    if len(diff) > CODE_DIFF_MAX_RATIO * len(code_context):
+        return None
+    return diff
+
+def session_summary(session):
+    """
+    Get the session's Q&A summary, waiting for a background update still in progress.
+    """
+    pending = session["pending"]
+    if pending is not None:
+        try:
+            session["summary"] = pending.result()
+            del session["unsummarized"][:session["submitted"]]
+        except GeminiError:
+            # Keep the previous summary and the turns; they are folded in with the next turn's
+            pass
+        session["pending"] = None
+        session["submitted"] = 0
+    return session["summary"]
+
+def record_code_turn(session, code_context, code_query, response):
+    """
+    Record a finished question in the session and start folding it, with any
+    turns an earlier update failed to fold in, into the summary.
+    """
+    previous_summary = session_summary(session)
+    if len(response) > CODE_SUMMARY_ANSWER_CHARS:
+        response = response[:CODE_SUMMARY_ANSWER_CHARS] + "..."
+    session["unsummarized"] += [{"role": "user", "content": code_query}, {"role": "assistant", "content": response}]
+    session["code"] = code_context
+    session["turns"] += 1
+    session["submitted"] = len(session["unsummarized"])
+    session["pending"] = _summary_executor.submit(
+        summarize_conversation, previous_summary, list(session["unsummarized"])
+    )
@@ -0,0 +1,196 @@
+import ast
+import hashlib
+import os
+import re
+
+CODE_UNIT_MAX_CHARS = int(os.getenv("CODE_UNIT_MAX_CHARS", "6000"))
+# Maximum number of units (and so of analysis calls) per request; units are packed larger to stay under it
+CODE_MAX_UNITS = int(os.getenv("CODE_MAX_UNITS", "8"))
+
+# Top-level declarations in the languages of the Code Assistant's language dropdown
+DECLARATION = re.compile(
+    r"^(?:(?:export|default|public|private|protected|internal|static|abstract|final|sealed|open|data|async|"
+    r"unsafe|extern|inline|virtual|override|partial|pub(?:\([^)]*\))?)\s+)*"
+    r"(?:function\*?|class|interface|struct|enum|impl|trait|fn|func|def|fun|object|module|namespace|record|"
+    r"protocol|extension|type|const|let|var|val)\s+([\w$.:]+)"
+)
+CLOSING_LINE = re.compile(r"^(?:end\b|[}\])])")
+ATTACHED_LINE = re.compile(r"^(?:@|#\[|//|/\*|\*|#)")
+
+def _unit(name, kind, lines, start, end):
+    code = "".join(lines[start - 1:end])
+    return {
+        "name": name,
+        "kind": kind,
+        "start_line": start,
+        "end_line": end,
+        "code": code,
+        "hash": hashlib.sha256(code.encode("utf-8")).hexdigest(),
+    }
+
+def _python_units(code, max_chars):
+    tree = ast.parse(code)
+    lines = code.splitlines(keepends=True)
+    units = []
+    module_start = None
+    previous_end = 0
+
+    def flush_module(end):
+        nonlocal module_start
+        if module_start is not None:
+            units.append(_unit("module code", "module", lines, module_start, end))
+            module_start = None
+
+    for node in tree.body:
+        # Each unit also covers the comments and blank lines above it
+        start = previous_end + 1
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            flush_module(previous_end)
+            kind = "class" if isinstance(node, ast.ClassDef) else "function"
+            unit = _unit(node.name, kind, lines, start, node.end_lineno)
+            if kind == "class" and len(unit["code"]) > max_chars:
+                units.extend(_python_class_units(node, lines, start))
+            else:
+                units.append(unit)
+        elif module_start is None:
+            module_start = start
+        previous_end = node.end_lineno
+    flush_module(previous_end)
+
+    if units and previous_end < len(lines):
+        last = units[-1]
+        units[-1] = _unit(last["name"], last["kind"], lines, last["start_line"], len(lines))
+    return units
+
+def _python_class_units(node, lines, start):
+    # A large class is analyzed method by method; the header (bases, docstring, attributes) is its own unit
+    methods = [n for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    if not methods:
+        return [_unit(node.name, "class", lines, start, node.end_lineno)]
+    units = []
+    first = min([methods[0].lineno] + [d.lineno for d in methods[0].decorator_list])
+    units.append(_unit(node.name, "class", lines, start, first - 1))
+    previous_end = first - 1
+    for method in methods:
+        end = method.end_lineno
+        units.append(_unit(f"{node.name}.{method.name}", "method", lines, previous_end + 1, end))
+        previous_end = end
+    if previous_end < node.end_lineno:
+        last = units[-1]
+        units[-1] = _unit(last["name"], last["kind"], lines, last["start_line"], node.end_lineno)
+    return units
+
+def _segment_starts(lines):
+    """
+    Find the lines that start a top-level construct: unindented lines at brace
+    depth zero, moved up over comments and annotations directly above them.
+    """
+    starts = []
+    depth = 0
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if depth == 0 and stripped and not line[0].isspace() and not CLOSING_LINE.match(stripped) \
+                and not ATTACHED_LINE.match(stripped):
+            start = i
+            while start > 0 and lines[start - 1].strip() and ATTACHED_LINE.match(lines[start - 1].strip()):
+                start -= 1
+            if not starts or start > starts[-1]:
+                starts.append(start)
+        depth = max(0, depth + line.count("{") - line.count("}"))
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return starts
+
+def _heuristic_units(code, max_chars):
+    lines = code.splitlines(keepends=True)
+    starts = _segment_starts(lines) + [len(lines)]
+    segments = [(starts[i], starts[i + 1]) for i in range(len(starts) - 1) if starts[i] < starts[i + 1]]
+
+    # Pack consecutive segments up to max_chars, so small declarations are analyzed together
+    units = []
+    group_start = group_end = None
+    size = 0
+    for start, end in segments:
+        length = sum(len(line) for line in lines[start:end])
+        if group_start is not None and size + length > max_chars:
+            units.append(_heuristic_unit(lines, group_start, group_end))
+            group_start = None
+        if group_start is None:
+            group_start, size = start, 0
+        group_end = end
+        size += length
+    if group_start is not None:
+        units.append(_heuristic_unit(lines, group_start, group_end))
+    return units
+
+def _pack_units(units, lines, max_chars):
+    # Merge runs of adjacent units up to max_chars, as _heuristic_units does with segments
+    packed = []
+    group = []
+    size = 0
+    for unit in units:
+        length = len(unit["code"])
+        if group and size + length > max_chars:
+            packed.append(_group_unit(group, lines))
+            group, size = [], 0
+        group.append(unit)
+        size += length
+    if group:
+        packed.append(_group_unit(group, lines))
+    return packed
+
+def _group_unit(group, lines):
+    if len(group) == 1:
+        return group[0]
+    names = [unit["name"] for unit in group]
+    name = ", ".join(names[:3]) + (", ..." if len(names) > 3 else "")
+    return _unit(name, "block", lines, group[0]["start_line"], group[-1]["end_line"])
+
+def _heuristic_unit(lines, start, end):
+    names = []
+    for line in lines[start:end]:
+        match = DECLARATION.match(line)
+        if match and not line[0].isspace():
+            names.append(match.group(1))
+    name = ", ".join(names[:3]) + (", ..." if len(names) > 3 else "") if names else f"lines {start + 1}-{end}"
+    return _unit(name, "block", lines, start + 1, end)
+
+def split_code_units(code, language="", max_chars=CODE_UNIT_MAX_CHARS, max_units=CODE_MAX_UNITS):
+    """
+    Split source code into function- and class-level units for separate analysis.
+
+    Python is split with the ast module into top-level functions, classes
+    (large ones method by method) and module-level code. Other languages, or
+    Python that does not parse, are split heuristically at top-level
+    declarations. Adjacent units are packed together up to max_chars, and
+    more loosely if that still leaves more than max_units units, so each
+    request makes a bounded number of analysis calls.
+
+    Args:
+        code: Source code
+        language: Language name from the Code Assistant dropdown (may be empty)
+        max_chars: Size above which classes are split and up to which units are packed
+        max_units: Maximum number of units returned
+
+    Returns:
+        List of unit dictionaries with 'name', 'kind', 'start_line', 'end_line', 'code' and 'hash',
+        covering the whole code in order
+    """
+    if not code.strip():
+        return []
+    units = []
+    if language in ("", "Python"):
+        try:
+            units = _python_units(code, max_chars)
+        except SyntaxError:
+            pass
+    if not units:
+        units = _heuristic_units(code, max_chars)
+
+    lines = code.splitlines(keepends=True)
+    packed = _pack_units(units, lines, max_chars)
+    limit = max_chars
+    while len(packed) > max(1, max_units):
+        limit = int(limit * 1.5) + 1
+        packed = _pack_units(units, lines, limit)
+    return packed
@@ -0,0 +1,24 @@
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV_FILE = os.getenv("ENV_FILE", os.path.join(ROOT, ".env"))
+
+_loaded = False
+
+def load_env():
+    """
+    Load ENV_FILE into the environment, overriding variables already set.
+
+    Runs once per process; python-dotenv is only imported if the file
+    exists. Entry points import this module before any module that reads
+    its settings from the environment at import time.
+    """
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    if os.path.exists(ENV_FILE):
+        from dotenv import load_dotenv
+        load_dotenv(ENV_FILE, override=True)
+
+load_env()
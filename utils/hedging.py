@@ -0,0 +1,122 @@
+import os
+import threading
+from collections import deque
+
+from utils.metrics import get_metrics
+
+HEDGING_ENABLED = os.getenv("GEMINI_HEDGING", "0").lower() in ("1", "true", "yes")
+# Calls (by label) that may be hedged
+HEDGE_LABELS = frozenset(filter(None, os.getenv("GEMINI_HEDGE_LABELS", "text,code").split(",")))
+# Hedge when no first token arrived within this percentile of recent times to first token
+HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95"))
+# Fraction of calls that may be hedged, and how many unused hedges can be saved up for a burst
+HEDGE_BUDGET = float(os.getenv("GEMINI_HEDGE_BUDGET", "0.05"))
+HEDGE_BUDGET_BURST = 5.0
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = 0.05
+
+class Hedger:
+    """
+    Decide when to hedge a call and keep the hedging counters.
+
+    The hedge deadline of a label is a percentile of its recent times to
+    first token; no call is hedged until HEDGE_MIN_SAMPLES are known. Each
+    eligible call adds HEDGE_BUDGET to a budget (up to HEDGE_BUDGET_BURST)
+    and each hedge spends one, so hedges stay a small fraction of traffic.
+    """
+
+    def __init__(self, enabled=HEDGING_ENABLED, labels=HEDGE_LABELS, percentile=HEDGE_PERCENTILE,
+                 budget=HEDGE_BUDGET):
+        self.enabled = enabled
+        self.labels = labels
+        self.percentile = percentile
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._samples = {}
+        self._stats = {"eligible": 0, "hedged": 0, "won": 0, "denied": 0, "saved_seconds": 0.0}
+
+    def deadline(self, label):
+        """
+        Start an eligible call: add to the budget and get its hedge deadline.
+
+        Returns:
+            Seconds to wait for the first token before hedging, or None to not hedge
+        """
+        if not self.enabled or label not in self.labels:
+            return None
+        with self._lock:
+            self._stats["eligible"] += 1
+            self._tokens = min(HEDGE_BUDGET_BURST, self._tokens + self.budget)
+            samples = self._samples.get(label)
+            if samples is None or len(samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(HEDGE_MIN_DELAY, ordered[index])
+
+    def try_hedge(self, label):
+        """
+        Spend one hedge from the budget.
+
+        Returns:
+            True if the hedge may be sent
+        """
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self._stats["hedged"] += 1
+                result = "hedged"
+            else:
+                self._stats["denied"] += 1
+                result = "denied"
+        get_metrics().inc("assistant_hedges_total", (label, result), label_names=("label", "result"))
+        return result == "hedged"
+
+    def record(self, label, ttft, outcome=None):
+        """
+        Record the time to first token of a finished call and, if it was
+        hedged, which request won.
+
+        When the hedge wins, the original request is cancelled, so its own
+        time to first token is unknown. The time saved is estimated as the
+        mean of the recent samples slower than the moment the hedge won,
+        minus that moment.
+        """
+        if label not in self.labels or ttft is None:
+            return
+        saved = None
+        with self._lock:
+            samples = self._samples.setdefault(label, deque(maxlen=HEDGE_WINDOW))
+            if outcome and outcome.get("winner") == "hedge":
+                decided = outcome["decided_at"]
+                slower = [s for s in samples if s > decided]
+                saved = (sum(slower) / len(slower) - decided) if slower else 0.0
+                self._stats["won"] += 1
+                self._stats["saved_seconds"] += saved
+            samples.append(ttft)
+        if saved is not None:
+            metrics = get_metrics()
+            metrics.inc("assistant_hedges_total", (label, "won"), label_names=("label", "result"))
+            metrics.inc("assistant_hedge_saved_seconds_total", (label,), saved, label_names=("label",))
+
+    def stats(self):
+        """
+        Get the hedging counters.
+
+        Returns:
+            Dictionary with 'enabled', the number of 'eligible' calls, hedges sent
+            ('hedged'), won by the hedge ('won') and refused by the budget ('denied'),
+            and the estimated tail latency 'saved_seconds'
+        """
+        with self._lock:
+            return dict(self._stats, enabled=self.enabled)
+
+_hedger = Hedger()
+
+def get_hedger():
+    """
+    Get the process-wide hedger.
+    """
+    return _hedger
@@ -0,0 +1,208 @@
+import hashlib
+import os
+import sys
+import threading
+import weakref
+import zlib
+
+# Text fields at least this long are compressed once their entry is no longer the newest
+HISTORY_COMPRESS_MIN_CHARS = int(os.getenv("HISTORY_COMPRESS_MIN_CHARS", "1024"))
+# Number of newest entries per session kept uncompressed
+HISTORY_UNCOMPRESSED = int(os.getenv("HISTORY_UNCOMPRESSED", "1"))
+# Memory cap per session history; the oldest entries are dropped from memory (they stay in the store)
+HISTORY_MAX_BYTES = int(os.getenv("HISTORY_MAX_BYTES", str(2 * 1024 * 1024)))
+
+# Every live session history in the process, for memory accounting
+_histories_lock = threading.Lock()
+_histories = weakref.WeakSet()
+
+def _size(value):
+    # Approximate memory of a field value, including the contents of small containers
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_size(k) + _size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_size(v) for v in value)
+    return size
+
+def _text_property(name):
+    slot = f"_{name}"
+
+    def get(self):
+        value = getattr(self, slot)
+        return zlib.decompress(value).decode("utf-8") if isinstance(value, bytes) else value
+
+    def set(self, value):
+        setattr(self, slot, value or "")
+
+    return property(get, set)
+
+class HistoryRecord:
+    """
+    Base class of the slotted history entries kept in session memory.
+
+    FIELDS are small values (interned if they are strings); TEXT_FIELDS are
+    the large texts, which compress() stores zlib-compressed and the
+    properties decompress transparently on access.
+    """
+
+    __slots__ = ()
+    FIELDS = ()
+    TEXT_FIELDS = ()
+
+    def __init__(self, **values):
+        for name in self.FIELDS:
+            value = values.get(name)
+            setattr(self, name, sys.intern(value) if isinstance(value, str) else value)
+        for name in self.TEXT_FIELDS:
+            setattr(self, f"_{name}", values.get(name) or "")
+
+    @classmethod
+    def from_dict(cls, payload):
+        """
+        Create a record from a stored payload, ignoring unknown keys.
+        """
+        return cls(**{name: payload.get(name) for name in cls.FIELDS + cls.TEXT_FIELDS})
+
+    def to_dict(self):
+        """
+        Get the record as a plain dictionary, as stored in the conversation store.
+        """
+        return {name: getattr(self, name) for name in self.TEXT_FIELDS + self.FIELDS}
+
+    def compress(self):
+        """
+        Compress the large text fields in place.
+        """
+        for name in self.TEXT_FIELDS:
+            value = getattr(self, f"_{name}")
+            if isinstance(value, str) and len(value) >= HISTORY_COMPRESS_MIN_CHARS:
+                setattr(self, f"_{name}", zlib.compress(value.encode("utf-8"), 6))
+
+    @property
+    def compressed(self):
+        return any(isinstance(getattr(self, f"_{name}"), bytes) for name in self.TEXT_FIELDS)
+
+    def sizeof(self):
+        """
+        Approximate memory held by the record in bytes.
+        """
+        size = sys.getsizeof(self)
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if not (isinstance(value, str) and sys.intern(value) is value):
+                size += _size(value)
+        for name in self.TEXT_FIELDS:
+            size += _size(getattr(self, f"_{name}"))
+        return size
+
+class CodeInteraction(HistoryRecord):
+    """
+    One Code Assistant question and answer.
+    """
+
+    FIELDS = ("language", "type", "timing", "stopped")
+    TEXT_FIELDS = ("query", "context", "response")
+    __slots__ = FIELDS + tuple(f"_{name}" for name in TEXT_FIELDS)
+
+    query = _text_property("query")
+    context = _text_property("context")
+    response = _text_property("response")
+
+class TextGeneration(HistoryRecord):
+    """
+    One Text Generator prompt and generated content.
+    """
+
+    FIELDS = ("type", "audience", "tone", "settings", "timing", "stopped", "variant")
+    TEXT_FIELDS = ("prompt", "context", "response")
+    __slots__ = FIELDS + tuple(f"_{name}" for name in TEXT_FIELDS)
+
+    prompt = _text_property("prompt")
+    context = _text_property("context")
+    response = _text_property("response")
+
+class SessionHistory:
+    """
+    The recent history entries of one session and tab, in order.
+
+    Keeps at most `window` entries and `max_bytes` of memory, dropping the
+    oldest first (the conversation store keeps everything). All but the
+    newest HISTORY_UNCOMPRESSED entries have their large texts compressed.
+    """
+
+    __slots__ = ("owner", "kind", "window", "max_bytes", "_records", "__weakref__")
+
+    def __init__(self, owner, kind, window, records=(), max_bytes=HISTORY_MAX_BYTES):
+        self.owner = owner
+        self.kind = kind
+        self.window = window
+        self.max_bytes = max_bytes
+        self._records = list(records)
+        self._trim()
+        with _histories_lock:
+            _histories.add(self)
+
+    def _trim(self):
+        del self._records[:-self.window or len(self._records)]
+        for record in self._records[:-HISTORY_UNCOMPRESSED or len(self._records)]:
+            record.compress()
+        while len(self._records) > 1 and self.memory() > self.max_bytes:
+            del self._records[0]
+
+    def append(self, record):
+        """
+        Add a new entry, then apply the caps and compress older entries.
+        """
+        self._records.append(record)
+        self._trim()
+
+    def clear(self):
+        self._records.clear()
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __reversed__(self):
+        return reversed(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def memory(self):
+        """
+        Approximate memory held by the entries in bytes.
+        """
+        return sys.getsizeof(self._records) + sum(record.sizeof() for record in self._records)
+
+    def stats(self):
+        """
+        Get the session's entry count, memory and number of compressed entries.
+
+        The session is identified by a short hash of its conversation id, which
+        tells sessions apart without exposing the id (it resumes the conversation).
+        """
+        return {
+            "session": hashlib.sha256(str(self.owner).encode("utf-8")).hexdigest()[:10],
+            "kind": self.kind,
+            "entries": len(self._records),
+            "compressed": sum(1 for record in self._records if record.compressed),
+            "bytes": self.memory(),
+        }
+
+def get_history_memory():
+    """
+    Get the memory held by the history of every live session.
+
+    Returns:
+        Dictionary with per-history 'sessions' rows (largest first), the number of
+        'entries' and the 'total_bytes'
+    """
+    with _histories_lock:
+        histories = list(_histories)
+    rows = sorted((history.stats() for history in histories), key=lambda row: row["bytes"], reverse=True)
+    return {
+        "sessions": rows,
+        "entries": sum(row["entries"] for row in rows),
+        "total_bytes": sum(row["bytes"] for row in rows),
+    }
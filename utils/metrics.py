@@ -0,0 +1,254 @@
+import bisect
+import os
+import threading
+import time
+
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", "15"))
+
+# Upper bounds in seconds; the last bucket (+Inf) is implicit
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+CALL_LABELS = ("tab", "type", "model")
+
+METRICS = {
+    "assistant_requests_total": ("counter", "Calls by outcome (ok, error, cancelled)"),
+    "assistant_request_duration_seconds": ("histogram", "Total call latency, excluding cache hits"),
+    "assistant_ttft_seconds": ("histogram", "Time to first token, excluding cache hits"),
+    "assistant_prompt_tokens_total": ("counter", "Prompt tokens reported by the API"),
+    "assistant_output_tokens_total": ("counter", "Output tokens reported by the API"),
+    "assistant_retries_total": ("counter", "Retries of transient upstream failures"),
+    "assistant_errors_total": ("counter", "Failed calls by error type"),
+    "assistant_cache_total": ("counter", "Calls by cache result (hit, semantic_hit, miss, bypass, coalesced)"),
+    "assistant_route_decisions_total": ("counter", "Model chosen first by the router, by route and reason"),
+    "assistant_fallbacks_total": ("counter", "Fallbacks from one model of a route to the next"),
+    "assistant_hedges_total": ("counter", "Hedged calls by result (hedged, denied by the budget, won by the hedge)"),
+    "assistant_hedge_saved_seconds_total": ("counter", "Estimated time to first token saved by hedges that won"),
+}
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+class MetricsRegistry:
+    """
+    In-process counters and latency histograms for the assistant's calls.
+
+    Series are keyed by metric name and label values. The registry renders
+    the Prometheus text exposition format and per-label summaries with
+    estimated percentiles for the admin panel.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._label_names = {}
+
+    def inc(self, name, labels, value=1, label_names=CALL_LABELS):
+        with self._lock:
+            self._label_names.setdefault(name, label_names)
+            key = (name, tuple(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, label_names=CALL_LABELS):
+        with self._lock:
+            self._label_names.setdefault(name, label_names)
+            key = (name, tuple(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(len(self.buckets) + 1)
+            histogram.counts[bisect.bisect_left(self.buckets, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def record_call(self, tab, kind, model, outcome, duration, stats, error=None):
+        """
+        Record one call to a public client helper.
+
+        Args:
+            tab: Tab the call belongs to ('chat', 'code', 'text')
+            kind: assistance_type or text_type of the call ('' for chat)
+            model: Model name
+            outcome: 'ok', 'error' or 'cancelled'
+            duration: Wall-clock seconds of the call
+            stats: The call's stats dictionary (ttft, usage, retries, cache, coalesced)
+            error: Name of the error type if the call failed
+        """
+        labels = (tab, kind or "", model or "")
+        self.inc("assistant_requests_total", labels + (outcome,), label_names=CALL_LABELS + ("outcome",))
+
+        cache = stats.get("cache")
+        if stats.get("coalesced"):
+            cache = "coalesced"
+        if cache:
+            self.inc("assistant_cache_total", labels + (cache,), label_names=CALL_LABELS + ("result",))
+
+        if outcome == "ok" and cache not in ("hit", "semantic_hit"):
+            self.observe("assistant_request_duration_seconds", labels, duration)
+            if stats.get("ttft") is not None:
+                self.observe("assistant_ttft_seconds", labels, stats["ttft"])
+
+        usage = stats.get("usage")
+        if usage and not stats.get("coalesced"):
+            self.inc("assistant_prompt_tokens_total", labels, usage.get("prompt_tokens") or 0)
+            self.inc("assistant_output_tokens_total", labels, usage.get("output_tokens") or 0)
+        if stats.get("retries"):
+            self.inc("assistant_retries_total", labels, stats["retries"])
+        if error:
+            self.inc("assistant_errors_total", labels + (error,), label_names=CALL_LABELS + ("error",))
+
+    def render_prometheus(self):
+        """
+        Render every series in the Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            label_names = dict(self._label_names)
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            names = label_names.get(name, CALL_LABELS)
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == "counter":
+                for (series, labels), value in sorted(counters.items()):
+                    if series == name:
+                        lines.append(f"{name}{_format_labels(names, labels)} {value}")
+                continue
+            for (series, labels), (counts, total, count) in sorted(histograms.items()):
+                if series != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bucket_labels = _format_labels(names, labels, 'le="%s"' % le)
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(names, labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(names, labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def _percentile(self, counts, count, q):
+        # Linear interpolation within the bucket holding the q-th observation
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets + (self.buckets[-1],), counts):
+            if bucket_count and seen + bucket_count >= rank:
+                return lower + (bound - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = bound
+        return self.buckets[-1]
+
+    def summary(self):
+        """
+        Summarize the metrics per (tab, type, model).
+
+        Returns:
+            List of dictionaries with request, error, cache hit and token counts,
+            retries, and estimated p50/p95 latency and time to first token
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h.counts), h.count) for key, h in self._histograms.items()}
+
+        rows = {}
+
+        def row(labels):
+            labels = labels[:3]
+            if labels not in rows:
+                rows[labels] = {"tab": labels[0], "type": labels[1], "model": labels[2], "requests": 0,
+                                "errors": 0, "cache_hits": 0, "retries": 0, "prompt_tokens": 0,
+                                "output_tokens": 0}
+            return rows[labels]
+
+        for (name, labels), value in counters.items():
+            if name == "assistant_requests_total":
+                row(labels)["requests"] += value
+            elif name == "assistant_errors_total":
+                row(labels)["errors"] += value
+            elif name == "assistant_cache_total" and labels[3] in ("hit", "semantic_hit", "coalesced"):
+                row(labels)["cache_hits"] += value
+            elif name == "assistant_retries_total":
+                row(labels)["retries"] += value
+            elif name == "assistant_prompt_tokens_total":
+                row(labels)["prompt_tokens"] += value
+            elif name == "assistant_output_tokens_total":
+                row(labels)["output_tokens"] += value
+
+        for (name, labels), (counts, count) in histograms.items():
+            prefix = "latency" if name == "assistant_request_duration_seconds" else "ttft"
+            entry = row(labels)
+            entry[f"{prefix}_p50"] = self._percentile(counts, count, 0.5)
+            entry[f"{prefix}_p95"] = self._percentile(counts, count, 0.95)
+
+        return sorted(rows.values(), key=lambda r: (r["tab"], r["type"], r["model"]))
+
+    def dump(self, path):
+        """
+        Write the Prometheus text to a file atomically (e.g. for node_exporter's textfile collector).
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(temporary, path)
+
+_metrics = MetricsRegistry()
+_dump_lock = threading.Lock()
+_dump_thread = None
+
+def get_metrics():
+    """
+    Get the process-wide metrics registry.
+    """
+    return _metrics
+
+def _dump_loop(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            _metrics.dump(path)
+        except OSError:
+            pass
+
+def start_metrics_dump(path=None, interval=None):
+    """
+    Start the background thread that periodically writes the metrics to a
+    file. Does nothing unless a path is given or METRICS_FILE is set; only
+    one thread is started per process.
+    """
+    global _dump_thread
+    path = path or METRICS_FILE
+    if not path:
+        return
+    with _dump_lock:
+        if _dump_thread is not None and _dump_thread.is_alive():
+            return
+        _dump_thread = threading.Thread(
+            target=_dump_loop,
+            args=(path, interval or METRICS_DUMP_INTERVAL),
+            name="metrics-dump",
+            daemon=True,
+        )
+        _dump_thread.start()
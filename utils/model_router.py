@@ -0,0 +1,244 @@
+import json
+import os
+import threading
+import time
+
+from utils.metrics import get_metrics
+from utils.resilience import CircuitOpenError, RateLimitedError, is_retryable, status_code
+
+ROUTING_ENABLED = os.getenv("GEMINI_ROUTING", "1").lower() not in ("0", "false", "no")
+# Model aliases used in the routing table; "standard" is the discovered GEMINI_MODEL
+FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-1.5-flash-8b")
+DEEP_MODEL = os.getenv("GEMINI_DEEP_MODEL", "gemini-1.5-pro")
+# Optional JSON file with a routing table replacing DEFAULT_ROUTES
+ROUTING_TABLE_FILE = os.getenv("GEMINI_ROUTING_TABLE", "")
+# A model that does not send its first token within this multiple of the route's SLO is abandoned
+# for the next one
+ROUTER_TIMEOUT_FACTOR = float(os.getenv("GEMINI_ROUTER_TIMEOUT_FACTOR", "3"))
+# Seconds a model is skipped after ROUTER_COOLDOWN_FAILURES failed calls in a row (each after its
+# retries), or at once after a not-found error or with its circuit open
+ROUTER_COOLDOWN = float(os.getenv("GEMINI_ROUTER_COOLDOWN", "60"))
+ROUTER_COOLDOWN_FAILURES = int(os.getenv("GEMINI_ROUTER_COOLDOWN_FAILURES", "3"))
+# Weight of the newest sample in a model's moving average latency
+ROUTER_LATENCY_ALPHA = 0.2
+# Seconds a model's average latency is trusted; a model demoted for being slow gets no new
+# samples, so it is tried again once its average is this old
+ROUTER_LATENCY_TTL = float(os.getenv("GEMINI_ROUTER_LATENCY_TTL", "300"))
+
+# First matching rule wins. 'kinds' and 'min_chars' are optional conditions; 'models' is the
+# order of preference and 'ttft_slo' the target time to first token in seconds.
+DEFAULT_ROUTES = [
+    {"tab": "chat", "kinds": ["summary"], "models": ["fast", "standard"], "ttft_slo": 2.0},
+    {"tab": "code", "kinds": ["unit"], "models": ["fast", "standard"], "ttft_slo": 3.0},
+    {"tab": "code", "kinds": ["review", "debug"], "min_chars": 4000, "models": ["deep", "standard"],
+     "ttft_slo": 8.0},
+    {"tab": "chat", "models": ["standard", "fast"], "ttft_slo": 2.0},
+    {"tab": "*", "models": ["standard", "fast"], "ttft_slo": 4.0},
+]
+
+# Not-found is included so a misconfigured alias falls back instead of failing every call
+FALLBACK_STATUS_CODES = frozenset({404})
+
+def _load_routes():
+    if not ROUTING_TABLE_FILE:
+        return DEFAULT_ROUTES
+    with open(ROUTING_TABLE_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def should_fall_back(exc):
+    """
+    Check whether a failed call should be retried on the route's next model:
+    a missed first-token deadline, overload (429, 5xx) that outlasted the
+    retries, an open circuit, the rate limiter giving up, or a model that
+    does not exist.
+    """
+    return (isinstance(exc, (CircuitOpenError, RateLimitedError)) or is_retryable(exc)
+            or status_code(exc) in FALLBACK_STATUS_CODES)
+
+class ModelRouter:
+    """
+    Pick the models for a call from a routing table, by tab, kind
+    (assistance_type/text_type), prompt size and a time-to-first-token SLO.
+
+    Each route lists models in order of preference. Models seen to miss the
+    route's SLO (by their moving average time to first token) are moved
+    behind ones that meet it, and models that failed repeatedly are skipped
+    for ROUTER_COOLDOWN seconds. Models the API does not list are left out.
+    Decisions, fallbacks and per-model latencies are counted for tuning the
+    table.
+    """
+
+    def __init__(self, routes=None, aliases=None, enabled=ROUTING_ENABLED):
+        self.routes = routes if routes is not None else _load_routes()
+        self.aliases = aliases if aliases is not None else {"fast": FAST_MODEL, "deep": DEEP_MODEL}
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._models = {}
+        self._decisions = {}
+        self._fallbacks = {}
+
+    def _rule(self, tab, kind, prompt_chars):
+        for rule in self.routes:
+            if rule.get("tab", "*") not in ("*", tab):
+                continue
+            if "kinds" in rule and kind not in rule["kinds"]:
+                continue
+            if prompt_chars < rule.get("min_chars", 0):
+                continue
+            return rule
+        return {"models": ["standard"], "ttft_slo": 4.0}
+
+    def _model(self, name):
+        entry = self._models.get(name)
+        if entry is None:
+            entry = self._models[name] = {
+                "calls": 0, "failures": 0, "consecutive_failures": 0, "ttft": None, "total": None,
+                "updated_at": 0.0, "cooldown_until": 0.0, "last_error": None,
+            }
+        return entry
+
+    def _meets_slo(self, name, slo, now):
+        entry = self._model(name)
+        if slo is None or entry["ttft"] is None or now - entry["updated_at"] > ROUTER_LATENCY_TTL:
+            return True
+        return entry["ttft"] <= slo
+
+    def route(self, tab, kind, prompt_chars, standard_model, served=None):
+        """
+        Choose the models for one call.
+
+        Args:
+            tab: Tab of the call ('chat', 'code', 'text')
+            kind: assistance_type, text_type or internal kind ('summary', 'unit', ...)
+            prompt_chars: Size of the prompt in characters
+            standard_model: Name of the discovered default model ("standard" in the table)
+            served: Optional names of the models the API lists; other models of the table
+                are skipped (the standard model is always kept)
+
+        Returns:
+            Dictionary with the route 'name', the 'table' of configured models, the 'models'
+            to try in order, the 'ttft_slo', the first-token 'timeout' for all but the last
+            model, and the 'reason' for the first choice ('table', 'slo' or 'cooldown')
+        """
+        name = f"{tab}/{kind}" if kind else tab
+        if not self.enabled:
+            return {"name": name, "table": [standard_model], "models": [standard_model],
+                    "ttft_slo": None, "timeout": None, "reason": "table"}
+
+        rule = self._rule(tab, kind, prompt_chars)
+        table = []
+        for alias in rule["models"]:
+            model = standard_model if alias == "standard" else self.aliases.get(alias, alias)
+            if model in table or (served is not None and model != standard_model and model not in served):
+                continue
+            table.append(model)
+        if not table:
+            table.append(standard_model)
+        slo = rule.get("ttft_slo")
+
+        now = time.monotonic()
+        with self._lock:
+            available = [m for m in table if self._model(m)["cooldown_until"] <= now]
+            # Keep the table order, but prefer models whose recent latency meets the SLO
+            meets = [m for m in available if self._meets_slo(m, slo, now)]
+            models = meets + [m for m in available if m not in meets]
+            if not models:
+                # Everything is cooling down: try in table order anyway
+                models = list(table)
+            reason = "table" if models[0] == table[0] else "cooldown" if table[0] not in available else "slo"
+            key = (name, models[0], reason)
+            self._decisions[key] = self._decisions.get(key, 0) + 1
+        get_metrics().inc("assistant_route_decisions_total", key, label_names=("route", "model", "reason"))
+
+        return {
+            "name": name,
+            "table": table,
+            "models": models,
+            "ttft_slo": slo,
+            "timeout": slo * ROUTER_TIMEOUT_FACTOR if slo else None,
+            "reason": reason,
+        }
+
+    def record_success(self, model, ttft, total):
+        """
+        Record a completed call and update the model's moving average latency.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._model(model)
+            entry["calls"] += 1
+            entry["consecutive_failures"] = 0
+            stale = now - entry["updated_at"] > ROUTER_LATENCY_TTL
+            entry["updated_at"] = now
+            for key, value in (("ttft", ttft), ("total", total)):
+                if value is not None:
+                    previous = None if stale else entry[key]
+                    entry[key] = value if previous is None else (
+                        ROUTER_LATENCY_ALPHA * value + (1 - ROUTER_LATENCY_ALPHA) * previous
+                    )
+
+    def record_failure(self, model, exc):
+        """
+        Record a failed call. ROUTER_COOLDOWN_FAILURES timeouts or overloads
+        in a row put the model in cooldown; an open circuit (which already
+        counts repeated failures) or a not-found error does so at once.
+        """
+        with self._lock:
+            entry = self._model(model)
+            entry["calls"] += 1
+            entry["failures"] += 1
+            entry["last_error"] = type(exc).__name__
+            if not should_fall_back(exc):
+                return
+            entry["consecutive_failures"] += 1
+            if (entry["consecutive_failures"] >= ROUTER_COOLDOWN_FAILURES or isinstance(exc, CircuitOpenError)
+                    or status_code(exc) in FALLBACK_STATUS_CODES):
+                entry["cooldown_until"] = time.monotonic() + ROUTER_COOLDOWN
+
+    def record_fallback(self, route, from_model, to_model):
+        """
+        Count a fallback from one model of a route to the next.
+        """
+        with self._lock:
+            key = (route, from_model, to_model)
+            self._fallbacks[key] = self._fallbacks.get(key, 0) + 1
+        get_metrics().inc("assistant_fallbacks_total", key, label_names=("route", "from_model", "to_model"))
+
+    def stats(self):
+        """
+        Get the routing counters.
+
+        Returns:
+            Dictionary with 'models' (calls, failures, moving average ttft/total and seconds
+            of cooldown left per model), 'decisions' and 'fallbacks'
+        """
+        now = time.monotonic()
+        with self._lock:
+            models = {
+                name: {
+                    "calls": entry["calls"],
+                    "failures": entry["failures"],
+                    "ttft": entry["ttft"],
+                    "total": entry["total"],
+                    "cooldown": max(0.0, entry["cooldown_until"] - now),
+                    "last_error": entry["last_error"],
+                }
+                for name, entry in self._models.items()
+            }
+            decisions = [
+                {"route": route, "model": model, "reason": reason, "count": count}
+                for (route, model, reason), count in sorted(self._decisions.items())
+            ]
+            fallbacks = [
+                {"route": route, "from": from_model, "to": to_model, "count": count}
+                for (route, from_model, to_model), count in sorted(self._fallbacks.items())
+            ]
+        return {"enabled": self.enabled, "models": models, "decisions": decisions, "fallbacks": fallbacks}
+
+_router = ModelRouter()
+
+def get_router():
+    """
+    Get the process-wide model router.
+    """
+    return _router
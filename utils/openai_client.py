@@ -1,83 +1,785 @@
+import hashlib
 import os
-import streamlit as st
-import google.generativeai as genai
-from dotenv import load_dotenv
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import utils.env  # Loads .env before the settings below are read
+from utils.async_client import (
+    GEMINI_API_ENDPOINT,
+    REQUEST_TIMEOUT,
+    count_tokens_async,
+    generate_stream_async,
+    hedged_stream_async,
+    iter_sync,
+    run_sync,
+)
+from utils.code_units import split_code_units
+from utils.hedging import get_hedger
+from utils.metrics import get_metrics
+from utils.model_router import get_router, should_fall_back
+from utils.resilience import RETRY_MAX_ATTEMPTS, status_code
+from utils.response_cache import get_response_cache, make_cache_key, normalize_prompt
+from utils.semantic_cache import get_semantic_cache
+from utils.singleflight import SINGLE_FLIGHT_ENABLED, get_single_flight
+from utils.startup import record_startup_timing
 
-# Force reload of environment variables
-load_dotenv(override=True)
+PREFERRED_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+MODEL_CACHE_TTL = float(os.getenv("GEMINI_MODEL_CACHE_TTL", "3600"))
+HEALTH_CHECK_INTERVAL = float(os.getenv("GEMINI_HEALTH_CHECK_INTERVAL", "300"))
+MAX_MODEL_HANDLES = 32
+CODE_TEMPERATURE = float(os.getenv("GEMINI_CODE_TEMPERATURE", "0.2"))
+SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "400"))
+# Code contexts at least this long are analyzed unit by unit (map-reduce)
+CODE_MAP_REDUCE_MIN_CHARS = int(os.getenv("CODE_MAP_REDUCE_MIN_CHARS", "12000"))
+CODE_ANALYSIS_CONCURRENCY = int(os.getenv("CODE_ANALYSIS_CONCURRENCY", "4"))
+CODE_UNIT_MAX_OUTPUT_TOKENS = int(os.getenv("CODE_UNIT_MAX_OUTPUT_TOKENS", "400"))
+# Long-form text: an outline of at most LONG_FORM_MAX_SECTIONS sections, written LONG_FORM_CONCURRENCY at a time
+LONG_FORM_MAX_SECTIONS = int(os.getenv("LONG_FORM_MAX_SECTIONS", "8"))
+LONG_FORM_CONCURRENCY = int(os.getenv("LONG_FORM_CONCURRENCY", "4"))
+LONG_FORM_OUTLINE_MAX_TOKENS = int(os.getenv("LONG_FORM_OUTLINE_MAX_TOKENS", "600"))
+# Most text variants generated at once (the API allows up to 8 candidates per call)
+TEXT_VARIANTS_MAX = int(os.getenv("TEXT_VARIANTS_MAX", "4"))
+MAX_TOKEN_COUNTS = 10000
+
+# Process-wide state shared by every Streamlit session
+_client_lock = threading.Lock()
+_client = None
+
+_model_lock = threading.Lock()
+_model_name = None
+_model_expires_at = 0.0
+_model_handles = {}
+_served_models = None
+_served_expires_at = 0.0
+
+_health_lock = threading.Lock()
+_health = {"ok": None, "model": None, "error": None, "checked_at": None}
+_health_thread = None
+
+class GeminiError(Exception):
+    """
+    Base class for errors raised by the Gemini client helpers.
+    """
+
+class ConfigurationError(GeminiError):
+    """
+    The client could not be configured (e.g. missing or invalid API key).
+    """
+
+class ModelUnavailableError(GeminiError):
+    """
+    No model supporting generateContent could be found.
+    """
 
 def get_gemini_client():
     """
-    Get Gemini client with API key from environment variables.
+    Get the shared Gemini client, configuring it once per process.
+
+    The SDK (and its gRPC/protobuf stack) is imported here on first use
+    rather than when this module is imported, so pages render before it
+    has loaded.
+
+    Returns:
+        The configured genai module
+
+    Raises:
+        ConfigurationError: If the API key is missing or the client cannot be configured
+    """
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is not None:
+            return _client
+
+        api_key = os.getenv("GOOGLE_API_KEY", "")
+        if not api_key:
+            raise ConfigurationError("Google API key not found. Please set the GOOGLE_API_KEY environment variable.")
+
+        options = {"api_key": api_key}
+        if GEMINI_API_ENDPOINT:
+            options.update(transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+        started = time.perf_counter()
+        try:
+            import google.generativeai as genai
+            genai.configure(**options)
+        except Exception as e:
+            raise ConfigurationError(f"Error creating Gemini client: {str(e)}") from e
+        record_startup_timing("Gemini client (SDK import and configuration)", time.perf_counter() - started)
+        _client = genai
+        return _client
+
+def _discover_model(client):
+    """
+    Resolve the model to use, preferring PREFERRED_MODEL and falling back to
+    the first listed model that supports generateContent.
     """
-    api_key = os.getenv("GOOGLE_API_KEY", "")
-    if not api_key:
-        st.error("Google API key not found. Please set the GOOGLE_API_KEY environment variable.")
-        return None
-    
-    # Debug: Check if API key is loaded (only show first 8 characters for security)
-    st.write(f"API Key loaded: {api_key[:8]}...")
-    
     try:
-        genai.configure(api_key=api_key)
-        return genai
-    except Exception as e:
-        st.error(f"Error creating Gemini client: {str(e)}")
-        return None
+        info = client.get_model(f"models/{PREFERRED_MODEL}")
+        if 'generateContent' in info.supported_generation_methods:
+            return PREFERRED_MODEL
+    except Exception:
+        pass
+
+    for model in client.list_models():
+        if 'generateContent' in model.supported_generation_methods:
+            return model.name
+    return None
 
-def get_available_model():
+def get_available_model(refresh=False):
     """
     Get the recommended model for text generation.
+
+    The result of model discovery is cached process-wide for
+    MODEL_CACHE_TTL seconds.
+
+    Args:
+        refresh: Ignore the cached value and run discovery again
+
+    Returns:
+        Model name or None if no suitable model was found
+
+    Raises:
+        GeminiError: If the client is unavailable or models cannot be listed
     """
-    try:
-        client = get_gemini_client()
-        if not client:
-            return None
-        
-        # Try to use the recommended model first
+    global _model_name, _model_expires_at
+    if not refresh and _model_name and time.monotonic() < _model_expires_at:
+        return _model_name
+
+    client = get_gemini_client()
+    with _model_lock:
+        if not refresh and _model_name and time.monotonic() < _model_expires_at:
+            return _model_name
+
         try:
-            model = client.GenerativeModel('gemini-1.5-flash')
-            return 'gemini-1.5-flash'
-        except:
-            # If that fails, list available models
-            models = client.list_models()
-            for model in models:
-                if 'generateContent' in model.supported_generation_methods:
-                    return model.name
-            return None
+            model_name = _discover_model(client)
+        except Exception as e:
+            raise GeminiError(f"Error listing models: {str(e)}") from e
+        if model_name != _model_name:
+            _model_handles.clear()
+        _model_name = model_name
+        _model_expires_at = time.monotonic() + MODEL_CACHE_TTL if model_name else 0.0
+        return model_name
+
+def get_served_models():
+    """
+    Get the names of the models the API lists as supporting generateContent.
+
+    The list is cached process-wide for MODEL_CACHE_TTL seconds; routing
+    uses it to skip fallback models the API does not serve.
+
+    Returns:
+        Frozen set of model names (without the 'models/' prefix), or None if
+        the models cannot be listed
+    """
+    global _served_models, _served_expires_at
+    if time.monotonic() < _served_expires_at:
+        return _served_models
+
+    client = get_gemini_client()
+    with _model_lock:
+        if time.monotonic() < _served_expires_at:
+            return _served_models
+        try:
+            _served_models = frozenset(
+                model.name.removeprefix("models/") for model in client.list_models()
+                if 'generateContent' in model.supported_generation_methods
+            )
+        except Exception:
+            # Route on the table as configured rather than failing the call; try again later
+            _served_models = None
+        _served_expires_at = time.monotonic() + (MODEL_CACHE_TTL if _served_models is not None else HEALTH_CHECK_INTERVAL)
+        return _served_models
+
+def get_model(model_name, system_instruction=None):
+    """
+    Get a shared GenerativeModel handle for a model and system instruction.
+
+    Args:
+        model_name: Name of the Gemini model
+        system_instruction: Optional system instruction bound to the model
+
+    Returns:
+        GenerativeModel instance
+
+    Raises:
+        ConfigurationError: If the client is unavailable
+    """
+    key = (model_name, system_instruction)
+    model = _model_handles.get(key)
+    if model is not None:
+        return model
+
+    client = get_gemini_client()
+    with _model_lock:
+        model = _model_handles.get(key)
+        if model is None:
+            if len(_model_handles) >= MAX_MODEL_HANDLES:
+                _model_handles.clear()
+            model = client.GenerativeModel(model_name, system_instruction=system_instruction)
+            _model_handles[key] = model
+        return model
+
+def _run_health_check():
+    """
+    Probe the API without spending generation quota and update the shared health state.
+    """
+    checked_at = time.time()
+    try:
+        model_name = get_available_model(refresh=True)
+        if model_name:
+            state = {"ok": True, "model": model_name, "error": None, "checked_at": checked_at}
+        else:
+            state = {"ok": False, "model": None,
+                     "error": "No suitable model found that supports generateContent",
+                     "checked_at": checked_at}
     except Exception as e:
-        st.error(f"Error listing models: {str(e)}")
-        return None
+        state = {"ok": False, "model": None, "error": str(e), "checked_at": checked_at}
+
+    with _health_lock:
+        _health.update(state)
+    return state
+
+def _health_monitor_loop(interval):
+    while True:
+        _run_health_check()
+        time.sleep(interval)
+
+def start_health_monitor(interval=None):
+    """
+    Start the background thread that warms the client and model cache at
+    startup and refreshes the health state periodically. Safe to call from
+    every session; only one thread is started per process.
+
+    Args:
+        interval: Seconds between health checks (defaults to GEMINI_HEALTH_CHECK_INTERVAL)
+    """
+    global _health_thread
+    with _health_lock:
+        if _health_thread is not None and _health_thread.is_alive():
+            return
+        _health_thread = threading.Thread(
+            target=_health_monitor_loop,
+            args=(interval or HEALTH_CHECK_INTERVAL,),
+            name="gemini-health-monitor",
+            daemon=True,
+        )
+        _health_thread.start()
+
+def get_health():
+    """
+    Get a snapshot of the shared API health state.
+
+    Returns:
+        Dictionary with 'ok' (True, False or None while warming up), 'model', 'error' and 'checked_at'
+    """
+    with _health_lock:
+        return dict(_health)
 
 def test_api_connection():
     """
     Test the Gemini API connection.
+
+    Re-runs the shared health check on demand; sessions normally read the
+    cached state from get_health() instead. The failure reason, if any, is
+    available from get_health()['error'].
+
+    Returns:
+        True if the API is reachable and a model is available
+    """
+    return bool(_run_health_check()["ok"])
+
+def to_gemini_history(messages):
+    """
+    Convert chat messages into a native Gemini request.
+
+    System messages are merged into a single system instruction, and
+    assistant messages are mapped to the 'model' role (which is also
+    accepted as is) so the whole conversation can be sent in one call.
+
+    Args:
+        messages: List of message dictionaries with 'role' and 'content'
+
+    Returns:
+        Tuple of (system_instruction or None, list of Gemini contents)
     """
+    system_parts = []
+    contents = []
+    for message in messages:
+        role = message['role']
+        if role == 'system':
+            system_parts.append(message['content'])
+            continue
+
+        gemini_role = 'model' if role in ('assistant', 'model') else 'user'
+        # Gemini expects alternating turns; fold consecutive turns from the same role together
+        if contents and contents[-1]['role'] == gemini_role:
+            contents[-1]['parts'].append(message['content'])
+        else:
+            contents.append({'role': gemini_role, 'parts': [message['content']]})
+
+    system_instruction = "\n\n".join(system_parts) if system_parts else None
+    return system_instruction, contents
+
+CHAT_SYSTEM_PROMPT = "You are a helpful, friendly, and knowledgeable AI assistant. Provide clear, accurate, and engaging responses to user questions and requests."
+
+CODE_SYSTEM_MESSAGES = {
+    "general": "You are an expert programming assistant. Help with coding questions, provide solutions, and explain concepts clearly.",
+    "debug": "You are a debugging expert. Analyze the provided code and identify potential issues, bugs, or improvements.",
+    "review": "You are a code reviewer. Analyze the code for best practices, performance, security, and maintainability.",
+    "explain": "You are a programming tutor. Explain the provided code in detail, including how it works and why."
+}
+
+NO_FINDINGS = "No findings."
+
+CODE_UNIT_INSTRUCTIONS = (
+    "You are looking at one part of a larger {language}file: the {kind} `{name}`. "
+    "List only the findings in this part that are relevant to the query, as short bullet points "
+    "naming the function or class they refer to. If there are none, reply exactly \"{no_findings}\"."
+)
+
+CODE_MERGE_INSTRUCTIONS = (
+    "A large file was analyzed part by part for the query below. Merge the findings into one "
+    "coherent, well-organized answer: remove duplicates, keep the function and class names, and do "
+    "not mention that the file was analyzed in parts."
+)
+
+TEXT_SYSTEM_MESSAGES = {
+    "general": "You are a helpful writing assistant. Generate clear, well-structured content based on the user's request.",
+    "creative": "You are a creative writing assistant. Generate imaginative, engaging, and original content with vivid descriptions and compelling narratives.",
+    "formal": "You are a professional writing assistant. Generate formal, polished content suitable for business or academic contexts.",
+    "technical": "You are a technical writing specialist. Generate clear, precise, and informative technical content with proper terminology and structure."
+}
+
+# Default stop sequences per content type; generation ends before any of them is emitted
+TEXT_STOP_SEQUENCES = {
+    "general": [],
+    "creative": ["THE END"],
+    "formal": [],
+    "technical": [],
+}
+MAX_STOP_SEQUENCES = 5
+
+TEXT_OUTLINE_INSTRUCTIONS = (
+    "Plan the document requested below, but do not write it yet. Reply with the outline only: one line per "
+    "section, formatted as \"N. Section title: what the section covers\", with 3 to {max_sections} sections "
+    "in reading order."
+)
+
+TEXT_SECTION_INSTRUCTIONS = (
+    "You are writing one section of a longer document; the other sections are being written separately from "
+    "the same outline. Write only section {number}, \"{title}\": start with the heading \"## {title}\", cover "
+    "what the outline assigns to it, and do not repeat what other sections cover or introduce or conclude the "
+    "whole document unless this section is meant to."
+)
+
+# One outline line: "1. Title: description", "- Title", "## 2) Title", optionally in bold
+OUTLINE_LINE = re.compile(r"^\s*(?:#+\s*)?(?:\d+[.)]|[-*])\s+(?P<section>.+?)\s*$")
+
+# Timings of recent calls, newest last
+_timings_lock = threading.Lock()
+_timings = deque(maxlen=200)
+
+# Models that rejected candidate_count; their variants are generated with one call each
+_single_candidate_lock = threading.Lock()
+_single_candidate_models = set()
+
+# Exact token counts by text digest
+_token_counts_lock = threading.Lock()
+_token_counts = OrderedDict()
+
+def get_recent_timings(label=None):
+    """
+    Get timings of recent calls.
+
+    Args:
+        label: Optional call label to filter on (chat, code, text)
+
+    Returns:
+        List of dictionaries with 'label', 'ttft' and 'total' in seconds, oldest first
+    """
+    with _timings_lock:
+        return [dict(t) for t in _timings if label is None or t["label"] == label]
+
+@contextmanager
+def _call_metrics(tab, kind, stats):
+    """
+    Record the metrics of one public helper call when its stream ends.
+
+    Labelled by tab, kind (assistance_type/text_type) and stats['model'];
+    a stream closed early by the caller is recorded as cancelled.
+    """
+    started = time.perf_counter()
+    outcome, error = "ok", None
     try:
-        client = get_gemini_client()
-        if not client:
-            return False
-        
-        # List available models first
-        # models = client.list_models()
-        # st.write("Available models:", [model.name for model in models])
-        
-        # Get the recommended model
-        model_name = get_available_model()
-        if not model_name:
-            st.error("No suitable model found that supports generateContent")
-            return False
-            
-        st.write(f"Using model: {model_name}")
-        
-        # Make a simple test call
-        model = client.GenerativeModel(model_name)
-        response = model.generate_content("Hello")
-        return True
+        yield
+    except GeneratorExit:
+        outcome = "cancelled"
+        raise
+    except BaseException as e:
+        outcome, error = "error", type(e.__cause__ or e).__name__
+        raise
+    finally:
+        get_metrics().record_call(tab, kind, stats.get("model"), outcome, time.perf_counter() - started, stats, error)
+
+def _stream_generate(model, contents, label, stats=None, generation_config=None, first_chunk_timeout=None,
+                     max_attempts=RETRY_MAX_ATTEMPTS):
+    """
+    Stream a generation, yielding text chunks as they arrive.
+
+    Time-to-first-token and total time are written to stats (if given) and
+    recorded in the recent timings once the stream finishes. Token usage
+    reported by the API is written to stats['usage'] and the number of
+    retries of transient failures to stats['retries'].
+
+    With hedging enabled for the label, a duplicate request is sent when the
+    first token is later than the hedge deadline; stats['hedge'] records
+    whether that happened and which request won.
+    """
+    if stats is None:
+        stats = {}
+    stats.update({"label": label, "ttft": None, "total": None, "usage": None, "retries": 0})
+    started = time.perf_counter()
+    hedger = get_hedger()
+    hedge = None
+    try:
+        # The upstream call runs on the shared event loop; this thread only reads chunks
+        make_stream = lambda: generate_stream_async(
+            model, contents, generation_config, stats=stats,
+            first_chunk_timeout=first_chunk_timeout, max_attempts=max_attempts,
+        )
+        delay = hedger.deadline(label)
+        if delay is None:
+            upstream = make_stream()
+        else:
+            hedge = stats["hedge"] = {}
+            upstream = hedged_stream_async(make_stream, delay, lambda: hedger.try_hedge(label), hedge)
+        for chunk in iter_sync(upstream):
+            usage = getattr(chunk, "usage_metadata", None)
+            if usage is not None and usage.total_token_count:
+                stats["usage"] = {
+                    "prompt_tokens": usage.prompt_token_count,
+                    "output_tokens": usage.candidates_token_count,
+                }
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. the final finish-reason chunk)
+                continue
+            if not text:
+                continue
+            if stats["ttft"] is None:
+                stats["ttft"] = time.perf_counter() - started
+            yield text
+        hedger.record(label, stats["ttft"], hedge)
+    finally:
+        stats["total"] = time.perf_counter() - started
+        with _timings_lock:
+            _timings.append({"label": label, "ttft": stats["ttft"], "total": stats["total"]})
+
+def _stream_candidates(model, contents, label, stats=None, generation_config=None, first_chunk_timeout=None,
+                       max_attempts=RETRY_MAX_ATTEMPTS):
+    """
+    Stream a generation with several candidates (generation_config's
+    candidate_count), yielding (candidate index, text chunk) pairs as they
+    arrive. Timings and usage are recorded as by _stream_generate.
+    """
+    if stats is None:
+        stats = {}
+    stats.update({"label": label, "ttft": None, "total": None, "usage": None, "retries": 0})
+    started = time.perf_counter()
+    try:
+        upstream = generate_stream_async(
+            model, contents, generation_config, stats=stats,
+            first_chunk_timeout=first_chunk_timeout, max_attempts=max_attempts,
+        )
+        for chunk in iter_sync(upstream):
+            usage = getattr(chunk, "usage_metadata", None)
+            if usage is not None and usage.total_token_count:
+                stats["usage"] = {
+                    "prompt_tokens": usage.prompt_token_count,
+                    "output_tokens": usage.candidates_token_count,
+                }
+            for candidate in chunk.candidates:
+                text = "".join(part.text for part in candidate.content.parts)
+                if not text:
+                    continue
+                if stats["ttft"] is None:
+                    stats["ttft"] = time.perf_counter() - started
+                yield candidate.index, text
+    finally:
+        stats["total"] = time.perf_counter() - started
+        with _timings_lock:
+            _timings.append({"label": label, "ttft": stats["ttft"], "total": stats["total"]})
+
+def count_tokens(text):
+    """
+    Count the tokens of a text exactly with the model's tokenizer.
+
+    Counts are cached by text, so each distinct text is counted at most once
+    per process.
+
+    Args:
+        text: Text to count
+
+    Returns:
+        Number of tokens
+
+    Raises:
+        GeminiError: If the count request fails
+    """
+    key = hashlib.sha256(text.encode("utf-8")).digest()
+    with _token_counts_lock:
+        if key in _token_counts:
+            _token_counts.move_to_end(key)
+            return _token_counts[key]
+
+    try:
+        model = _resolve_model()
+        # Not bounded by REQUEST_TIMEOUT as a whole: each attempt is, and so are the limiter wait and retries
+        tokens = run_sync(count_tokens_async(model, text)).total_tokens
+    except GeminiError:
+        raise
     except Exception as e:
-        st.error(f"API connection test failed: {str(e)}")
-        st.error("Please check if your API key is valid and has not expired.")
-        return False
+        raise GeminiError(f"Error counting tokens: {str(e)}") from e
+
+    with _token_counts_lock:
+        _token_counts[key] = tokens
+        while len(_token_counts) > MAX_TOKEN_COUNTS:
+            _token_counts.popitem(last=False)
+    return tokens
+
+def summarize_conversation(previous_summary, messages, max_tokens=SUMMARY_MAX_TOKENS):
+    """
+    Fold messages into a rolling conversation summary.
+
+    Only the new messages and the previous summary are sent, so the cost of
+    each update does not grow with the length of the conversation.
+
+    Args:
+        previous_summary: Summary of everything before these messages (may be empty)
+        messages: List of message dictionaries with 'role' and 'content' to fold in
+        max_tokens: Maximum length of the updated summary
+
+    Returns:
+        The updated summary
+
+    Raises:
+        GeminiError: If the request fails
+    """
+    transcript = "\n\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+    prompt = (
+        "Update the running summary of a conversation between a user and an AI assistant. "
+        "Keep facts, decisions, names, code identifiers and open questions; drop pleasantries. "
+        f"Reply with the updated summary only, in at most {int(max_tokens * 0.75)} words.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New messages:\n{transcript}"
+    )
+    stats = {}
+    with _call_metrics("chat", "summary", stats):
+        try:
+            route = _route("chat", "summary", prompt)
+            stats["model"] = route["models"][0]
+            generation_config = {"temperature": 0.2, "max_output_tokens": max_tokens}
+            summary = "".join(_stream_routed(route, prompt, "summary", stats, generation_config))
+        except GeminiError:
+            raise
+        except Exception as e:
+            raise GeminiError(f"Error summarizing conversation: {str(e)}") from e
+    return summary.strip() or previous_summary
+
+def _resolve_model(system_instruction=None):
+    """
+    Get the shared model handle for the current model.
+
+    Raises:
+        GeminiError: If the client or a suitable model is unavailable
+    """
+    model_name = get_available_model()
+    if not model_name:
+        raise ModelUnavailableError("No suitable model found that supports generateContent")
+
+    return get_model(model_name, system_instruction)
+
+def _contents_chars(contents):
+    if isinstance(contents, str):
+        return len(contents)
+    return sum(len(part) for content in contents for part in content.get("parts", []) if isinstance(part, str))
+
+def _route(tab, kind, contents):
+    """
+    Choose the models for a call with the shared router.
+
+    Raises:
+        GeminiError: If the client or a suitable model is unavailable
+    """
+    model_name = get_available_model()
+    if not model_name:
+        raise ModelUnavailableError("No suitable model found that supports generateContent")
+    return get_router().route(tab, kind, _contents_chars(contents), model_name, get_served_models())
+
+def _stream_routed(route, contents, label, stats, generation_config=None, system_instruction=None,
+                   make_stream=_stream_generate):
+    """
+    Stream a generation on the models of a route in order.
+
+    Every model gets the usual retries of 429s and 5xx with backoff; all but
+    the last also get the route's first-token timeout. A missed first-token
+    deadline, retries running out or an open circuit before the first chunk
+    falls back to the next model. If the fallbacks fail too, the first
+    model's error is raised. stats['model'] is the model that answered (or
+    failed last) and stats['fallbacks'] the models given up on. make_stream
+    is _stream_generate, or _stream_candidates for several candidates.
+    """
+    router = get_router()
+    models = route["models"]
+    stats["route"] = route["name"]
+    stats["fallbacks"] = []
+    primary_error = None
+    for i, model_name in enumerate(models):
+        last = i == len(models) - 1
+        stats["model"] = model_name
+        streamed = False
+        chunks = make_stream(
+            get_model(model_name, system_instruction), contents, label, stats, generation_config,
+            first_chunk_timeout=None if last else route["timeout"],
+        )
+        try:
+            for chunk in chunks:
+                streamed = True
+                yield chunk
+        except Exception as e:
+            router.record_failure(model_name, e)
+            if streamed:
+                raise
+            if last or not should_fall_back(e):
+                if primary_error is not None:
+                    raise primary_error
+                raise
+            primary_error = primary_error or e
+            router.record_fallback(route["name"], model_name, models[i + 1])
+            stats["fallbacks"].append(model_name)
+            continue
+        finally:
+            chunks.close()
+        router.record_success(model_name, stats["ttft"], stats["total"])
+        return
+
+def _shared_stream(cache_key, produce, stats):
+    # Concurrent identical requests wait on one upstream stream instead of each calling the API
+    if not SINGLE_FLIGHT_ENABLED:
+        return produce()
+    return get_single_flight().stream(cache_key, produce, stats)
+
+def _cached_stream(cache_key, temperature, label, produce, stats=None, semantic_text=None, semantic_scope=None):
+    """
+    Serve a stream from the response caches, or produce it and store the result.
+
+    The exact-key cache is checked first, then (if semantic_text is given)
+    the near-duplicate cache within semantic_scope. Requests above the
+    cache temperature threshold bypass both. Only streams that complete
+    normally are stored. Concurrent requests with the same key share one
+    upstream stream, whether or not they are cacheable.
+    """
+    if stats is None:
+        stats = {}
+    stats["label"] = label
+    cache = get_response_cache()
+    if not cache.is_cacheable(temperature):
+        cache.record_bypass()
+        stats["cache"] = "bypass"
+        yield from _shared_stream(cache_key, produce, stats)
+        return
+
+    cached = cache.get(cache_key)
+    if cached is not None:
+        stats.update({"label": label, "ttft": 0.0, "total": 0.0, "cache": "hit"})
+        yield cached
+        return
+
+    semantic_cache = get_semantic_cache() if semantic_text else None
+    if semantic_cache is not None:
+        match = semantic_cache.get(semantic_text, semantic_scope)
+        if match is not None:
+            cached, score = match
+            stats.update({"label": label, "ttft": 0.0, "total": 0.0, "cache": "semantic_hit", "similarity": score})
+            yield cached
+            return
+
+    stats["cache"] = "miss"
+
+    def produce_and_store():
+        # Runs once per shared stream, so the result is stored once
+        parts = []
+        for chunk in produce():
+            parts.append(chunk)
+            yield chunk
+        if parts:
+            text = "".join(parts)
+            cache.set(cache_key, text)
+            if semantic_cache is not None:
+                semantic_cache.set(semantic_text, semantic_scope, text)
+
+    yield from _shared_stream(cache_key, produce_and_store, stats)
+
+def get_cache_stats():
+    """
+    Get hit/miss counters of the shared response caches.
+
+    Returns:
+        Exact-key cache counters, with the near-duplicate cache counters under
+        'semantic' and the in-flight request coalescing counters under 'coalesced'
+    """
+    stats = get_response_cache().stats()
+    stats["semantic"] = get_semantic_cache().stats()
+    stats["coalesced"] = get_single_flight().stats()
+    return stats
+
+def _collect(chunks):
+    text = "".join(chunks)
+    return text or None
+
+def stream_chat_response(messages, max_tokens=1000, temperature=0.7, stats=None):
+    """
+    Stream a chat response from Gemini API.
+
+    The full conversation is sent as one native Gemini history, so each
+    turn costs exactly one upstream call regardless of history length.
+
+    Args:
+        messages: List of message dictionaries with 'role' and 'content'
+        max_tokens: Maximum tokens in response (enforced as the model's output cap)
+        temperature: Response creativity (0.0 to 1.0)
+        stats: Optional dictionary that receives 'ttft' and 'total' timings
+
+    Yields:
+        Response text chunks as they arrive; closing the generator cancels the upstream call
+
+    Raises:
+        ValueError: If the conversation does not end with a user message
+        GeminiError: If the request fails
+    """
+    system_instruction, contents = to_gemini_history(messages)
+    if not contents or contents[-1]['role'] != 'user':
+        raise ValueError("The conversation must end with a user message")
+
+    if stats is None:
+        stats = {}
+    with _call_metrics("chat", "", stats):
+        try:
+            route = _route("chat", "", contents)
+            stats["model"] = route["models"][0]
+            generation_config = {"temperature": temperature, "max_output_tokens": max_tokens}
+            yield from _stream_routed(route, contents, "chat", stats, generation_config, system_instruction)
+        except GeminiError:
+            raise
+        except Exception as e:
+            raise GeminiError(f"Error getting chat response: {str(e)}") from e
 
 def get_chat_response(messages, max_tokens=1000, temperature=0.7):
     """
@@ -89,40 +791,237 @@ def get_chat_response(messages, max_tokens=1000, temperature=0.7):
         temperature: Response creativity (0.0 to 1.0)
     
     Returns:
-        Response content or None if error
+        Response content, or None if nothing was generated
+
+    Raises:
+        GeminiError: If the request fails
+    """
+    return _collect(stream_chat_response(messages, max_tokens, temperature))
+
+def _analyze_code_unit(unit, code_query, assistance_type, language, temperature):
+    """
+    Analyze one code unit for a query.
+
+    Results are cached by the unit's content hash, so units that did not
+    change between edits of a file are not analyzed again.
+
+    Returns:
+        Tuple of (findings text, stats of the call)
+    """
+    stats = {}
+    system_message = CODE_SYSTEM_MESSAGES.get(assistance_type, CODE_SYSTEM_MESSAGES["general"])
+    instructions = CODE_UNIT_INSTRUCTIONS.format(
+        language=f"{language} " if language else "", kind=unit["kind"], name=unit["name"], no_findings=NO_FINDINGS
+    )
+    prompt = f"{system_message}\n\n{instructions}\n\nQuery: {code_query}\n\nCode:\n{unit['code']}"
+    generation_config = {"temperature": temperature, "max_output_tokens": CODE_UNIT_MAX_OUTPUT_TOKENS}
+    route = _route("code", "unit", prompt)
+    cache_key = make_cache_key(
+        kind="code_unit",
+        unit=unit["hash"],
+        name=unit["name"],
+        unit_kind=unit["kind"],
+        query=normalize_prompt(code_query),
+        assistance_type=assistance_type,
+        language=language,
+        model=route["table"][0],
+        settings=generation_config,
+    )
+    text = "".join(_cached_stream(
+        cache_key, temperature, "code_unit",
+        lambda: _stream_routed(route, prompt, "code_unit", stats, generation_config),
+        stats,
+    ))
+    return text.strip(), stats
+
+def _stream_code_map_reduce(units, code_query, assistance_type, language, temperature, stats, session_summary=""):
+    """
+    Analyze code units in parallel with bounded concurrency, then stream one
+    report merged from their findings (and the session summary, if any).
+
+    Units that fail are reported as such; the call only fails if every unit does.
     """
+    started = time.perf_counter()
+    findings = [None] * len(units)
+    unit_stats = []
+    failures = []
+    executor = ThreadPoolExecutor(max_workers=CODE_ANALYSIS_CONCURRENCY)
     try:
-        client = get_gemini_client()
-        if not client:
-            return None
-        
-        model_name = get_available_model()
-        if not model_name:
-            st.error("No suitable model found that supports generateContent")
-            return None
-            
-        model = client.GenerativeModel(model_name)
-        chat = model.start_chat(history=[])
-        
-        # Convert messages to Gemini format
-        for message in messages:
-            if message['role'] == 'user':
-                chat.send_message(message['content'])
-            elif message['role'] == 'assistant':
-                # Add assistant's previous response to history
-                chat.history.append({
-                    'role': 'model',
-                    'parts': [message['content']]
-                })
-        
-        response = chat.last.text
-        return response
-    
-    except Exception as e:
-        st.error(f"Error getting chat response: {str(e)}")
-        return None
+        futures = {
+            executor.submit(_analyze_code_unit, unit, code_query, assistance_type, language, temperature): i
+            for i, unit in enumerate(units)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                findings[i], call_stats = future.result()
+                unit_stats.append(call_stats)
+            except Exception as e:
+                failures.append(e)
+                findings[i] = f"(This part could not be analyzed: {str(e)})"
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if len(failures) == len(units):
+        raise failures[0]
+
+    sections = [
+        f"### {unit['name']} (lines {unit['start_line']}-{unit['end_line']})\n{text}"
+        for unit, text in zip(units, findings)
+        if text and text != NO_FINDINGS
+    ]
+    system_message = CODE_SYSTEM_MESSAGES.get(assistance_type, CODE_SYSTEM_MESSAGES["general"])
+    enhanced_query = f"[{language}] {code_query}" if language else code_query
+    prompt = (
+        f"{system_message}\n\n{CODE_MERGE_INSTRUCTIONS}\n\n{_session_context(session_summary)}Query: {enhanced_query}\n\n"
+        f"Findings:\n\n" + ("\n\n".join(sections) or NO_FINDINGS)
+    )
+    map_time = time.perf_counter() - started
+    yield from _stream_routed(_route("code", assistance_type, prompt), prompt, "code", stats, {"temperature": temperature})
+
+    # Timings cover the whole call, including the unit analyses
+    if stats.get("ttft") is not None:
+        stats["ttft"] += map_time
+    stats["total"] += map_time
+    stats["map_reduce"] = {
+        "units": len(units),
+        "cached": sum(1 for s in unit_stats if s.get("cache") == "hit"),
+        "failed": len(failures),
+    }
+    # Count the tokens of the unit analyses in the call's usage
+    usage = stats.get("usage") or {"prompt_tokens": 0, "output_tokens": 0}
+    for s in unit_stats:
+        for key, value in (s.get("usage") or {}).items():
+            usage[key] = (usage.get(key) or 0) + (value or 0)
+    stats["usage"] = usage
+
+def _session_context(session_summary):
+    # Prompt section for the earlier questions of a code session, if any
+    if not session_summary:
+        return ""
+    return f"Summary of the earlier questions and answers in this session:\n{session_summary}\n\n"
+
+def _stream_code_followup(code_query, code_diff, session_summary, assistance_type, language, temperature, stats):
+    """
+    Stream the answer to a follow-up question of a code session, sending the
+    session summary and the code diff instead of the full code.
+    """
+    with _call_metrics("code", assistance_type, stats):
+        try:
+            enhanced_query = f"[{language}] {code_query}" if language else code_query
+            system_message = CODE_SYSTEM_MESSAGES.get(assistance_type, CODE_SYSTEM_MESSAGES["general"])
+            if code_diff:
+                change = f"The code changed since the previous question. Unified diff against the previous version:\n{code_diff}"
+            else:
+                change = "The code has not changed since the previous question."
+            prompt = (
+                f"{system_message}\n\nThis is a follow-up question about the code discussed earlier in this session.\n\n"
+                f"{_session_context(session_summary)}Query: {enhanced_query}\n\n{change}"
+            )
+            generation_config = {"temperature": temperature}
+            route = _route("code", assistance_type, prompt)
+            stats["model"] = route["models"][0]
+
+            scope = make_cache_key(
+                kind="code_followup",
+                summary=normalize_prompt(session_summary),
+                diff=code_diff,
+                assistance_type=assistance_type,
+                language=language,
+                model=route["table"][0],
+                settings=generation_config,
+            )
+            cache_key = make_cache_key(scope=scope, query=normalize_prompt(code_query))
+            yield from _cached_stream(
+                cache_key, temperature, "code",
+                lambda: _stream_routed(route, prompt, "code", stats, generation_config),
+                stats, semantic_text=code_query, semantic_scope=scope,
+            )
+
+        except GeminiError:
+            raise
+        except Exception as e:
+            raise GeminiError(f"Error getting code assistance: {str(e)}") from e
+
+def stream_code_assistance(code_query, code_context="", assistance_type="general", language="",
+                           temperature=CODE_TEMPERATURE, stats=None, session_summary="", code_diff=None):
+    """
+    Stream code assistance from Gemini API.
+
+    Identical requests at or below the cache temperature threshold are
+    served from the response cache. Code contexts of CODE_MAP_REDUCE_MIN_CHARS
+    or more are split into function- and class-level units that are analyzed
+    in parallel (each cached by its content hash) and merged into one report.
+
+    Follow-up questions in a code session (see utils.code_session) pass the
+    summary of the earlier questions and, when it is small enough, a diff
+    against the code of the previous question instead of the full code.
+
+    Args:
+        code_query: The code question or problem
+        code_context: Optional code context
+        assistance_type: Type of assistance (general, debug, review, explain)
+        language: Optional programming language
+        temperature: Response creativity (0.0 to 1.0)
+        stats: Optional dictionary that receives 'ttft', 'total', 'cache' status and, for
+            map-reduce analysis, 'map_reduce' unit counts
+        session_summary: Optional summary of the earlier questions and answers of the session
+        code_diff: Optional unified diff sent instead of code_context ('' if the code is unchanged)
+
+    Yields:
+        Response text chunks as they arrive
+
+    Raises:
+        GeminiError: If the request fails
+    """
+    if stats is None:
+        stats = {}
+    if code_diff is not None:
+        yield from _stream_code_followup(
+            code_query, code_diff, session_summary, assistance_type, language, temperature, stats
+        )
+        return
+    with _call_metrics("code", assistance_type, stats):
+        try:
+            enhanced_query = f"[{language}] {code_query}" if language else code_query
+            system_message = CODE_SYSTEM_MESSAGES.get(assistance_type, CODE_SYSTEM_MESSAGES["general"])
+            prompt = f"{system_message}\n\n{_session_context(session_summary)}Query: {enhanced_query}"
+            if code_context:
+                prompt += f"\n\nCode Context: {code_context}"
+            generation_config = {"temperature": temperature}
+            route = _route("code", assistance_type, prompt)
+            stats["model"] = route["models"][0]
+
+            # Everything but the question itself must match for a near-duplicate hit
+            scope_fields = {"summary": normalize_prompt(session_summary)} if session_summary else {}
+            scope = make_cache_key(
+                kind="code",
+                context=normalize_prompt(code_context),
+                assistance_type=assistance_type,
+                language=language,
+                model=route["table"][0],
+                settings=generation_config,
+                **scope_fields,
+            )
+            cache_key = make_cache_key(scope=scope, query=normalize_prompt(code_query))
+            units = split_code_units(code_context, language) if len(code_context) >= CODE_MAP_REDUCE_MIN_CHARS else []
+            if len(units) > 1:
+                produce = lambda: _stream_code_map_reduce(
+                    units, code_query, assistance_type, language, temperature, stats, session_summary
+                )
+            else:
+                produce = lambda: _stream_routed(route, prompt, "code", stats, generation_config)
+            yield from _cached_stream(
+                cache_key, temperature, "code", produce,
+                stats, semantic_text=code_query, semantic_scope=scope,
+            )
 
-def get_code_assistance(code_query, code_context="", assistance_type="general"):
+        except GeminiError:
+            raise
+        except Exception as e:
+            raise GeminiError(f"Error getting code assistance: {str(e)}") from e
+
+def get_code_assistance(code_query, code_context="", assistance_type="general", language="",
+                        temperature=CODE_TEMPERATURE):
     """
     Get code assistance from Gemini API.
     
@@ -130,41 +1029,85 @@ def get_code_assistance(code_query, code_context="", assistance_type="general"):
         code_query: The code question or problem
         code_context: Optional code context
         assistance_type: Type of assistance (general, debug, review, explain)
+        language: Optional programming language
+        temperature: Response creativity (0.0 to 1.0)
     
     Returns:
-        Response content or None if error
+        Response content, or None if nothing was generated
+
+    Raises:
+        GeminiError: If the request fails
     """
-    try:
-        client = get_gemini_client()
-        if not client:
-            return None
-        
-        model_name = get_available_model()
-        if not model_name:
-            st.error("No suitable model found that supports generateContent")
-            return None
-        
-        # Create system message based on assistance type
-        system_messages = {
-            "general": "You are an expert programming assistant. Help with coding questions, provide solutions, and explain concepts clearly.",
-            "debug": "You are a debugging expert. Analyze the provided code and identify potential issues, bugs, or improvements.",
-            "review": "You are a code reviewer. Analyze the code for best practices, performance, security, and maintainability.",
-            "explain": "You are a programming tutor. Explain the provided code in detail, including how it works and why."
-        }
-        
-        system_message = system_messages.get(assistance_type, system_messages["general"])
-        
-        model = client.GenerativeModel(model_name)
-        prompt = f"{system_message}\n\nQuery: {code_query}\n\nCode Context: {code_context}" if code_context else f"{system_message}\n\nQuery: {code_query}"
-        
-        response = model.generate_content(prompt)
-        return response.text
-    
-    except Exception as e:
-        st.error(f"Error getting code assistance: {str(e)}")
-        return None
+    return _collect(stream_code_assistance(code_query, code_context, assistance_type, language, temperature))
+
+def stream_text(prompt, text_type="general", max_tokens=1000, temperature=0.7, stats=None, stop_sequences=None,
+                user_request=None):
+    """
+    Stream generated text from Gemini API.
+
+    Identical requests at or below the cache temperature threshold are
+    served from the response cache.
+
+    Args:
+        prompt: The text generation prompt
+        text_type: Type of text generation (general, creative, formal, technical)
+        max_tokens: Maximum tokens in response (enforced as the model's output cap)
+        temperature: Response creativity (0.0 to 1.0)
+        stats: Optional dictionary that receives 'ttft', 'total' and 'cache' status
+        stop_sequences: Optional stop sequences (defaults to TEXT_STOP_SEQUENCES for the text type)
+        user_request: Optional dictionary with the user's own 'prompt', 'context', 'audience' and
+            'tone' that prompt was built from (see enhance_text_prompt). Only then is the
+            near-duplicate cache used: it matches the user's prompt, and the other fields, the
+            text type and the settings must match exactly.
+
+    Yields:
+        Generated text chunks as they arrive; closing the generator cancels the upstream call
+
+    Raises:
+        GeminiError: If the request fails
+    """
+    if stats is None:
+        stats = {}
+    with _call_metrics("text", text_type, stats):
+        try:
+            system_message = TEXT_SYSTEM_MESSAGES.get(text_type, TEXT_SYSTEM_MESSAGES["general"])
+            full_prompt = f"{system_message}\n\n{prompt}"
+            if stop_sequences is None:
+                stop_sequences = TEXT_STOP_SEQUENCES.get(text_type, [])
+            generation_config = {"temperature": temperature, "max_output_tokens": max_tokens}
+            if stop_sequences:
+                generation_config["stop_sequences"] = list(stop_sequences)[:MAX_STOP_SEQUENCES]
+            route = _route("text", text_type, full_prompt)
+            stats["model"] = route["models"][0]
+
+            scope = make_cache_key(
+                kind="text",
+                text_type=text_type,
+                model=route["table"][0],
+                settings=generation_config,
+            )
+            cache_key = make_cache_key(scope=scope, prompt=normalize_prompt(prompt))
+            semantic_text = semantic_scope = None
+            if user_request:
+                # The enhanced prompt is mostly boilerplate; match on what the user typed
+                semantic_text = user_request.get("prompt")
+                semantic_scope = make_cache_key(
+                    scope=scope,
+                    **{field: normalize_prompt(user_request.get(field) or "") for field in ("context", "audience", "tone")},
+                )
+            yield from _cached_stream(
+                cache_key, temperature, "text",
+                lambda: _stream_routed(route, full_prompt, "text", stats, generation_config),
+                stats, semantic_text=semantic_text, semantic_scope=semantic_scope,
+            )
+
+        except GeminiError:
+            raise
+        except Exception as e:
+            raise GeminiError(f"Error generating text: {str(e)}") from e
 
-def generate_text(prompt, text_type="general", max_tokens=1000, temperature=0.7):
+def generate_text(prompt, text_type="general", max_tokens=1000, temperature=0.7, stop_sequences=None,
+                  user_request=None):
     """
     Generate text using Gemini API.
     
@@ -173,36 +1116,369 @@ def generate_text(prompt, text_type="general", max_tokens=1000, temperature=0.7)
         text_type: Type of text generation (general, creative, formal, technical)
         max_tokens: Maximum tokens in response
         temperature: Response creativity (0.0 to 1.0)
+        stop_sequences: Optional stop sequences (defaults to TEXT_STOP_SEQUENCES for the text type)
+        user_request: Optional fields the prompt was built from, for the near-duplicate cache (see stream_text)
     
     Returns:
-        Generated text or None if error
+        Generated text, or None if nothing was generated
+
+    Raises:
+        GeminiError: If the request fails
+    """
+    return _collect(stream_text(prompt, text_type, max_tokens, temperature, stop_sequences=stop_sequences,
+                                user_request=user_request))
+
+def parse_outline(text, max_sections=LONG_FORM_MAX_SECTIONS):
+    """
+    Parse a generated outline into sections.
+
+    Args:
+        text: Outline with one numbered or bulleted line per section
+        max_sections: Maximum number of sections kept
+
+    Returns:
+        List of dictionaries with the 'title' and 'description' of each section
+    """
+    sections = []
+    for line in text.splitlines():
+        match = OUTLINE_LINE.match(line)
+        if not match:
+            continue
+        title, _, description = match.group("section").partition(":")
+        title = title.strip(" *_#")
+        if title:
+            sections.append({"title": title, "description": description.strip(" *_")})
+    return sections[:max_sections]
+
+def _write_section(i, sections, outline, prompt, text_type, generation_config, temperature, events, cancelled):
     """
+    Write one section of a long-form document, putting ('chunk', text)
+    events on the section's queue as they arrive, then ('error', exception)
+    if it failed and finally ('done', stats).
+    """
+    stats = {}
+    section = sections[i]
+    system_message = TEXT_SYSTEM_MESSAGES.get(text_type, TEXT_SYSTEM_MESSAGES["general"])
+    instructions = TEXT_SECTION_INSTRUCTIONS.format(number=i + 1, title=section["title"])
+    section_prompt = f"{system_message}\n\n{instructions}\n\nRequest:\n{prompt}\n\nOutline:\n{outline}"
+    chunks = None
     try:
-        client = get_gemini_client()
-        if not client:
-            return None
-        
-        model_name = get_available_model()
-        if not model_name:
-            st.error("No suitable model found that supports generateContent")
-            return None
-        
-        # Create system message based on text type
-        system_messages = {
-            "general": "You are a helpful writing assistant. Generate clear, well-structured content based on the user's request.",
-            "creative": "You are a creative writing assistant. Generate imaginative, engaging, and original content with vivid descriptions and compelling narratives.",
-            "formal": "You are a professional writing assistant. Generate formal, polished content suitable for business or academic contexts.",
-            "technical": "You are a technical writing specialist. Generate clear, precise, and informative technical content with proper terminology and structure."
-        }
-        
-        system_message = system_messages.get(text_type, system_messages["general"])
-        
-        model = client.GenerativeModel(model_name)
-        full_prompt = f"{system_message}\n\n{prompt}"
-        
-        response = model.generate_content(full_prompt)
-        return response.text
-    
+        route = _route("text", "section", section_prompt)
+        cache_key = make_cache_key(
+            kind="text_section",
+            prompt=normalize_prompt(prompt),
+            outline=outline,
+            section=i,
+            text_type=text_type,
+            model=route["table"][0],
+            settings=generation_config,
+        )
+        chunks = _cached_stream(
+            cache_key, temperature, "text_section",
+            lambda: _stream_routed(route, section_prompt, "text_section", stats, generation_config),
+            stats,
+        )
+        for chunk in chunks:
+            if cancelled.is_set():
+                break
+            events.put(("chunk", chunk))
     except Exception as e:
-        st.error(f"Error generating text: {str(e)}")
-        return None
+        stats["failed"] = True
+        events.put(("error", e))
+    finally:
+        if chunks is not None:
+            chunks.close()
+        events.put(("done", stats))
+
+def _stream_sections(sections, outline, prompt, text_type, generation_config, temperature, concurrency,
+                     section_stats):
+    """
+    Write the sections of an outline in parallel with bounded concurrency and
+    stream them in order: the current section as it is generated, the
+    following ones (buffered meanwhile) as soon as it ends. The stats of
+    each section are appended to section_stats.
+
+    Sections that fail are reported as such; the call only fails if every section does.
+    """
+    events = [queue.Queue() for _ in sections]
+    cancelled = threading.Event()
+    failures = []
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        for i in range(len(sections)):
+            executor.submit(
+                _write_section, i, sections, outline, prompt, text_type, generation_config, temperature,
+                events[i], cancelled,
+            )
+        for i, section in enumerate(sections):
+            if i:
+                yield "\n\n"
+            while True:
+                event, value = events[i].get()
+                if event == "chunk":
+                    yield value
+                elif event == "error":
+                    failures.append(value)
+                    yield f"## {section['title']}\n\n(This section could not be generated: {str(value)})"
+                else:
+                    section_stats.append(value)
+                    break
+    finally:
+        # Stops the sections still being written when the caller closes the stream early
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    if len(failures) == len(sections):
+        raise failures[0]
+
+def stream_long_text(prompt, text_type="general", max_tokens=1000, temperature=0.7, stats=None, stop_sequences=None,
+                     concurrency=None):
+    """
+    Stream a long-form document generated from an outline.
+
+    An outline is generated first; its sections are then written in
+    parallel, each from the same prompt (with its type, tone and audience
+    notes) and the whole outline, and streamed in order as they complete.
+    If the outline has fewer than two sections, the document is generated
+    in one call as by stream_text.
+
+    Args:
+        prompt: The text generation prompt
+        text_type: Type of text generation (general, creative, formal, technical)
+        max_tokens: Maximum tokens of each section
+        temperature: Response creativity (0.0 to 1.0)
+        stats: Optional dictionary that receives 'ttft' and 'total' timings of the whole
+            document and 'long_form' section counts and timings
+        stop_sequences: Optional stop sequences (defaults to TEXT_STOP_SEQUENCES for the text type)
+        concurrency: Number of sections written at the same time (default LONG_FORM_CONCURRENCY)
+
+    Yields:
+        Document text chunks in order; closing the generator cancels the upstream calls
+
+    Raises:
+        GeminiError: If the request fails
+    """
+    if stats is None:
+        stats = {}
+    concurrency = max(1, concurrency or LONG_FORM_CONCURRENCY)
+    with _call_metrics("text", text_type, stats):
+        try:
+            started = time.perf_counter()
+            system_message = TEXT_SYSTEM_MESSAGES.get(text_type, TEXT_SYSTEM_MESSAGES["general"])
+            if stop_sequences is None:
+                stop_sequences = TEXT_STOP_SEQUENCES.get(text_type, [])
+            generation_config = {"temperature": temperature, "max_output_tokens": max_tokens}
+            if stop_sequences:
+                generation_config["stop_sequences"] = list(stop_sequences)[:MAX_STOP_SEQUENCES]
+
+            instructions = TEXT_OUTLINE_INSTRUCTIONS.format(max_sections=LONG_FORM_MAX_SECTIONS)
+            outline_prompt = f"{system_message}\n\n{instructions}\n\nRequest:\n{prompt}"
+            outline_config = {"temperature": temperature, "max_output_tokens": LONG_FORM_OUTLINE_MAX_TOKENS}
+            route = _route("text", "outline", outline_prompt)
+            stats["model"] = route["models"][0]
+            outline_stats = {}
+            cache_key = make_cache_key(
+                kind="text_outline",
+                prompt=normalize_prompt(prompt),
+                text_type=text_type,
+                max_sections=LONG_FORM_MAX_SECTIONS,
+                model=route["table"][0],
+                settings=outline_config,
+            )
+            outline = "".join(_cached_stream(
+                cache_key, temperature, "text_outline",
+                lambda: _stream_routed(route, outline_prompt, "text_outline", outline_stats, outline_config),
+                outline_stats,
+            ))
+            sections = parse_outline(outline)
+            outline_time = time.perf_counter() - started
+
+            stats.update({"label": "text", "ttft": None, "total": None, "retries": 0})
+            section_stats = []
+            if len(sections) < 2:
+                sections = []
+                full_prompt = f"{system_message}\n\n{prompt}"
+                section_stats.append({})
+                chunks = _stream_routed(_route("text", text_type, full_prompt), full_prompt, "text", section_stats[0],
+                                        generation_config)
+            else:
+                outline = "\n".join(
+                    f"{i}. {s['title']}: {s['description']}" if s["description"] else f"{i}. {s['title']}"
+                    for i, s in enumerate(sections, 1)
+                )
+                chunks = _stream_sections(
+                    sections, outline, prompt, text_type, generation_config, temperature, concurrency, section_stats
+                )
+            try:
+                for chunk in chunks:
+                    if stats["ttft"] is None:
+                        stats["ttft"] = time.perf_counter() - started
+                    yield chunk
+            finally:
+                chunks.close()
+
+            stats["total"] = time.perf_counter() - started
+            call_stats = [outline_stats] + section_stats
+            stats["long_form"] = {
+                "sections": len(sections),
+                "failed": sum(1 for s in section_stats if s.get("failed")),
+                "concurrency": concurrency,
+                "outline_time": outline_time,
+                # Sum of the section times; compare with 'total' for the time saved by writing in parallel
+                "generation_time": sum(s.get("total") or 0.0 for s in call_stats[1:]),
+                "cached": sum(1 for s in call_stats if s.get("cache") == "hit"),
+            }
+            usage = {"prompt_tokens": 0, "output_tokens": 0}
+            for s in call_stats:
+                stats["retries"] += s.get("retries") or 0
+                for key, value in (s.get("usage") or {}).items():
+                    usage[key] = (usage.get(key) or 0) + (value or 0)
+            stats["usage"] = usage
+
+        except GeminiError:
+            raise
+        except Exception as e:
+            raise GeminiError(f"Error generating text: {str(e)}") from e
+
+def generate_long_text(prompt, text_type="general", max_tokens=1000, temperature=0.7, stop_sequences=None,
+                       concurrency=None):
+    """
+    Generate a long-form document from an outline, writing its sections in parallel.
+
+    Args:
+        prompt: The text generation prompt
+        text_type: Type of text generation (general, creative, formal, technical)
+        max_tokens: Maximum tokens of each section
+        temperature: Response creativity (0.0 to 1.0)
+        stop_sequences: Optional stop sequences (defaults to TEXT_STOP_SEQUENCES for the text type)
+        concurrency: Number of sections written at the same time (default LONG_FORM_CONCURRENCY)
+
+    Returns:
+        Generated document, or None if nothing was generated
+
+    Raises:
+        GeminiError: If the request fails
+    """
+    return _collect(stream_long_text(prompt, text_type, max_tokens, temperature, stop_sequences=stop_sequences,
+                                     concurrency=concurrency))
+
+def _generate_single_variants(route, full_prompt, count, generation_config, call_stats):
+    """
+    Generate variants with concurrent single-candidate calls.
+
+    Bypasses the response cache and request coalescing, which would return
+    the same text for every call. Calls that fail are skipped; fails only
+    if every call does.
+    """
+    failures = []
+    variants = []
+
+    def generate(stats):
+        return "".join(_stream_routed(route, full_prompt, "text_variants", stats, generation_config))
+
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        futures = []
+        for _ in range(count):
+            stats = {}
+            call_stats.append(stats)
+            futures.append(executor.submit(generate, stats))
+        for future in futures:
+            try:
+                text = future.result()
+            except Exception as e:
+                failures.append(e)
+                continue
+            if text:
+                variants.append(text)
+    if len(failures) == count:
+        raise failures[0]
+    return variants
+
+def generate_variants(prompt, text_type="general", count=3, max_tokens=1000, temperature=0.7, stats=None,
+                      stop_sequences=None):
+    """
+    Generate several alternative texts for one prompt.
+
+    The variants are requested as candidates of a single call. If the model
+    rejects candidate_count, or returns fewer non-empty candidates than
+    requested, the missing variants come from concurrent single calls, so
+    the call takes about one generation's latency either way. Variants are
+    not cached.
+
+    Args:
+        prompt: The text generation prompt
+        text_type: Type of text generation (general, creative, formal, technical)
+        count: Number of variants (at most TEXT_VARIANTS_MAX)
+        max_tokens: Maximum tokens of each variant
+        temperature: Response creativity (0.0 to 1.0)
+        stats: Optional dictionary that receives 'ttft' and 'total' timings and 'variants'
+            with the number of candidates from the one call and the number of upstream calls
+        stop_sequences: Optional stop sequences (defaults to TEXT_STOP_SEQUENCES for the text type)
+
+    Returns:
+        List of up to count generated texts
+
+    Raises:
+        GeminiError: If the request fails
+    """
+    if stats is None:
+        stats = {}
+    count = max(1, min(count, TEXT_VARIANTS_MAX))
+    with _call_metrics("text", text_type, stats):
+        try:
+            started = time.perf_counter()
+            system_message = TEXT_SYSTEM_MESSAGES.get(text_type, TEXT_SYSTEM_MESSAGES["general"])
+            full_prompt = f"{system_message}\n\n{prompt}"
+            if stop_sequences is None:
+                stop_sequences = TEXT_STOP_SEQUENCES.get(text_type, [])
+            generation_config = {"temperature": temperature, "max_output_tokens": max_tokens}
+            if stop_sequences:
+                generation_config["stop_sequences"] = list(stop_sequences)[:MAX_STOP_SEQUENCES]
+            route = _route("text", text_type, full_prompt)
+            stats["model"] = route["models"][0]
+
+            variants = []
+            candidate_stats = {}
+            with _single_candidate_lock:
+                multi_candidate = count > 1 and stats["model"] not in _single_candidate_models
+            if multi_candidate:
+                parts = {}
+                try:
+                    for index, text in _stream_routed(route, full_prompt, "text_variants", candidate_stats,
+                                                      dict(generation_config, candidate_count=count),
+                                                      make_stream=_stream_candidates):
+                        parts.setdefault(index, []).append(text)
+                except Exception as e:
+                    # Other 400s (stop sequences, prompt size, safety...) would fail the single calls too
+                    if status_code(e) != 400 or "candidate" not in str(e).lower():
+                        raise
+                    # The model does not support several candidates; remember it for later calls
+                    with _single_candidate_lock:
+                        _single_candidate_models.add(candidate_stats.get("model", stats["model"]))
+                variants = [text for text in ("".join(parts[i]) for i in sorted(parts)) if text]
+            candidates = len(variants)
+            ttft = candidate_stats.get("ttft") if candidates else None
+            single_stats = []
+            if len(variants) < count:
+                offset = time.perf_counter() - started
+                variants += _generate_single_variants(
+                    route, full_prompt, count - len(variants), generation_config, single_stats
+                )
+                ttfts = [s["ttft"] for s in single_stats if s.get("ttft") is not None]
+                if ttft is None and ttfts:
+                    ttft = offset + min(ttfts)
+
+            call_stats = ([candidate_stats] if multi_candidate else []) + single_stats
+            stats.update({"label": "text", "ttft": ttft, "total": time.perf_counter() - started, "retries": 0})
+            stats["variants"] = {"requested": count, "candidates": candidates, "calls": len(call_stats)}
+            usage = {"prompt_tokens": 0, "output_tokens": 0}
+            for s in call_stats:
+                stats["retries"] += s.get("retries") or 0
+                for key, value in (s.get("usage") or {}).items():
+                    usage[key] = (usage.get(key) or 0) + (value or 0)
+            stats["usage"] = usage
+            return variants
+
+        except GeminiError:
+            raise
+        except Exception as e:
+            raise GeminiError(f"Error generating text: {str(e)}") from e
@@ -0,0 +1,36 @@
+# Content type specific instructions appended to text generation prompts
+TEXT_TYPE_INSTRUCTIONS = {
+    "creative": "Focus on vivid imagery, engaging narrative, and creative expression.",
+    "formal": "Use professional language, clear structure, and appropriate business tone.",
+    "technical": "Include technical accuracy, clear explanations, and proper terminology."
+}
+
+def enhance_text_prompt(prompt, text_type="general", context="", target_audience="", tone=""):
+    """
+    Enhance a text generation prompt with additional context, audience, tone and style notes.
+
+    Args:
+        prompt: The user's prompt
+        text_type: Type of text generation (general, creative, formal, technical)
+        context: Optional additional context or requirements
+        target_audience: Optional target audience
+        tone: Optional desired tone
+
+    Returns:
+        The enhanced prompt
+    """
+    enhanced_prompt = prompt
+    
+    if context:
+        enhanced_prompt += f"\n\nAdditional context: {context}"
+    
+    if target_audience:
+        enhanced_prompt += f"\n\nTarget audience: {target_audience}"
+    
+    if tone:
+        enhanced_prompt += f"\n\nTone: {tone}"
+    
+    if text_type in TEXT_TYPE_INSTRUCTIONS:
+        enhanced_prompt += f"\n\nStyle note: {TEXT_TYPE_INSTRUCTIONS[text_type]}"
+    
+    return enhanced_prompt
@@ -0,0 +1,249 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "1000000"))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("GEMINI_RATE_LIMIT_MAX_WAIT", "30"))
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("GEMINI_RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "20"))
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("GEMINI_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("GEMINI_BREAKER_RESET_TIMEOUT", "30"))
+
+# HTTP status codes worth retrying: rate limited, server errors and gateway timeouts
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+class RateLimitedError(Exception):
+    """
+    The client-side rate limiter could not admit a request in time.
+    """
+
+class FirstChunkTimeoutError(asyncio.TimeoutError):
+    """
+    The first chunk of a stream did not arrive within the caller's deadline.
+    """
+
+    def __init__(self, timeout):
+        super().__init__(f"No response within {timeout:.1f}s")
+        self.timeout = timeout
+
+class CircuitOpenError(Exception):
+    """
+    The circuit breaker is open and calls fail fast until the upstream recovers.
+    """
+
+    def __init__(self, retry_in):
+        super().__init__(f"The AI service is temporarily unavailable. Please retry in {retry_in:.0f}s.")
+        self.retry_in = retry_in
+
+def status_code(exc):
+    """
+    Get the HTTP status code of an upstream error, if it has one.
+    """
+    code = getattr(exc, "code", None)
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(exc):
+    """
+    Check whether an upstream error is transient and worth retrying.
+    """
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    return status_code(exc) in RETRYABLE_STATUS_CODES
+
+def _duration_seconds(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = re.match(r"^\s*([\d.]+)s?\s*$", value)
+        return float(match.group(1)) if match else None
+    if hasattr(value, "total_seconds"):
+        return value.total_seconds()
+    if hasattr(value, "seconds"):
+        return value.seconds + getattr(value, "nanos", 0) / 1e9
+    return None
+
+def retry_after(exc):
+    """
+    Get the server's retry-after hint of an upstream error in seconds, if any.
+
+    Looks at a Retry-After response header, RetryInfo error details and the
+    "retry in Ns" hint in the error message.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        delay = _duration_seconds(headers.get("retry-after"))
+        if delay is not None:
+            return delay
+
+    for detail in getattr(exc, "details", None) or []:
+        if isinstance(detail, dict):
+            delay = _duration_seconds(detail.get("retryDelay"))
+        else:
+            delay = _duration_seconds(getattr(detail, "retry_delay", None))
+        if delay is not None:
+            return delay
+
+    match = re.search(r"retry in ([\d.]+)\s*s", str(exc), re.I)
+    return float(match.group(1)) if match else None
+
+def backoff_delay(attempt, hint=None, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """
+    Get the delay before a retry using exponential backoff with full jitter.
+
+    Args:
+        attempt: Zero-based retry attempt
+        hint: Optional retry-after hint from the server, used as a lower bound
+        base: Delay scale of the first retry
+        cap: Maximum backoff delay
+
+    Returns:
+        Delay in seconds
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if hint is not None:
+        delay = max(delay, hint)
+    return delay
+
+class AsyncRateLimiter:
+    """
+    Client-side limiter on requests and tokens per minute.
+
+    Two token buckets refill continuously. Callers queue in FIFO order and
+    wait until both buckets can admit them. Token costs are estimated up
+    front and corrected once the real usage is known.
+    """
+
+    def __init__(self, requests_per_minute=GEMINI_RPM, tokens_per_minute=GEMINI_TPM, max_wait=RATE_LIMIT_MAX_WAIT):
+        self.request_rate = requests_per_minute / 60.0
+        self.token_rate = tokens_per_minute / 60.0
+        self.max_wait = max_wait
+        self._requests = requests_per_minute
+        self._tokens = tokens_per_minute
+        self._max_requests = requests_per_minute
+        self._max_tokens = tokens_per_minute
+        self._updated = time.monotonic()
+        self._queue = None
+        self.waiting = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self._max_requests, self._requests + elapsed * self.request_rate)
+        self._tokens = min(self._max_tokens, self._tokens + elapsed * self.token_rate)
+
+    async def acquire(self, tokens=0):
+        """
+        Wait until a request costing `tokens` can be admitted.
+
+        Raises:
+            RateLimitedError: If the request would wait longer than max_wait
+        """
+        if self._queue is None:
+            self._queue = asyncio.Lock()
+        tokens = min(tokens, self._max_tokens)
+        deadline = time.monotonic() + self.max_wait
+        self.waiting += 1
+        try:
+            # The lock is held while waiting so requests are admitted in arrival order
+            async with self._queue:
+                while True:
+                    self._refill()
+                    if self._requests >= 1 and self._tokens >= tokens:
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        return
+                    wait = max((1 - self._requests) / self.request_rate if self.request_rate else 0,
+                               (tokens - self._tokens) / self.token_rate if self.token_rate else 0)
+                    if time.monotonic() + wait > deadline:
+                        raise RateLimitedError("Too many requests right now. Please try again shortly.")
+                    await asyncio.sleep(wait)
+        finally:
+            self.waiting -= 1
+
+    def record_usage(self, estimated, actual):
+        """
+        Correct the token bucket once the real token usage of a request is known.
+        """
+        self._refill()
+        self._tokens = min(self._max_tokens, self._tokens + estimated - actual)
+
+class CircuitBreaker:
+    """
+    Fail fast while the upstream is unhealthy.
+
+    After `failure_threshold` consecutive transient failures the circuit
+    opens and calls fail immediately. After `reset_timeout` seconds one
+    trial call is let through (half-open); its success closes the circuit,
+    its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """
+        Check that a call may proceed.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a trial call already in flight
+        """
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            raise CircuitOpenError(retry_in)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release(self):
+        """
+        End a call that neither succeeded nor failed upstream (e.g. cancelled or rejected as invalid).
+        """
+        with self._lock:
+            self._trial_in_flight = False
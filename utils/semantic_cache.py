@@ -0,0 +1,100 @@
+import os
+import re
+import threading
+import time
+
+from utils.vector_index import VectorIndex
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+
+# Words that flip the meaning of a prompt; prompts only match with the same number of them
+NEGATIONS = frozenset("""
+not no never none nothing without except avoid neither nor cannot dont doesnt didnt isnt arent wasnt werent
+wont wouldnt shouldnt cant couldnt
+""".split())
+NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+class SemanticCache:
+    """
+    Near-duplicate prompt cache backed by a local vector index.
+
+    Prompts are matched by cosine similarity of their hashed n-gram TF-IDF
+    vectors within a scope (request type, model, settings...). Numbers and
+    negations must match exactly (see exact_features()), as "100 words" and
+    "500 words" otherwise look nearly identical. A stored answer is returned
+    when the best match is at or above `threshold`, calibrated with
+    tools/semantic_calibration.py.
+    """
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl=SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.index = VectorIndex(capacity=max_entries)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0}
+
+    def get(self, prompt, scope):
+        """
+        Look up the answer stored for the most similar prompt in a scope.
+
+        Returns:
+            Tuple of (text, score) or None on a miss
+        """
+        results = self.index.search(prompt, k=1, scope=(scope, exact_features(prompt)))
+        with self._lock:
+            if results:
+                score, (text, created_at), slot = results[0]
+                if time.time() - created_at > self.ttl:
+                    self.index.remove(slot)
+                elif score >= self.threshold:
+                    self._stats["hits"] += 1
+                    return text, score
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, prompt, scope, text):
+        """
+        Store the answer for a prompt.
+        """
+        self.index.add(prompt, (text, time.time()), scope=(scope, exact_features(prompt)))
+        with self._lock:
+            self._stats["writes"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["entries"] = len(self.index)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+def exact_features(prompt):
+    """
+    Get the parts of a prompt that must match exactly for a near-duplicate hit.
+
+    Returns:
+        Tuple of the numbers in the prompt, in order, and the number of negations
+    """
+    text = (prompt or "").lower()
+    numbers = tuple(NUMBER.findall(text))
+    # Apostrophes are dropped first, so "don't" counts as "dont"
+    words = re.sub(r"[^\w\s]+", "", text).split()
+    negations = sum(1 for word in words if word in NEGATIONS)
+    return numbers, negations
+
+_cache_lock = threading.Lock()
+_cache = None
+
+def get_semantic_cache():
+    """
+    Get the process-wide semantic cache, creating it on first use.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache()
+    return _cache
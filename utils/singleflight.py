@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") != "0"
+
+class _Flight:
+    """
+    One upstream stream in progress, with the chunks produced so far.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.condition = threading.Condition()
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical streams into one upstream request.
+
+    The first caller for a key starts the stream on a producer thread; the
+    chunks are buffered and fanned out to every caller with the same key
+    until the stream finishes, so callers that join late still receive the
+    full text. If every caller stops reading, the upstream stream is closed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def stream(self, key, produce, stats=None):
+        """
+        Stream the result for a key, sharing an in-flight stream if there is one.
+
+        Args:
+            key: Key identifying identical requests
+            produce: Callable returning the upstream chunk iterator (only called by the first caller)
+            stats: Optional dictionary; followers get 'coalesced' and their own 'ttft' and 'total'
+
+        Yields:
+            Chunks of the shared stream
+
+        Raises:
+            Whatever the upstream stream raised
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.leaders += 1
+            else:
+                self.followers += 1
+            with flight.condition:
+                flight.subscribers += 1
+
+        if stats is not None:
+            stats["coalesced"] = not leader
+            if not leader:
+                stats.update({"ttft": None, "total": None})
+        if leader:
+            threading.Thread(target=self._produce, args=(key, flight, produce), name="single-flight", daemon=True).start()
+
+        started = time.perf_counter()
+        position = 0
+        try:
+            while True:
+                with flight.condition:
+                    while position >= len(flight.chunks) and not flight.done:
+                        flight.condition.wait()
+                    chunks = flight.chunks[position:]
+                    position = len(flight.chunks)
+                    done, error = flight.done, flight.error
+                for chunk in chunks:
+                    if not leader and stats is not None and stats["ttft"] is None:
+                        stats["ttft"] = time.perf_counter() - started
+                    yield chunk
+                if done:
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            if not leader and stats is not None:
+                stats["total"] = time.perf_counter() - started
+            with self._lock:
+                with flight.condition:
+                    flight.subscribers -= 1
+                    abandoned = flight.subscribers == 0 and not flight.done
+                # Nobody is reading any more; new callers must not join a stream about to be closed
+                if abandoned and self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def _produce(self, key, flight, produce):
+        chunks = produce()
+        try:
+            for chunk in chunks:
+                with flight.condition:
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+                    if flight.subscribers == 0:
+                        break
+        except BaseException as e:
+            flight.error = e
+        finally:
+            # Closing the generator cancels the upstream call if it was abandoned
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
+
+    def stats(self):
+        """
+        Get the number of upstream streams started and of callers that joined one in flight.
+        """
+        with self._lock:
+            return {"leaders": self.leaders, "followers": self.followers, "in_flight": len(self._flights)}
+
+_single_flight = SingleFlight()
+
+def get_single_flight():
+    """
+    Get the process-wide single-flight group.
+    """
+    return _single_flight
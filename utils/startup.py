@@ -0,0 +1,33 @@
+import threading
+import time
+
+# Approximately when the process started: the first import of this module
+PROCESS_STARTED = time.time()
+
+_lock = threading.Lock()
+_timings = {}
+
+def record_startup_timing(name, seconds):
+    """
+    Record how long a one-time startup step took (an import, client
+    construction, the first page render). Only the first recording of a
+    step is kept, so later cached runs do not overwrite the cold cost.
+
+    Args:
+        name: Name of the step
+        seconds: Duration in seconds
+    """
+    with _lock:
+        if name not in _timings:
+            _timings[name] = {"seconds": seconds, "at": time.time() - PROCESS_STARTED}
+
+def get_startup_timings():
+    """
+    Get the recorded startup steps in the order they finished.
+
+    Returns:
+        List of dictionaries with 'step', 'seconds' and 'at' (seconds after process start)
+    """
+    with _lock:
+        items = sorted(_timings.items(), key=lambda item: item[1]["at"])
+    return [{"step": name, "seconds": timing["seconds"], "at": timing["at"]} for name, timing in items]
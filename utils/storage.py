@@ -0,0 +1,212 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", os.path.join(".cache", "conversations.sqlite3"))
+
+class ConversationStore:
+    """
+    Persistent conversation storage in SQLite (WAL mode).
+
+    Messages are appended to a single table and never rewritten; each record
+    belongs to a conversation and a kind ('chat', 'code', 'text') and gets a
+    sequence number within that pair. Clearing a history only moves its
+    start marker, so reads stay cheap and paginated by sequence number.
+    """
+
+    def __init__(self, path=CONVERSATION_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                state TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id TEXT NOT NULL REFERENCES conversations (id),
+                kind TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (conversation_id, kind, seq)
+            );
+            """
+        )
+        conn.commit()
+
+    def _conn(self):
+        # One connection per thread; WAL lets readers proceed while another thread writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create_conversation(self):
+        """
+        Create a new conversation.
+
+        Returns:
+            The new conversation id
+        """
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute(
+                "INSERT INTO conversations (id, created_at, updated_at) VALUES (?, ?, ?)",
+                (conversation_id, now, now),
+            )
+            conn.commit()
+        return conversation_id
+
+    def conversation_exists(self, conversation_id):
+        row = self._conn().execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row is not None
+
+    def get_state(self, conversation_id, key, default=None):
+        """
+        Get a value from a conversation's state (e.g. a rolling summary).
+        """
+        row = self._conn().execute("SELECT state FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0]).get(key, default)
+
+    def set_state(self, conversation_id, key, value):
+        """
+        Set a value in a conversation's state.
+        """
+        with self._write_lock:
+            conn = self._conn()
+            row = conn.execute("SELECT state FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            state = json.loads(row[0]) if row else {}
+            state[key] = value
+            conn.execute(
+                "UPDATE conversations SET state = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(state), time.time(), conversation_id),
+            )
+            conn.commit()
+
+    def history_start(self, conversation_id, kind):
+        """
+        Get the sequence number the history of one kind starts at (moved forward by clear()).
+        """
+        return self.get_state(conversation_id, f"{kind}_start", 0)
+
+    def append(self, conversation_id, kind, payload):
+        """
+        Append a record to a conversation.
+
+        Args:
+            conversation_id: Conversation id
+            kind: Record kind ('chat', 'code' or 'text')
+            payload: JSON-serializable record
+
+        Returns:
+            Sequence number of the new record
+        """
+        now = time.time()
+        with self._write_lock:
+            conn = self._conn()
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE conversation_id = ? AND kind = ?",
+                (conversation_id, kind),
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO messages (conversation_id, kind, seq, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, kind, seq, json.dumps(payload, ensure_ascii=False), now),
+            )
+            conn.execute("UPDATE conversations SET updated_at = ? WHERE id = ?", (now, conversation_id))
+            conn.commit()
+        return seq
+
+    def count(self, conversation_id, kind):
+        """
+        Count the records in a conversation's history since it was last cleared.
+        """
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM messages WHERE conversation_id = ? AND kind = ? AND seq >= ?",
+            (conversation_id, kind, self.history_start(conversation_id, kind)),
+        ).fetchone()[0]
+
+    def page(self, conversation_id, kind, before=None, limit=20):
+        """
+        Read one page of records, newest page first.
+
+        Args:
+            conversation_id: Conversation id
+            kind: Record kind
+            before: Only return records with a lower sequence number (None for the newest page)
+            limit: Maximum number of records
+
+        Returns:
+            List of (seq, payload) tuples in ascending sequence order
+        """
+        start = self.history_start(conversation_id, kind)
+        if before is None:
+            rows = self._conn().execute(
+                "SELECT seq, payload FROM messages WHERE conversation_id = ? AND kind = ? AND seq >= ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (conversation_id, kind, start, limit),
+            ).fetchall()
+        else:
+            rows = self._conn().execute(
+                "SELECT seq, payload FROM messages WHERE conversation_id = ? AND kind = ? AND seq >= ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (conversation_id, kind, start, before, limit),
+            ).fetchall()
+        return [(seq, json.loads(payload)) for seq, payload in reversed(rows)]
+
+    def range(self, conversation_id, kind, start_seq, end_seq):
+        """
+        Read the records with start_seq <= seq < end_seq, in ascending order.
+        """
+        rows = self._conn().execute(
+            "SELECT seq, payload FROM messages WHERE conversation_id = ? AND kind = ? AND seq >= ? AND seq < ? "
+            "ORDER BY seq",
+            (conversation_id, kind, start_seq, end_seq),
+        ).fetchall()
+        return [(seq, json.loads(payload)) for seq, payload in rows]
+
+    def clear(self, conversation_id, kind):
+        """
+        Clear a conversation's history of one kind.
+
+        Records are kept; the history simply starts after the current last record.
+        """
+        with self._write_lock:
+            next_seq = self._conn().execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE conversation_id = ? AND kind = ?",
+                (conversation_id, kind),
+            ).fetchone()[0]
+        self.set_state(conversation_id, f"{kind}_start", next_seq)
+
+_store_lock = threading.Lock()
+_store = None
+
+def get_conversation_store():
+    """
+    Get the process-wide conversation store, creating it on first use.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore()
+    return _store
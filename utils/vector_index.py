@@ -0,0 +1,260 @@
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# Filler words that change the wording of a prompt but rarely its meaning
+STOPWORDS = frozenset("""
+a an the and or to of in on for with by from at as is are was were be been it this that these those
+i me my we our you your how what which who can could would should do does did please tell show give
+""".split())
+
+# Common abbreviations in programming questions, expanded so "dict" and "dictionary" match
+ABBREVIATIONS = {
+    "arg": "argument", "arr": "array", "config": "configuration", "db": "database", "dict": "dictionary",
+    "env": "environment", "err": "error", "fn": "function", "func": "function", "int": "integer",
+    "js": "javascript", "msg": "message", "num": "number", "obj": "object", "param": "parameter",
+    "py": "python", "repo": "repository", "str": "string", "ts": "typescript", "var": "variable",
+}
+
+def _stem(word):
+    # Plural to singular, enough to match "dicts" with "dict" and "dictionaries" with "dictionary"
+    if len(word) > 4 and word.endswith("ies"):
+        word = word[:-3] + "y"
+    elif len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    return ABBREVIATIONS.get(word, word)
+
+class HashedTfidfVectorizer:
+    """
+    Offline text vectorizer using hashed character n-grams, words and word
+    pairs weighted by TF-IDF.
+
+    Character n-grams match spelling variants; words and word pairs (counted
+    `word_weight` and `pair_weight` times) keep texts that differ in one
+    word ("ascending"/"descending") or in word order ("string to integer"/
+    "integer to string") apart. Document frequencies are updated
+    incrementally as documents are added to or removed from an index, so no
+    fitting pass or network access is needed.
+    """
+
+    def __init__(self, n_features=4096, ngram_range=(3, 5), word_weight=3.0, pair_weight=2.0):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.word_weight = word_weight
+        self.pair_weight = pair_weight
+        self.doc_freq = np.zeros(n_features, dtype=np.float64)
+        self.n_docs = 0
+
+    def normalize(self, text):
+        """
+        Lowercase, strip punctuation and filler words, reduce plurals, expand
+        abbreviations and collapse whitespace.
+        """
+        words = re.sub(r"[^\w]+", " ", (text or "").lower()).split()
+        kept = [w for w in words if w not in STOPWORDS]
+        return " ".join(_stem(w) for w in kept or words)
+
+    def term_frequencies(self, text):
+        """
+        Get the sublinear hashed n-gram term frequency vector of a text.
+
+        Character n-grams are taken within word boundaries, so spacing does
+        not affect the vector; word order only counts through the word pairs.
+        """
+        low, high = self.ngram_range
+        words = self.normalize(text).split()
+        hashes = []
+        weights = []
+        for word in words:
+            padded = f" {word} "
+            for n in range(low, high + 1):
+                grams = [zlib.crc32(padded[i:i + n].encode("utf-8")) for i in range(max(1, len(padded) - n + 1))]
+                hashes.extend(grams)
+                weights.extend([1.0] * len(grams))
+            if self.word_weight:
+                hashes.append(zlib.crc32(f"w:{word}".encode("utf-8")))
+                weights.append(self.word_weight)
+        if self.pair_weight:
+            for first, second in zip(words, words[1:]):
+                hashes.append(zlib.crc32(f"p:{first} {second}".encode("utf-8")))
+                weights.append(self.pair_weight)
+        # One bincount instead of a numpy scalar update per n-gram
+        counts = np.bincount(np.array(hashes, dtype=np.int64) % self.n_features, weights=weights,
+                             minlength=self.n_features).astype(np.float32)
+        nonzero = counts > 0
+        counts[nonzero] = 1.0 + np.log(counts[nonzero])
+        return counts
+
+    def add_document(self, features):
+        self.doc_freq[features] += 1
+        self.n_docs += 1
+
+    def remove_document(self, features):
+        self.doc_freq[features] -= 1
+        self.n_docs -= 1
+
+    def idf(self):
+        return (np.log((1.0 + self.n_docs) / (1.0 + self.doc_freq)) + 1.0).astype(np.float32)
+
+class VectorIndex:
+    """
+    Vector index with cosine similarity lookup.
+
+    Rows are stored sparse (the nonzero features of their term frequency
+    vector, in float16) and weighted by the current IDF when searched, so
+    memory grows with the text indexed rather than with the feature space.
+    Rows are grouped into scopes so one index can hold unrelated entries
+    (e.g. different request types) without them matching each other. A
+    scope is forgotten when its last row is removed. When the index reaches
+    `capacity`, the least recently used row is evicted.
+    """
+
+    def __init__(self, capacity=2000, vectorizer=None):
+        self.capacity = capacity
+        self.vectorizer = vectorizer or HashedTfidfVectorizer()
+        self._lock = threading.Lock()
+        self._feature_dtype = np.uint16 if self.vectorizer.n_features <= 1 << 16 else np.uint32
+        self._features = []
+        self._values = []
+        self._active = np.zeros(0, dtype=bool)
+        self._last_used = np.zeros(0, dtype=np.float64)
+        self._scope_ids = np.full(0, -1, dtype=np.int64)
+        self._payloads = []
+        self._scopes = {}
+        self._scope_rows = {}
+        self._next_scope_id = 0
+
+    def __len__(self):
+        return int(self._active.sum())
+
+    def _acquire_scope(self, scope):
+        scope_id = self._scopes.get(scope)
+        if scope_id is None:
+            scope_id = self._scopes[scope] = self._next_scope_id
+            self._next_scope_id += 1
+            self._scope_rows[scope_id] = [scope, 0]
+        self._scope_rows[scope_id][1] += 1
+        return scope_id
+
+    def _release_scope(self, scope_id):
+        entry = self._scope_rows[scope_id]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._scope_rows[scope_id]
+            del self._scopes[entry[0]]
+
+    def _free_slot(self):
+        free = np.flatnonzero(~self._active)
+        if len(free):
+            return int(free[0])
+
+        if len(self._active) < self.capacity:
+            old_size = len(self._active)
+            new_size = min(self.capacity, max(64, old_size * 2))
+            self._active = np.concatenate([self._active, np.zeros(new_size - old_size, dtype=bool)])
+            self._last_used = np.concatenate([self._last_used, np.zeros(new_size - old_size)])
+            self._scope_ids = np.concatenate([self._scope_ids, np.full(new_size - old_size, -1, dtype=np.int64)])
+            self._features.extend([None] * (new_size - old_size))
+            self._values.extend([None] * (new_size - old_size))
+            self._payloads.extend([None] * (new_size - old_size))
+            return old_size
+
+        # Full: evict the least recently used row
+        slot = int(np.argmin(self._last_used))
+        self._remove_slot(slot)
+        return slot
+
+    def _remove_slot(self, slot):
+        if self._active[slot]:
+            self.vectorizer.remove_document(self._features[slot])
+            self._active[slot] = False
+            self._features[slot] = self._values[slot] = None
+            self._payloads[slot] = None
+            self._release_scope(int(self._scope_ids[slot]))
+            self._scope_ids[slot] = -1
+            self._last_used[slot] = np.inf
+
+    def add(self, text, payload, scope=None):
+        """
+        Add a text to the index.
+
+        Args:
+            text: Text to vectorize
+            payload: Object returned by search() when this row matches
+            scope: Optional scope the row belongs to
+
+        Returns:
+            Slot number of the new row
+        """
+        tf = self.vectorizer.term_frequencies(text)
+        features = np.flatnonzero(tf).astype(self._feature_dtype)
+        with self._lock:
+            slot = self._free_slot()
+            self._features[slot] = features
+            self._values[slot] = tf[features].astype(np.float16)
+            self._active[slot] = True
+            self._last_used[slot] = time.monotonic()
+            self._scope_ids[slot] = self._acquire_scope(scope)
+            self._payloads[slot] = payload
+            self.vectorizer.add_document(features)
+            return slot
+
+    def remove(self, slot):
+        with self._lock:
+            self._remove_slot(slot)
+
+    def _scores(self, candidates, query, idf):
+        # Cosine similarity of the IDF-weighted candidate rows to a weighted, normalized query
+        lengths = [len(self._features[slot]) for slot in candidates]
+        features = np.concatenate([self._features[slot] for slot in candidates])
+        values = np.concatenate([self._values[slot] for slot in candidates]).astype(np.float32) * idf[features]
+        rows = np.repeat(np.arange(len(candidates)), lengths)
+        dots = np.bincount(rows, weights=values * query[features], minlength=len(candidates))
+        norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=len(candidates)))
+        norms[norms == 0] = 1.0
+        return dots / norms
+
+    def search(self, text, k=1, scope=None, exclude=None, touch=True):
+        """
+        Find the rows most similar to a text.
+
+        Args:
+            text: Query text
+            k: Maximum number of results
+            scope: Only consider rows in this scope
+            exclude: Optional iterable of slots to skip
+            touch: Mark returned rows as recently used
+
+        Returns:
+            List of (score, payload, slot) tuples, best match first
+        """
+        tf = self.vectorizer.term_frequencies(text)
+        with self._lock:
+            if scope not in self._scopes:
+                return []
+            mask = self._active & (self._scope_ids == self._scopes[scope])
+            if exclude:
+                mask[[s for s in exclude if s < len(mask)]] = False
+            candidates = np.flatnonzero(mask)
+            if not len(candidates):
+                return []
+
+            idf = self.vectorizer.idf()
+            query = tf * idf
+            norm = np.linalg.norm(query)
+            if norm == 0:
+                return []
+            scores = self._scores(candidates, query / norm, idf)
+
+            top = np.argsort(-scores)[:k]
+            results = []
+            now = time.monotonic()
+            for i in top:
+                slot = int(candidates[i])
+                if touch:
+                    self._last_used[slot] = now
+                results.append((float(scores[i]), self._payloads[slot], slot))
+            return results